@@ -0,0 +1,190 @@
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from functools import lru_cache
+from indexes import parse_message_time, tokenize, MIN_PREFIX
+from journal import write_snapshot
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+# Сколько дней сообщения хранятся в основной базе; 0 — архивирование выключено
+MESSAGE_RETENTION_DAYS = int(os.environ.get("MESSAGE_RETENTION_DAYS", 30))
+MANIFEST_FILE = "manifest.json"
+# Сколько распакованных сегментов держать в памяти
+SEGMENT_CACHE_SIZE = 16
+
+
+@lru_cache(maxsize=SEGMENT_CACHE_SIZE)
+def _read_segment(path):
+    # Сегменты неизменяемы, поэтому кэш по имени файла не устаревает
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return tuple(json.loads(line) for line in f if line.strip())
+
+
+def _matches(tokens, query_tokens):
+    """Каждое слово запроса есть в тексте целиком или (от MIN_PREFIX символов) как префикс"""
+    for token in query_tokens:
+        if token in tokens:
+            continue
+        if len(token) < MIN_PREFIX or not any(t.startswith(token) for t in tokens):
+            return False
+    return True
+
+
+class MessageArchive:
+    """Холодное хранилище старых сообщений.
+
+    Сообщения переносятся целыми днями в неизменяемые сегменты
+    messages-YYYY-MM-DD-<первый id>.jsonl.gz, у каждого сообщения сохраняется
+    его сквозной id. manifest.json описывает сегменты (день, диапазон id,
+    число сообщений и участники), так что запросы по датам, id и
+    пользователю открывают только нужные файлы.
+
+    Все методы чтения принимают end — число сообщений, которое база уже
+    считает архивными: сегменты, записанные до того, как основная база
+    отрезала эти сообщения, не дают дублей.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self._segments = []
+        self._mtime = None
+
+    @property
+    def segments(self):
+        """Сегменты по возрастанию id; манифест перечитывается, если его переписал другой процесс"""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return self._segments
+        if mtime != self._mtime:
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self._segments = sorted(json.load(f)["segments"], key=lambda s: s["first_id"])
+                self._mtime = mtime
+            except Exception as e:
+                logger.error(f"Ошибка чтения манифеста архива {self.manifest_path}: {e}")
+        return self._segments
+
+    def _path(self, segment):
+        return os.path.join(self.directory, segment["file"])
+
+    def read(self, segment):
+        return _read_segment(self._path(segment))
+
+    def write(self, messages, first_id):
+        """Запись сообщений (в порядке id, начиная с first_id) в сегменты по дням"""
+        os.makedirs(self.directory, exist_ok=True)
+        runs = []
+        day = "unknown"
+        for position, message in enumerate(messages):
+            # Сообщение без даты попадает в день предыдущего; сегмент — непрерывный диапазон id
+            moment = parse_message_time(message)
+            if moment:
+                day = moment.date().isoformat()
+            if not runs or runs[-1][0] != day:
+                runs.append((day, []))
+            runs[-1][1].append(dict(message, id=first_id + position))
+
+        written = {}
+        for day, items in runs:
+            name = f"messages-{day}-{items[0]['id']}.jsonl.gz"
+            tmp_name = os.path.join(self.directory, name + ".tmp")
+            with gzip.open(tmp_name, 'wt', encoding='utf-8') as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            os.replace(tmp_name, os.path.join(self.directory, name))
+            users = set()
+            for item in items:
+                users.update((str(item.get('from')), str(item.get('to'))))
+            written[items[0]["id"]] = {"file": name, "day": day, "first_id": items[0]["id"],
+                                       "last_id": items[-1]["id"], "count": len(items), "users": sorted(users)}
+
+        # Повторный перенос после сбоя дает те же first_id и перезаписывает записи манифеста
+        segments = {s["first_id"]: s for s in self.segments if s["first_id"] not in written}
+        segments.update(written)
+        write_snapshot(self.manifest_path, {"segments": sorted(segments.values(), key=lambda s: s["first_id"])},
+                       indent=None)
+        logger.info(f"В архив перенесено {len(messages)} сообщений ({len(written)} сегментов)")
+
+    @staticmethod
+    def _day_range(segment):
+        try:
+            start = datetime.fromisoformat(segment["day"])
+        except ValueError:
+            return None, None
+        return start, start + timedelta(days=1)
+
+    def _select(self, end, since=None, until=None, before=None, after=None, user_id=None):
+        """Сегменты, которые могут содержать подходящие сообщения, и признак полного попадания по датам"""
+        for segment in self.segments:
+            if segment["first_id"] >= end:
+                break
+            if before is not None and segment["first_id"] >= before:
+                continue
+            if after is not None and segment["last_id"] <= after:
+                continue
+            if user_id is not None and str(user_id) not in segment["users"]:
+                continue
+            start, stop = self._day_range(segment)
+            if start is None:
+                yield segment, since is None and until is None
+                continue
+            if (since is not None and stop <= since) or (until is not None and start >= until):
+                continue
+            yield segment, (since is None or start >= since) and (until is None or stop <= until)
+
+    def _in_range(self, message, since, until):
+        moment = parse_message_time(message)
+        if moment is None:
+            return since is None and until is None
+        return (since is None or moment >= since) and (until is None or moment < until)
+
+    def iter_messages(self, end, since=None, until=None, before=None, after=None, newest_first=True):
+        """Архивные сообщения с id < end в диапазоне дат и id, от новых к старым или наоборот"""
+        selected = list(self._select(end, since, until, before, after))
+        if newest_first:
+            selected.reverse()
+        for segment, whole in selected:
+            items = self.read(segment)
+            for message in (reversed(items) if newest_first else items):
+                if message["id"] >= end:
+                    continue
+                if before is not None and message["id"] >= before:
+                    continue
+                if after is not None and message["id"] <= after:
+                    continue
+                if whole or self._in_range(message, since, until):
+                    yield message
+
+    def count(self, end, since=None, until=None):
+        total = 0
+        for segment, whole in self._select(end, since, until):
+            if whole and segment["last_id"] < end:
+                total += segment["count"]
+            else:
+                total += sum(1 for message in self.read(segment)
+                             if message["id"] < end and self._in_range(message, since, until))
+        return total
+
+    def user_messages(self, end, user_id, before=None):
+        """Входящие и исходящие пользователя от новых к старым"""
+        uid = str(user_id)
+        for segment, _ in reversed(list(self._select(end, before=before, user_id=uid))):
+            for message in reversed(self.read(segment)):
+                if message["id"] >= end or (before is not None and message["id"] >= before):
+                    continue
+                if str(message.get('from')) == uid or str(message.get('to')) == uid:
+                    yield message
+
+    def search(self, end, query):
+        """Полный просмотр архива: сообщения, где есть все слова запроса, от новых к старым"""
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return []
+        return [message for message in self.iter_messages(end)
+                if _matches(set(tokenize(message.get('content') or '')), query_tokens)]
@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from bench_memory import synthetic_database, FIRST_USER_ID
+from journal import write_sections
+from tickets import new_ticket
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SIZES = (1000, 100000, 1000000)
+OWNER_ID = FIRST_USER_ID - 1
+SUPPORT_CHAT_ID = -1000000000001
+AGENTS = 5
+VIP_USERS = 20
+PERCENTILES = (50, 95, 99)
+
+
+def synthetic_support(users, seed=1):
+    """Содержимое support_db.json: метаданные всех users, обращение у каждого десятого, AGENTS агентов"""
+    rng = random.Random(seed)
+    ids = range(FIRST_USER_ID, FIRST_USER_ID + users)
+    agents = {str(OWNER_ID - 1 - i): {"num": i + 1, "replies": 0, "bans": 0} for i in range(AGENTS)}
+    tickets = {}
+    active_chats = {}
+    counts = {}
+    for ticket_id, uid in enumerate(ids[::10], start=1):
+        status = "open" if rng.random() < 0.3 else "closed"
+        if status == "open" and rng.random() < 0.5:
+            status = "taken"
+            active_chats[str(uid)] = {"agent_num": rng.randint(1, AGENTS)}
+        ticket = new_ticket(ticket_id, uid, ticket_id + 1, ticket_id + 1)
+        ticket["status"] = status
+        tickets[str(ticket_id)] = ticket
+        counts[str(uid)] = 1
+    return {
+        "tickets": tickets,
+        "ticket_seq": len(tickets),
+        "active_chats": active_chats,
+        "banned": [uid for uid in ids if rng.random() < 0.01],
+        "agents": agents,
+        "ban_reasons": {},
+        "user_metadata": {str(uid): {"username": f"user{uid}", "ticket_count": counts.get(str(uid), 0)}
+                          for uid in ids}
+    }
+
+
+def generate(directory, size):
+    """Синтетические bot_database.json и support_db.json на size пользователей и size сообщений"""
+    started = time.perf_counter()
+    write_sections(os.path.join(directory, "bot_database.json"), synthetic_database(size, size))
+    write_sections(os.path.join(directory, "support_db.json"), synthetic_support(size))
+    print(f"  данные: {time.perf_counter() - started:.1f} с")
+
+
+class Stub:
+    """Сообщение, запрос или Bot без сети: любой метод — корутина, которая возвращает сообщение-заглушку"""
+
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+        self.calls = 0
+
+    def __getattr__(self, name):
+        async def method(*args, **kwargs):
+            self.calls += 1
+            return SimpleNamespace(message_id=self.calls, message_thread_id=10 ** 9 + self.calls)
+        return method
+
+
+class StubJobQueue:
+    def run_once(self, callback, when):
+        return SimpleNamespace(schedule_removal=lambda: None)
+
+
+def fake_context(bot):
+    return SimpleNamespace(bot=bot, args=[], job_queue=StubJobQueue(), user_data={})
+
+
+def fake_update(user_id, text=None, data=None, chat_id=None, chat_type="private", thread_id=None):
+    user = SimpleNamespace(id=user_id, username=f"user{user_id}", full_name=f"Пользователь {user_id}",
+                           first_name="Пользователь")
+    message = Stub(text=text, id=1, message_id=1, message_thread_id=thread_id)
+    query = Stub(from_user=user, data=data, message=message) if data else None
+    chat = SimpleNamespace(id=user_id if chat_id is None else chat_id, type=chat_type)
+    return SimpleNamespace(effective_user=user, effective_chat=chat, message=message, callback_query=query)
+
+
+def rss_mb():
+    # ru_maxrss в Linux — килобайты, в macOS — байты
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def percentile(latencies, p):
+    return latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)]
+
+
+def measure(name, call, runs, setup=None):
+    """runs вызовов call(i) после одного прогревочного; setup(i) выполняется вне замера"""
+    latencies = []
+    for i in range(runs + 1):
+        if setup:
+            setup(i)
+        started = time.perf_counter()
+        call(i)
+        if i:
+            latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    columns = "  ".join(f"p{p} {percentile(latencies, p):8.2f}" for p in PERCENTILES)
+    print(f"  {name:<32} {columns}  max {latencies[-1]:8.2f} мс")
+
+
+def bench_bot(size, runs, rng):
+    import bot
+    loop = asyncio.new_event_loop()
+    ctx = fake_context(Stub(username="bench_bot"))
+    users = [rng.randrange(FIRST_USER_ID, FIRST_USER_ID + size) for _ in range(runs + 1)]
+    vip = users[:VIP_USERS]
+    for uid in vip:
+        bot.db.add_subscription(uid, "30d")
+
+    def dispatch(handler, update):
+        # Как в Application: refresh_db в группе -1 перед обработчиком
+        loop.run_until_complete(bot.refresh_db(update, ctx))
+        loop.run_until_complete(handler(update, ctx))
+
+    measure("bot: /start", lambda i: dispatch(bot.start, fake_update(users[i])), runs)
+    measure("bot: handle_message", lambda i: dispatch(bot.handle_message, fake_update(users[i], text="привет")), runs,
+            setup=lambda i: bot.db.set_user_state(users[i], {"state": "waiting_anon",
+                                                             "target_id": vip[i % len(vip)]}))
+    measure("bot: callback sub_menu",
+            lambda i: dispatch(bot.callback, fake_update(vip[i % len(vip)], data="sub_menu")), runs)
+    measure("bot: callback reveal_",
+            lambda i: dispatch(bot.callback, fake_update(vip[i % len(vip)], data=f"reveal_{users[i]}")), runs)
+    past = (datetime.now() - timedelta(minutes=1)).isoformat()
+    measure("bot: expiry_task", lambda i: loop.run_until_complete(bot.expiry_task(ctx)), runs,
+            setup=lambda i: bot.db.ban_user(users[i], until=past))
+    loop.close()
+
+
+def bench_support(size, runs, rng):
+    import support
+    loop = asyncio.new_event_loop()
+    ctx = fake_context(Stub())
+    tickets = support.db.data["tickets"]
+    without_ticket = [uid for uid in (rng.randrange(FIRST_USER_ID, FIRST_USER_ID + size) for _ in range(runs * 4))
+                      if support.db.current_ticket(uid) is None][:runs + 1]
+    threads = [ticket["thread_id"] for ticket in list(tickets.values())[-runs - 1:]]
+    targets = [ticket["user_id"] for ticket in list(tickets.values())[:runs + 1]]
+    agent = int(next(iter(support.db.data["agents"])))
+
+    def dispatch(handler, update):
+        loop.run_until_complete(handler(update, ctx))
+
+    measure("support: handle_msg new ticket",
+            lambda i: dispatch(support.handle_msg, fake_update(without_ticket[i % len(without_ticket)],
+                                                               text="помогите")), runs)
+    measure("support: handle_msg agent reply",
+            lambda i: dispatch(support.handle_msg, fake_update(agent, text="ответ", chat_id=SUPPORT_CHAT_ID,
+                                                               chat_type="supergroup",
+                                                               thread_id=threads[i % len(threads)])), runs)
+    measure("support: button take_",
+            lambda i: dispatch(support.button_handler, fake_update(agent, data=f"take_{targets[i % len(targets)]}")),
+            runs)
+    measure("support: button close_",
+            lambda i: dispatch(support.button_handler, fake_update(agent, data=f"close_{targets[i % len(targets)]}")),
+            runs)
+    measure("support: adm_users_list",
+            lambda i: dispatch(support.button_handler, fake_update(OWNER_ID, data="adm_users_list")), runs)
+    measure("support: adm_users_page_",
+            lambda i: dispatch(support.button_handler,
+                               fake_update(OWNER_ID, data=f"adm_users_page_{rng.randrange(support.users_page_count())}")),
+            runs)
+    loop.close()
+
+
+def bench_admin(size, runs, rng):
+    import admin_panel
+    app = admin_panel.app
+    app.config['TESTING'] = True
+    if not os.path.isdir(os.path.join(BENCH_DIR, "templates")):
+        app.template_folder = BENCH_DIR
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_id'] = OWNER_ID
+        session['is_owner'] = True
+        session['admin_name'] = "Bench"
+    users = [rng.randrange(FIRST_USER_ID, FIRST_USER_ID + size) for _ in range(runs + 1)]
+
+    def get(url, **kwargs):
+        response = client.get(url, **kwargs)
+        assert response.status_code in (200, 304), (url, response.status_code)
+
+    measure("admin: GET /", lambda i: get("/"), runs)
+    measure("admin: GET /users", lambda i: get("/users"), runs)
+    measure("admin: GET /messages", lambda i: get("/messages"), runs)
+    measure("admin: GET /messages?filter=week", lambda i: get("/messages?filter=week"), runs)
+    measure("admin: GET /search", lambda i: get("/search", query_string={"query": "привет вопрос"}), runs)
+    measure("admin: GET /search type=users", lambda i: get("/search", query_string={"query": f"user{users[i]}",
+                                                                                    "type": "users"}), runs)
+    measure("admin: GET /user/<id>", lambda i: get(f"/user/{users[i]}"), runs)
+    measure("admin: GET /api/stats", lambda i: get("/api/stats"), runs)
+
+
+def run(size, runs, seed):
+    """Замеры в текущем каталоге с уже сгенерированными данными (отдельный процесс на каждый размер)"""
+    os.environ.update({"OWNER_ID": str(OWNER_ID), "SUPPORT_CHAT_ID": str(SUPPORT_CHAT_ID), "BOT_TOKEN": "",
+                       "SUPPORT_BOT_TOKEN": "", "DB_BACKEND": "json"})
+    logging.disable(logging.WARNING)
+    rng = random.Random(seed)
+    for name, bench in (("bot", bench_bot), ("support", bench_support), ("admin_panel", bench_admin)):
+        started = time.perf_counter()
+        __import__(name)
+        print(f"  загрузка {name}: {time.perf_counter() - started:.2f} с, пик RSS {rss_mb():.0f} МБ")
+        bench(size, runs, rng)
+    print(f"  пик RSS: {rss_mb():.0f} МБ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержки обработчиков бота, поддержки и маршрутов админки")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="число пользователей и сообщений")
+    parser.add_argument("--runs", type=int, default=50, help="замеров на сценарий")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="не удалять каталоги с данными")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--generate", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate:
+        return generate(os.getcwd(), args.generate)
+    if args.run:
+        return run(args.run, args.runs, args.seed)
+
+    script = os.path.abspath(__file__)
+    for size in args.sizes:
+        directory = tempfile.mkdtemp(prefix=f"bench-{size}-")
+        print(f"{size} пользователей и сообщений ({directory})")
+        try:
+            # Генерация и замеры в разных процессах: память генератора не попадает в RSS
+            subprocess.run([sys.executable, script, "--generate", str(size)], cwd=directory, check=True)
+            subprocess.run([sys.executable, script, "--run", str(size), "--runs", str(args.runs),
+                            "--seed", str(args.seed)], cwd=directory, check=True)
+        finally:
+            if not args.keep:
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
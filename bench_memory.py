@@ -0,0 +1,133 @@
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from records import MessageColumns, BanHistory, ActionHistory
+
+# Первый id синтетических пользователей (как у реальных аккаунтов Telegram)
+FIRST_USER_ID = 100000000
+WORDS = ("привет", "как", "дела", "спасибо", "вопрос", "ответ", "сегодня", "завтра", "анонимно", "бот",
+         "hello", "thanks", "ok", "да", "нет", "может", "почему", "где", "когда", "люблю")
+SHORT_CONTENTS = ("[Медиа]", "Привет!", "Спасибо", "ok", "Кто ты?", "😂", "Ответь пожалуйста")
+REASONS = ("спам", "оскорбления", "не указана", "реклама")
+ACTION_TYPES = ("ban", "unban", "vip_add", "vip_remove", "protect_add", "protect_remove")
+
+
+def _user_ids(users):
+    return range(FIRST_USER_ID, FIRST_USER_ID + users)
+
+
+def synthetic_content(rng):
+    if rng.random() < 0.4:
+        return rng.choice(SHORT_CONTENTS)
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25)))
+
+
+def synthetic_users(count, start=None, seed=1):
+    """Пользователи в формате Database.register_user, зарегистрированные по порядку с start"""
+    rng = random.Random(seed)
+    start = start or datetime.now() - timedelta(days=365)
+    step = timedelta(days=365) / max(count, 1)
+    return {str(uid): {"user_id": uid, "username": f"user{uid}" if rng.random() < 0.7 else None,
+                       "full_name": f"Пользователь {i}", "first_seen": (start + step * i).isoformat(),
+                       "messages_sent": 0, "messages_received": 0}
+            for i, uid in enumerate(_user_ids(count))}
+
+
+def synthetic_messages(count, users=1000, start=None, seed=1):
+    """count сообщений между users пользователями, по возрастанию времени до текущего момента"""
+    rng = random.Random(seed)
+    ids = _user_ids(users)
+    start = start or datetime.now() - timedelta(days=90)
+    step = (datetime.now() - start) / max(count, 1)
+    for i in range(count):
+        yield {"from": rng.choice(ids), "to": rng.choice(ids),
+               "date": (start + step * i).replace(microsecond=rng.randint(1, 999999)).isoformat(),
+               "content": synthetic_content(rng)}
+
+
+def synthetic_bans(count, users=1000, seed=1):
+    rng = random.Random(seed)
+    ids = _user_ids(users)
+    for i in range(count):
+        banned_at = datetime.now() - timedelta(minutes=count - i)
+        yield {"user_id": rng.choice(ids), "reason": rng.choice(REASONS), "admin_id": FIRST_USER_ID - 1,
+               "banned_at": banned_at.isoformat(), "until": None, "active": False,
+               "unbanned_at": (banned_at + timedelta(hours=1)).isoformat(), "unbanned_by": FIRST_USER_ID - 1}
+
+
+def synthetic_actions(count, users=1000, seed=1):
+    rng = random.Random(seed)
+    ids = _user_ids(users)
+    for i in range(count):
+        yield {"user_id": rng.choice(ids), "action_type": rng.choice(ACTION_TYPES),
+               "details": {"reason": rng.choice(REASONS), "admin_id": FIRST_USER_ID - 1},
+               "timestamp": (datetime.now() - timedelta(minutes=count - i)).isoformat()}
+
+
+def synthetic_database(users, messages, seed=1):
+    """Содержимое bot_database.json: users пользователей, messages сообщений, история банов и действий"""
+    history = max(users // 100, 1)
+    return {
+        "users": synthetic_users(users, seed=seed),
+        "user_states": {},
+        "messages": list(synthetic_messages(messages, users, seed=seed)),
+        "banned": [],
+        "subscriptions": {},
+        "protected_users": [],
+        "admins": [],
+        "admin_passwords": {},
+        "ban_history": list(synthetic_bans(history, users, seed=seed)),
+        "action_history": list(synthetic_actions(history * 2, users, seed=seed)),
+        "ban_reasons": {},
+        "statistics": {"total_messages": messages, "total_users": users}
+    }
+
+
+def measure(build):
+    """Память, которую занимает результат build() (без временных объектов), и время построения"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, elapsed
+
+
+def compare(name, text, record_type):
+    """Байты на запись: список словарей после json.loads против компактного типа"""
+    plain, plain_size, plain_time = measure(lambda: json.loads(text))
+    count = len(plain)
+    del plain
+    compact, compact_size, compact_time = measure(lambda: record_type(json.loads(text)))
+    assert len(compact) == count
+    del compact
+    print(f"{name:<16} {count:>9} записей  словари: {plain_size / count:7.1f} Б/запись ({plain_time:5.2f} с)  "
+          f"{record_type.__name__}: {compact_size / count:7.1f} Б/запись ({compact_time:5.2f} с)  "
+          f"экономия {1 - compact_size / plain_size:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память на сообщение и запись истории: словари против records.py")
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--history", type=int, default=100000)
+    args = parser.parse_args()
+
+    # Данные проходят через JSON, как при загрузке базы: строки не разделяются между записями
+    compare("messages", json.dumps(list(synthetic_messages(args.messages, args.users)), ensure_ascii=False),
+            MessageColumns)
+    compare("ban_history", json.dumps(list(synthetic_bans(args.history, args.users)), ensure_ascii=False),
+            BanHistory)
+    compare("action_history", json.dumps(list(synthetic_actions(args.history, args.users)), ensure_ascii=False),
+            ActionHistory)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,59 +1,111 @@
-# bot_integration.py
-import asyncio
-import logging
-from telegram import Bot
-from telegram.error import TelegramError
-import os
-
-logger = logging.getLogger(__name__)
-
-
-class TelegramSender:
-    def __init__(self, token=None):
-        self.token = token or os.environ.get('BOT_TOKEN')
-        self.bot = None
-        if self.token:
-            try:
-                self.bot = Bot(token=self.token)
-                logger.info("Telegram бот инициализирован для рассылки")
-            except Exception as e:
-                logger.error(f"Ошибка инициализации Telegram бота: {e}")
-
-    async def send_message_async(self, chat_id, text):
-        """Асинхронная отправка сообщения"""
-        if not self.bot:
-            return False
-
-        try:
-            await self.bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                parse_mode='HTML'
-            )
-            return True
-        except TelegramError as e:
-            logger.error(f"Ошибка отправки пользователю {chat_id}: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка отправки пользователю {chat_id}: {e}")
-            return False
-
-    def send_message_sync(self, chat_id, text):
-        """Синхронная обертка для асинхронной отправки"""
-        if not self.bot:
-            return False
-
-        try:
-            # Создаем новое событийное луп для каждого вызова
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(self.send_message_async(chat_id, text))
-            loop.close()
-            return result
-        except Exception as e:
-            logger.error(f"Ошибка в синхронной обертке: {e}")
-            return False
-
-
-# Глобальный экземпляр для использования в admin_panel.py
-telegram_sender = TelegramSender()
\ No newline at end of file
+import asyncio
+import logging
+import threading
+from telegram import Bot
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
+from metrics import TELEGRAM_SECONDS, TELEGRAM_ERRORS
+import os
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать отправки в синхронной обертке, секунды
+SEND_TIMEOUT = 30
+
+
+class TimedRequest(HTTPXRequest):
+    """HTTPXRequest, который замеряет каждый вызов Bot API (метрики telegram_api_*)"""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        with TELEGRAM_SECONDS.time(method=api_method):
+            try:
+                code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            except Exception as e:
+                TELEGRAM_ERRORS.inc(method=api_method, error=type(e).__name__)
+                raise
+        # Ответы 4xx/5xx (флуд-контроль, заблокированный бот) превращаются в исключения выше по стеку
+        if code >= 400:
+            TELEGRAM_ERRORS.inc(method=api_method, error=str(code))
+        return code, payload
+
+
+class TelegramSender:
+    """Отправка сообщений из синхронного кода (Flask).
+
+    Владеет одним событийным циклом в фоновом потоке и одним Bot, поэтому
+    HTTP-соединения с Telegram переиспользуются между вызовами. submit()
+    потокобезопасен и сразу возвращает concurrent.futures.Future.
+    """
+
+    def __init__(self, token=None):
+        self.token = token or os.environ.get('BOT_TOKEN')
+        self.bot = None
+        self._loop = None
+        self._ready = None
+        self._lock = threading.Lock()
+        if self.token:
+            try:
+                self.bot = Bot(token=self.token, request=TimedRequest())
+                logger.info("Telegram бот инициализирован для рассылки")
+            except Exception as e:
+                logger.error(f"Ошибка инициализации Telegram бота: {e}")
+
+    @property
+    def loop(self):
+        """Фоновый цикл отправки, запускается при первом обращении"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="telegram-sender", daemon=True).start()
+            return self._loop
+
+    def run(self, coro):
+        """Запуск корутины в цикле отправки; возвращает concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def get_bot(self):
+        """Bot с открытым пулом соединений (только внутри цикла отправки)"""
+        if self._ready is None or (self._ready.done() and self._ready.exception()):
+            self._ready = asyncio.ensure_future(self.bot.initialize())
+        await self._ready
+        return self.bot
+
+    async def send_message_async(self, chat_id, text):
+        """Асинхронная отправка сообщения"""
+        if not self.bot:
+            return False
+
+        try:
+            bot = await self.get_bot()
+            await bot.send_message(
+                chat_id=chat_id,
+                text=text,
+                parse_mode='HTML'
+            )
+            return True
+        except TelegramError as e:
+            logger.error(f"Ошибка отправки пользователю {chat_id}: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка отправки пользователю {chat_id}: {e}")
+            return False
+
+    def submit(self, chat_id, text):
+        """Постановка отправки в фоновый цикл без ожидания результата"""
+        return self.run(self.send_message_async(chat_id, text))
+
+    def send_message_sync(self, chat_id, text):
+        """Синхронная отправка: ждет результата submit()"""
+        if not self.bot:
+            return False
+
+        try:
+            return self.submit(chat_id, text).result(SEND_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Ошибка в синхронной обертке: {e}")
+            return False
+
+
+# Глобальный экземпляр для использования в admin_panel.py
+telegram_sender = TelegramSender()
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from telegram.error import RetryAfter, Forbidden, BadRequest, TelegramError
+from journal import write_snapshot
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_STATE_FILE = os.environ.get("BROADCAST_STATE_FILE", "broadcast_state.json")
+# Telegram пропускает около 30 сообщений в секунду от бота, оставляем запас для самого бота
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", 25))
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", 20))
+BROADCAST_RETRIES = 3
+# Как часто прогресс сохраняется на диск, секунды
+CHECKPOINT_INTERVAL = 2
+# Ключи состояния, которые меняются во время рассылки (пишутся в отдельный небольшой файл)
+PROGRESS_KEYS = ("id", "watermark", "done", "sent", "failed", "finished_at")
+
+BROADCAST_MESSAGES = counter("broadcast_messages_total", "Обработанные получатели рассылки", ("result",))
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, запас не больше capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Остановка выдачи токенов: 429 от Telegram действует на весь бот"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.updated = self.paused_until
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + max(now - self.updated, 0) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _retry_delay(error):
+    delay = error.retry_after
+    if isinstance(delay, timedelta):
+        delay = delay.total_seconds()
+    return float(delay)
+
+
+class BroadcastEngine:
+    """Рассылка в фоновом цикле TelegramSender через его Bot и пул соединений.
+
+    Сообщения отправляют BROADCAST_CONCURRENCY задач через общий TokenBucket.
+    Каждый чат получает одно сообщение, а повтор после ошибки идет не раньше
+    чем через секунду, поэтому лимит Telegram на один чат не превышается.
+    Прогресс (граница, до которой все отправлено, и отправленные позиции
+    за ней) сохраняется в BROADCAST_STATE_FILE, так что после перезапуска
+    рассылка продолжается, а не начинается заново. Список получателей
+    пишется один раз при запуске, контрольные точки пишут только прогресс.
+    """
+
+    def __init__(self, sender, state_file=BROADCAST_STATE_FILE,
+                 rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY):
+        self.sender = sender
+        self.state_file = state_file
+        self.progress_file = os.path.splitext(state_file)[0] + ".progress.json"
+        self.rate = rate
+        self.concurrency = concurrency
+        self.state = self._load_state()
+        self._future = None
+        self._lock = threading.Lock()
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if os.path.exists(self.progress_file):
+                    with open(self.progress_file, 'r', encoding='utf-8') as f:
+                        progress = json.load(f)
+                    # Прогресс предыдущей рассылки не относится к текущей
+                    if progress.get("id") == state["id"]:
+                        state.update(progress)
+                state["done"] = set(state["done"])
+                return state
+            except Exception as e:
+                logger.error(f"Ошибка чтения состояния рассылки {self.state_file}: {e}")
+        return None
+
+    def _save_state(self):
+        write_snapshot(self.state_file, dict(self.state, done=sorted(self.state["done"])), indent=None)
+
+    def _progress(self):
+        """Копия прогресса для записи: done — позиции за watermark, их не больше числа воркеров"""
+        return dict({key: self.state[key] for key in PROGRESS_KEYS}, done=sorted(self.state["done"]))
+
+    def _save_progress(self, progress):
+        try:
+            write_snapshot(self.progress_file, progress, indent=None)
+        except OSError as e:
+            logger.error(f"Ошибка сохранения прогресса рассылки {self.progress_file}: {e}")
+
+    def is_running(self):
+        return self._future is not None and not self._future.done()
+
+    def start(self, text, recipients):
+        """Запуск новой рассылки; False, если предыдущая еще идет или нет токена"""
+        with self._lock:
+            if self.is_running() or not self.sender.bot:
+                return False
+            self.state = {
+                "id": uuid.uuid4().hex,
+                "text": text,
+                "recipients": list(recipients),
+                "watermark": 0,
+                "done": set(),
+                "sent": 0,
+                "failed": 0,
+                "started_at": datetime.now().isoformat(),
+                "finished_at": None
+            }
+            self._save_state()
+            self._future = self.sender.run(self._run())
+            return True
+
+    def resume(self):
+        """Продолжение незавершенной рассылки после перезапуска"""
+        with self._lock:
+            if self.is_running() or not self.sender.bot or not self.state or self.state["finished_at"]:
+                return False
+            logger.info(f"Продолжение рассылки {self.state['id']} с позиции {self.state['watermark']}")
+            self._future = self.sender.run(self._run())
+            return True
+
+    def remaining(self):
+        """Сколько получателей осталось в текущей рассылке"""
+        status = self.status()
+        return status["total"] - status["processed"] if status and status["running"] else 0
+
+    def status(self):
+        if not self.state:
+            return None
+        state = self.state
+        return {
+            "total": len(state["recipients"]),
+            "processed": state["watermark"] + len(state["done"]),
+            "sent": state["sent"],
+            "failed": state["failed"],
+            "started_at": state["started_at"],
+            "finished_at": state["finished_at"],
+            "running": self.is_running()
+        }
+
+    async def _send(self, bot, bucket, chat_id, text):
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+                return True
+            except RetryAfter as e:
+                delay = _retry_delay(e)
+                logger.warning(f"Рассылка: флуд-контроль Telegram, пауза {delay} с")
+                bucket.pause(delay)
+            except (Forbidden, BadRequest) as e:
+                logger.info(f"Рассылка: пользователь {chat_id} недоступен: {e}")
+                return False
+            except TelegramError as e:
+                attempt += 1
+                if attempt > BROADCAST_RETRIES:
+                    logger.error(f"Рассылка: ошибка отправки пользователю {chat_id}: {e}")
+                    return False
+                await asyncio.sleep(2 ** attempt / 2)
+
+    async def _run(self):
+        state = self.state
+        recipients = state["recipients"]
+        done = state["done"]
+        queue = asyncio.Queue()
+        for position in range(state["watermark"], len(recipients)):
+            if position not in done:
+                queue.put_nowait(position)
+
+        bot = await self.sender.get_bot()
+        bucket = TokenBucket(self.rate)
+        loop = asyncio.get_running_loop()
+        last_checkpoint = time.monotonic()
+        checkpoint = None
+
+        async def worker():
+            nonlocal last_checkpoint, checkpoint
+            while True:
+                position = await queue.get()
+                try:
+                    if await self._send(bot, bucket, recipients[position], state["text"]):
+                        state["sent"] += 1
+                        BROADCAST_MESSAGES.inc(result="sent")
+                    else:
+                        state["failed"] += 1
+                        BROADCAST_MESSAGES.inc(result="failed")
+                except Exception as e:
+                    logger.error(f"Рассылка: неожиданная ошибка для {recipients[position]}: {e}")
+                    state["failed"] += 1
+                    BROADCAST_MESSAGES.inc(result="failed")
+                finally:
+                    done.add(position)
+                    while state["watermark"] in done:
+                        done.discard(state["watermark"])
+                        state["watermark"] += 1
+                    # Запись с fsync идет в потоке, не останавливая цикл событий; одновременно — одна
+                    if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL and \
+                            (checkpoint is None or checkpoint.done()):
+                        last_checkpoint = time.monotonic()
+                        checkpoint = loop.run_in_executor(None, self._save_progress, self._progress())
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await queue.join()
+            state["finished_at"] = datetime.now().isoformat()
+            logger.info(f"Рассылка завершена. Отправлено {state['sent']} из {len(recipients)} пользователей")
+        finally:
+            for task in workers:
+                task.cancel()
+            if checkpoint is not None:
+                await asyncio.wait([checkpoint])
+            self._save_progress(self._progress())
+        return state["sent"]
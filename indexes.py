@@ -0,0 +1,485 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime
+from heapq import merge
+from records import Message
+
+
+class StoreIndex:
+    """Производная структура в памяти, которая строится при загрузке базы
+    и обновляется по каждой применённой записи журнала (своей или чужой)."""
+
+    def rebuild(self, data):
+        raise NotImplementedError
+
+    def apply(self, record, data):
+        raise NotImplementedError
+
+
+def _descending(positions, before=None):
+    end = len(positions) if before is None else bisect_left(positions, before)
+    for i in range(end - 1, -1, -1):
+        yield positions[i]
+
+
+class MessageIndex(StoreIndex):
+    """Позиции входящих и исходящих сообщений пользователя в data["messages"].
+
+    Индекс строится при первом запросе, а не при загрузке: секция messages
+    снимка читается лениво, и бот не ждет ее разбора перед стартом.
+    """
+
+    def __init__(self):
+        self.inbox = defaultdict(list)
+        self.outbox = defaultdict(list)
+        self._pending = None
+
+    def rebuild(self, data):
+        self._pending = data
+
+    def _ensure(self):
+        if self._pending is None:
+            return
+        data, self._pending = self._pending, None
+        self.inbox = defaultdict(list)
+        self.outbox = defaultdict(list)
+        for position, message in enumerate(data["messages"]):
+            self._add(position, message)
+
+    def apply(self, record, data):
+        # Пока индекс не построен, новые записи войдут в него при построении
+        if record["path"][0] != "messages" or self._pending is not None:
+            return
+        if record["op"] == "append" and len(record["path"]) == 1:
+            self._add(len(data["messages"]) - 1, record["value"])
+        else:
+            self.rebuild(data)
+
+    def _add(self, position, message):
+        self.outbox[str(message.get('from'))].append(position)
+        self.inbox[str(message.get('to'))].append(position)
+
+    def received(self, messages, user_id, limit=None):
+        """Входящие пользователя в хронологическом порядке (последние limit)"""
+        self._ensure()
+        positions = self.inbox.get(str(user_id), [])
+        if limit is not None:
+            positions = positions[-limit:]
+        return [messages[p] for p in positions]
+
+    def user_positions(self, user_id, before=None):
+        """Позиции входящих и исходящих пользователя от новых к старым (меньше before)"""
+        self._ensure()
+        uid = str(user_id)
+        lists = [self.outbox.get(uid, []), self.inbox.get(uid, [])]
+        last = None
+        for position in merge(*(_descending(lst, before) for lst in lists), reverse=True):
+            if position == last:
+                # Сообщение самому себе есть в обоих списках
+                continue
+            last = position
+            yield position
+
+    def user_messages(self, messages, user_id, limit=None, before=None):
+        """Входящие и исходящие пользователя от новых к старым; возвращает (сообщения с id, курсор before)"""
+        result = []
+        for position in self.user_positions(user_id, before):
+            if limit is not None and len(result) >= limit:
+                return result, result[-1]["id"]
+            result.append(dict(messages[position], id=position))
+        return result, None
+
+
+def parse_message_time(message):
+    """Время сообщения как локальный naive datetime или None"""
+    if isinstance(message, Message):
+        return message.moment
+    try:
+        moment = datetime.fromisoformat(message['date'].replace('Z', '+00:00'))
+    except (KeyError, AttributeError, TypeError, ValueError):
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+class MessageTimeIndex(StoreIndex):
+    """Отсортированные epoch-метки сообщений, параллельные data["messages"].
+
+    Сообщения дописываются в порядке времени, поэтому список остается
+    отсортированным и фильтр по датам — это два bisect. Сообщение без даты
+    или с датой раньше предыдущего получает метку предыдущего сообщения.
+    """
+
+    def __init__(self):
+        self.times = []
+
+    def rebuild(self, data):
+        self.times = []
+        for message in data["messages"]:
+            self._add(message)
+
+    def apply(self, record, data):
+        if record["path"][0] != "messages":
+            return
+        if record["op"] == "append" and len(record["path"]) == 1:
+            self._add(record["value"])
+        else:
+            self.rebuild(data)
+
+    def _add(self, message):
+        moment = parse_message_time(message)
+        previous = self.times[-1] if self.times else 0.0
+        self.times.append(max(moment.timestamp(), previous) if moment else previous)
+
+    def bounds(self, since=None, until=None):
+        """Диапазон позиций [floor, ceil) сообщений с since <= дата < until"""
+        floor = 0 if since is None else bisect_left(self.times, since.timestamp())
+        ceil = len(self.times) if until is None else bisect_left(self.times, until.timestamp())
+        return floor, max(ceil, floor)
+
+
+class UserOrderIndex(StoreIndex):
+    """Порядок регистрации пользователей секции key: список uid и позиция каждого в нем"""
+
+    def __init__(self, key="users"):
+        self.key = key
+        self.order = []
+        self.positions = {}
+
+    def rebuild(self, data):
+        self.order = list(data[self.key])
+        self.positions = {uid: position for position, uid in enumerate(self.order)}
+
+    def apply(self, record, data):
+        path = record["path"]
+        if path[0] != self.key or len(path) > 2:
+            return
+        if len(path) == 2 and record["op"] == "set":
+            if path[1] not in self.positions:
+                self.positions[path[1]] = len(self.order)
+                self.order.append(path[1])
+        else:
+            self.rebuild(data)
+
+    def page(self, users, before=None, after=None, limit=50):
+        """Пользователи в порядке регистрации; возвращает (пары uid/пользователь, курсор before, курсор after)"""
+        total = len(self.order)
+        if before is not None:
+            high = self.positions.get(str(before), total)
+            low = max(high - limit, 0)
+        else:
+            low = self.positions[str(after)] + 1 if str(after) in self.positions else 0
+            high = min(low + limit, total)
+        items = [(uid, users[uid]) for uid in self.order[low:high]]
+        before_cursor = self.order[low] if items and low > 0 else None
+        after_cursor = self.order[high - 1] if items and high < total else None
+        return items, before_cursor, after_cursor
+
+
+class PageCache(StoreIndex):
+    """Отрисованные страницы списка; сбрасывается при любом изменении секций keys"""
+
+    def __init__(self, keys):
+        self.keys = set(keys)
+        self.pages = {}
+
+    def rebuild(self, data):
+        self.pages = {}
+
+    def apply(self, record, data):
+        if record["path"][0] in self.keys:
+            self.pages = {}
+
+    def get(self, page, render):
+        if page not in self.pages:
+            self.pages[page] = render(page)
+        return self.pages[page]
+
+
+class MembershipIndex(StoreIndex):
+    """Множества-зеркала списков banned, protected_users и admins"""
+
+    keys = ("banned", "protected_users", "admins")
+
+    def __init__(self):
+        self.sets = {key: set() for key in self.keys}
+
+    def rebuild(self, data):
+        self.sets = {key: set(data.get(key, [])) for key in self.keys}
+
+    def apply(self, record, data):
+        key = record["path"][0]
+        if key not in self.sets:
+            return
+        if record["op"] == "append" and len(record["path"]) == 1:
+            self.sets[key].add(record["value"])
+        elif record["op"] == "remove" and len(record["path"]) == 1:
+            # Процессы могут одновременно добавить один id дважды
+            if record["value"] not in data[key]:
+                self.sets[key].discard(record["value"])
+        else:
+            self.sets[key] = set(data.get(key, []))
+
+    def contains(self, key, user_id):
+        try:
+            return int(user_id) in self.sets[key]
+        except (TypeError, ValueError):
+            return False
+
+
+def parse_deadline(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ExpiryQueue:
+    """Min-куча сроков истечения с ленивым удалением устаревших элементов"""
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+
+    def push(self, key, deadline):
+        self.deadlines[key] = deadline
+        heapq.heappush(self.heap, (deadline, key))
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [(d, k) for k, d in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+    def discard(self, key):
+        self.deadlines.pop(key, None)
+
+    def peek(self):
+        """Ближайший срок или None"""
+        while self.heap:
+            deadline, key = self.heap[0]
+            if self.deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_due(self, now):
+        """Извлечение всех ключей со сроком не позже now"""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, key = heapq.heappop(self.heap)
+            if self.deadlines.get(key) == deadline:
+                del self.deadlines[key]
+                due.append(key)
+        return due
+
+
+class ExpiryIndex(StoreIndex):
+    """Сроки окончания подписок (ключ — user_id) и временных банов
+    (ключ — позиция записи в ban_history)"""
+
+    def __init__(self):
+        self.subscriptions = ExpiryQueue()
+        self.bans = ExpiryQueue()
+
+    def rebuild(self, data):
+        self.subscriptions = ExpiryQueue()
+        self.bans = ExpiryQueue()
+        for uid, until in data["subscriptions"].items():
+            self._set_subscription(uid, until)
+        for position, ban in enumerate(data["ban_history"]):
+            self._set_ban(position, ban)
+
+    def apply(self, record, data):
+        path = record["path"]
+        if path[0] == "subscriptions" and len(path) == 2:
+            if record["op"] == "set":
+                self._set_subscription(path[1], record["value"])
+            elif record["op"] == "del":
+                self.subscriptions.discard(path[1])
+        elif path[0] == "ban_history" and record["op"] == "append" and len(path) == 1:
+            self._set_ban(len(data["ban_history"]) - 1, record["value"])
+        elif path[0] == "ban_history" and record["op"] == "set" and len(path) == 2:
+            self._set_ban(path[1], record["value"])
+        elif path[0] in ("subscriptions", "ban_history"):
+            self.rebuild(data)
+
+    def _set_subscription(self, uid, until):
+        deadline = parse_deadline(until)
+        if deadline:
+            self.subscriptions.push(uid, deadline)
+        else:
+            self.subscriptions.discard(uid)
+
+    def _set_ban(self, position, ban):
+        deadline = parse_deadline(ban.get("until")) if ban.get("active") else None
+        if deadline:
+            self.bans.push(position, deadline)
+        else:
+            self.bans.discard(position)
+
+    def next_deadline(self):
+        deadlines = [d for d in (self.subscriptions.peek(), self.bans.peek()) if d]
+        return min(deadlines) if deadlines else None
+
+
+TOKEN_RE = re.compile(r"\w+")
+# Более короткие слова запроса ищутся только целиком
+MIN_PREFIX = 2
+
+
+def normalize_text(text):
+    """Нижний регистр с заменой ё на е"""
+    return str(text).lower().replace('ё', 'е')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize_text(text))
+
+
+class TextIndex:
+    """Инвертированный индекс: токен → множество документов.
+
+    Отсортированный словарь токенов позволяет искать по префиксу.
+    Если документы могут меняться, нужен removable=True — тогда
+    индекс помнит токены каждого документа.
+    """
+
+    def __init__(self, removable=False):
+        self.postings = {}
+        self.terms = []
+        self.documents = {} if removable else None
+
+    def _add(self, doc, text):
+        tokens = set(tokenize(text))
+        if self.documents is not None:
+            self.documents[doc] = tokens
+        new_terms = []
+        for token in tokens:
+            docs = self.postings.get(token)
+            if docs is None:
+                docs = self.postings[token] = set()
+                new_terms.append(token)
+            docs.add(doc)
+        return new_terms
+
+    def build(self, documents):
+        """Массовое построение по парам (документ, текст)"""
+        for doc, text in documents:
+            self._add(doc, text)
+        self.terms = sorted(self.postings)
+
+    def add(self, doc, text):
+        for token in self._add(doc, text):
+            insort(self.terms, token)
+
+    def remove(self, doc):
+        for token in self.documents.pop(doc, ()):
+            docs = self.postings[token]
+            docs.discard(doc)
+            if not docs:
+                del self.postings[token]
+                self.terms.pop(bisect_left(self.terms, token))
+
+    def _expand(self, token):
+        if len(token) < MIN_PREFIX:
+            return [token] if token in self.postings else []
+        terms = []
+        i = bisect_left(self.terms, token)
+        while i < len(self.terms) and self.terms[i].startswith(token):
+            terms.append(self.terms[i])
+            i += 1
+        return terms
+
+    def search(self, query, newest_first=False):
+        """Документы, где каждое слово запроса встречается целиком или как префикс.
+
+        Выше те, где больше слов совпало целиком; при равенстве — по id
+        документа (по убыванию, если newest_first).
+        """
+        matches = []
+        for token in dict.fromkeys(tokenize(query)):
+            terms = self._expand(token)
+            if not terms:
+                return []
+            exact = self.postings.get(token, set())
+            matches.append((exact, set().union(*(self.postings[term] for term in terms))))
+        if not matches:
+            return []
+
+        matches.sort(key=lambda match: len(match[1]))
+        candidates = matches[0][1].intersection(*(match[1] for match in matches[1:]))
+        hits = defaultdict(int)
+        for exact, _ in matches:
+            for doc in candidates & exact:
+                hits[doc] += 1
+
+        groups = defaultdict(list)
+        for doc, count in hits.items():
+            groups[count].append(doc)
+        groups[0] = candidates.difference(hits)
+        ranked = []
+        for count in sorted(groups, reverse=True):
+            ranked.extend(sorted(groups[count], reverse=newest_first))
+        return ranked
+
+
+class MessageSearchIndex(StoreIndex):
+    """Полнотекстовый индекс по тексту сообщений (документ — позиция в data["messages"])"""
+
+    def __init__(self):
+        self.text = TextIndex()
+
+    def rebuild(self, data):
+        self.text = TextIndex()
+        self.text.build((position, message.get('content') or '')
+                        for position, message in enumerate(data["messages"]))
+
+    def apply(self, record, data):
+        if record["path"][0] != "messages":
+            return
+        if record["op"] == "append" and len(record["path"]) == 1:
+            self.text.add(len(data["messages"]) - 1, record["value"].get('content') or '')
+        else:
+            self.rebuild(data)
+
+    def search(self, messages, query, offset=0, limit=None):
+        """Сообщения по релевантности, при равном весе — сначала новые; возвращает (страница, всего)"""
+        ranked = self.text.search(query, newest_first=True)
+        end = None if limit is None else offset + limit
+        return [messages[position] for position in ranked[offset:end]], len(ranked)
+
+
+class UserSearchIndex(StoreIndex):
+    """Индекс пользователей по id, username и имени"""
+
+    fields = ("username", "full_name")
+
+    def __init__(self):
+        self.text = TextIndex(removable=True)
+
+    @staticmethod
+    def _text(uid, user):
+        return f"{uid} {user.get('username') or ''} {user.get('full_name') or ''}"
+
+    def rebuild(self, data):
+        self.text = TextIndex(removable=True)
+        self.text.build((uid, self._text(uid, user)) for uid, user in data["users"].items())
+
+    def apply(self, record, data):
+        path = record["path"]
+        if path[0] != "users":
+            return
+        if len(path) == 1:
+            self.rebuild(data)
+        elif len(path) == 2 or path[2] in self.fields:
+            uid = path[1]
+            self.text.remove(uid)
+            if uid in data["users"]:
+                self.text.add(uid, self._text(uid, data["users"][uid]))
+
+    def search(self, users, query, offset=0, limit=None):
+        """Пары (uid, пользователь) по релевантности; возвращает (страница, всего)"""
+        ranked = self.text.search(query)
+        end = None if limit is None else offset + limit
+        return [(uid, users[uid]) for uid in ranked[offset:end]], len(ranked)
@@ -0,0 +1,846 @@
+import asyncio
+import json
+import os
+import re
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from metrics import histogram, timed_handler
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Ключ в снимке, хранящий поколение журнала, уже свернутого в этот снимок
+GENERATION_KEY = "_generation"
+
+COMPACT_THRESHOLD = int(os.environ.get("DB_COMPACT_THRESHOLD", 20000))
+# При отложенной записи save() пишет сразу, если накопилось столько изменений
+FLUSH_PENDING = int(os.environ.get("DB_FLUSH_PENDING", 500))
+
+# Большие секции снимка, которые разбираются только при первом обращении
+LAZY_SECTIONS = ("messages", "action_history")
+# Сколько байт строки секции читается, чтобы узнать ее ключ
+SECTION_HEAD = 4096
+SECTION_KEY_RE = re.compile(rb'"((?:[^"\\]|\\.)*)": ')
+
+SAVE_SECONDS = histogram("store_save_seconds", "Время save() хранилища (сброс журнала или запись снимка)", ("store",))
+COMPACT_SECONDS = histogram("store_compact_seconds", "Время свертки журнала в снимок", ("store",),
+                            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+
+def journal_path(filename):
+    """Путь к журналу изменений рядом с файлом снимка"""
+    return os.path.splitext(filename)[0] + ".journal"
+
+
+# Значения пути не было до записи (set/del)
+_MISSING = object()
+# Запись не применилась при повторном применении (JournaledStore._merge_external)
+_NOT_APPLIED = object()
+
+
+def _locate(data, path):
+    target = data
+    for key in path[:-1]:
+        target = target[key]
+    return target, path[-1]
+
+
+def apply_record(data, record):
+    """Применение одной записи журнала к словарю базы данных"""
+    op = record["op"]
+    target, key = _locate(data, record["path"])
+
+    if op == "set":
+        target[key] = record["value"]
+    elif op == "del":
+        target.pop(key, None)
+    elif op == "append":
+        target[key].append(record["value"])
+    elif op == "remove":
+        if record["value"] in target[key]:
+            target[key].remove(record["value"])
+    elif op == "incr":
+        target[key] = target.get(key, 0) + record.get("by", 1)
+    elif op == "trim":
+        # Удаление первых count элементов списка (перенос старых сообщений в архив)
+        del target[key][:record["count"]]
+    else:
+        raise ValueError(f"Unknown journal op: {op}")
+
+
+def undo_record(data, record):
+    """Данные для отмены записи; снимаются до apply_record()"""
+    op = record["op"]
+    target, key = _locate(data, record["path"])
+    if op in ("set", "del"):
+        try:
+            return target[key]
+        except (KeyError, IndexError):
+            return _MISSING
+    if op == "remove":
+        try:
+            return target[key].index(record["value"])
+        except ValueError:
+            return None
+    if op == "incr":
+        return key in target
+    if op == "trim":
+        return target[key][:record["count"]]
+    return None
+
+
+def revert_record(data, record, undo):
+    """Отмена записи, примененной после undo_record().
+
+    Для секций без произвольной вставки (MessageColumns) бросает исключение.
+    """
+    if undo is _NOT_APPLIED:
+        return
+    op = record["op"]
+    target, key = _locate(data, record["path"])
+    if op in ("set", "del"):
+        if undo is _MISSING:
+            target.pop(key, None)
+        else:
+            target[key] = undo
+    elif op == "append":
+        target[key].pop()
+    elif op == "remove":
+        if undo is not None:
+            target[key].insert(undo, record["value"])
+    elif op == "incr":
+        if undo:
+            target[key] -= record.get("by", 1)
+        else:
+            target.pop(key, None)
+    elif op == "trim":
+        target[key][:0] = undo
+
+
+def _conflict(record, other):
+    """Зависит ли результат от порядка двух записей: пути вложены друг в друга (кроме двух incr)"""
+    path, other_path = list(record["path"]), list(other["path"])
+    depth = min(len(path), len(other_path))
+    if path[:depth] != other_path[:depth]:
+        return False
+    return not (record["op"] == other["op"] == "incr")
+
+
+def _encode(value):
+    # Компактные записи (records.py) сериализуются как обычные списки и словари
+    if hasattr(value, "to_json"):
+        return value.to_json()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def write_snapshot(filename, data, indent=2):
+    """Атомарная запись снимка: временный файл + rename"""
+    tmp_name = filename + ".tmp"
+    with open(tmp_name, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_name, filename)
+
+
+class LazySection:
+    """Непрочитанная секция снимка: открытый файл, границы JSON-текста и отложенные записи журнала"""
+
+    def __init__(self, f, offset, length):
+        self.f = f
+        self.offset = offset
+        self.length = length
+        self.pending = []
+        self._lock = threading.Lock()
+
+    def read(self):
+        # Секцию может дописывать в новый снимок поток фоновой свертки
+        with self._lock:
+            self.f.seek(self.offset)
+            return self.f.read(self.length)
+
+
+class SnapshotData(dict):
+    """Данные снимка, где секции LazySection разбираются при первом обращении.
+
+    Файл снимка остается открытым, пока все секции не прочитаны: после
+    компакции другим процессом старый файл по-прежнему доступен.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        # Типы секций (JournaledStore.record_types), применяемые после разбора
+        self.types = {}
+
+    def _value(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, LazySection):
+            with self._lock:
+                value = dict.__getitem__(self, key)
+                if isinstance(value, LazySection):
+                    value = self._materialize(key, value)
+        return value
+
+    def _materialize(self, key, section):
+        started = time.monotonic()
+        section_data = {key: json.loads(section.read())}
+        for record in section.pending:
+            try:
+                apply_record(section_data, record)
+            except Exception as e:
+                logger.error(f"Error replaying journal record {record}: {e}")
+        value = section_data[key]
+        if key in self.types:
+            value = self.types[key](value)
+        dict.__setitem__(self, key, value)
+        logger.info(f"Loaded lazy section {key} ({section.length} bytes, {len(section.pending)} journal records) "
+                    f"in {(time.monotonic() - started) * 1000:.0f} ms")
+        return value
+
+    def __getitem__(self, key):
+        return self._value(key)
+
+    def get(self, key, default=None):
+        return self._value(key) if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            dict.__setitem__(self, key, default)
+        return self._value(key)
+
+    def items(self):
+        return [(key, self._value(key)) for key in self]
+
+    def values(self):
+        return [self._value(key) for key in self]
+
+    def lazy_keys(self):
+        return [key for key in self if isinstance(dict.__getitem__(self, key), LazySection)]
+
+    def defer(self, record):
+        """Откладывание записи журнала для непрочитанной секции; False, если секция уже в памяти"""
+        with self._lock:
+            value = dict.get(self, record["path"][0])
+            if isinstance(value, LazySection):
+                value.pending.append(record)
+                return True
+        return False
+
+    def raw(self, key):
+        """Непрочитанная секция без отложенных записей (ее текст переписывается как есть), иначе None"""
+        with self._lock:
+            value = dict.__getitem__(self, key)
+            if isinstance(value, LazySection) and not value.pending:
+                return value
+        return None
+
+
+def snapshot_sections(data):
+    """Секции снимка в памяти: JSON-текст или непрочитанная LazySection.
+
+    Дальнейшие изменения data на результат не влияют, поэтому записать
+    его можно в другом потоке (JournaledStore.compact_in_background).
+    """
+    sections = []
+    for key in list(data):
+        value = data.raw(key) if isinstance(data, SnapshotData) else None
+        if value is None:
+            value = json.dumps(data[key], ensure_ascii=False, default=_encode)
+        sections.append((key, value))
+    return sections
+
+
+def write_section_list(filename, sections):
+    """Атомарная запись секций snapshot_sections(): строка на каждый ключ верхнего уровня"""
+    tmp_name = filename + ".tmp"
+    with open(tmp_name, 'wb') as f:
+        f.write(b"{\n")
+        for i, (key, value) in enumerate(sections):
+            f.write(f"{json.dumps(key, ensure_ascii=False)}: ".encode('utf-8'))
+            f.write(value.read() if isinstance(value, LazySection) else value.encode('utf-8'))
+            f.write(b",\n" if i < len(sections) - 1 else b"\n")
+        f.write(b"}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_name, filename)
+
+
+def write_sections(filename, data):
+    """Атомарная запись снимка по секциям.
+
+    Файл остается обычным JSON, но load_snapshot() читает его построчно,
+    а непрочитанные секции переписываются как есть, без разбора.
+    """
+    write_section_list(filename, snapshot_sections(data))
+
+
+def load_snapshot(filename, lazy=()):
+    """Построчное чтение снимка, записанного write_sections(); секции из lazy не разбираются.
+
+    Снимок в другом формате (json.dump с отступами) читается целиком.
+    """
+    f = open(filename, 'rb')
+    data = _read_sections(f, lazy)
+    if data is None:
+        f.seek(0)
+        data = json.load(f)
+    if not (isinstance(data, SnapshotData) and data.lazy_keys()):
+        f.close()
+    return data
+
+
+def _read_sections(f, lazy):
+    if f.readline().strip() != b"{":
+        return None
+    data = SnapshotData()
+    while True:
+        offset = f.tell()
+        head = f.readline(SECTION_HEAD)
+        if head.strip() == b"}":
+            return data
+        match = SECTION_KEY_RE.match(head)
+        if not match:
+            return None
+        key = json.loads(b'"' + match.group(1) + b'"')
+        if key in lazy:
+            # Секция пропускается кусками, не загружая строку целиком
+            line = head
+            while line and not line.endswith(b"\n"):
+                line = f.readline(1 << 20)
+            if not line:
+                return None
+            next_line = f.tell()
+            end = next_line - 1
+            f.seek(end - 1)
+            if f.read(1) == b",":
+                end -= 1
+            f.seek(next_line)
+            value = LazySection(f, offset + match.end(), end - offset - match.end())
+        else:
+            line = head if head.endswith(b"\n") else head + f.readline()
+            try:
+                value = json.loads(line[match.end():].rstrip().rstrip(b","))
+            except ValueError:
+                return None
+        dict.__setitem__(data, key, value)
+
+
+def _parse_lines(chunk):
+    """Разбор полных строк журнала; возвращает записи и число разобранных байт"""
+    records = []
+    consumed = 0
+    for line in chunk.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            # Строка еще дописывается другим процессом
+            break
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            logger.warning("Skipping corrupted journal line")
+        consumed += len(line)
+    return records, consumed
+
+
+class Journal:
+    """Append-only журнал изменений в формате JSON Lines, общий для процессов.
+
+    Первая строка файла — заголовок с номером поколения. Записи применяются
+    при загрузке только если поколение журнала совпадает с поколением снимка,
+    поэтому падение между записью снимка и сбросом журнала не приводит
+    к повторному применению уже свернутых записей.
+
+    Бот и веб-админка дописывают записи под файловой блокировкой и читают
+    чужие записи с последней прочитанной позиции. Компакция заменяет файл
+    журнала новым (другой inode) — остальные процессы дочитывают старый
+    файл и продолжают с нового без полной перезагрузки.
+    """
+
+    def __init__(self, filename, fsync=False):
+        self.path = journal_path(filename)
+        self.fsync = fsync
+        self.generation = 0
+        self.pending = []
+        # Записи из pending по одной, с данными для отмены (JournaledStore._merge_external)
+        self.applied = []
+        # Счетчики в pending: путь → (позиция в pending, накопленное приращение)
+        self._increments = {}
+        self.records = 0
+        self.offset = 0
+        self._reader = None
+        self._inode = None
+        self._lock_file = None
+        self._lock_depth = 0
+        self._thread_lock = threading.RLock()
+
+    @contextmanager
+    def lock(self):
+        """Реентерабельная блокировка журнала между потоками и процессами"""
+        with self._thread_lock:
+            if fcntl is not None and self._lock_depth == 0:
+                if self._lock_file is None:
+                    self._lock_file = open(self.path + ".lock", 'a')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if fcntl is not None and self._lock_depth == 0:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open_reader(self):
+        if self._reader:
+            self._reader.close()
+        self._reader = open(self.path, 'rb')
+        self._inode = os.fstat(self._reader.fileno()).st_ino
+        header = self._reader.readline()
+        self.offset = len(header)
+        try:
+            return json.loads(header).get("generation")
+        except ValueError:
+            return None
+
+    def _read_new(self):
+        self._reader.seek(self.offset)
+        records, consumed = _parse_lines(self._reader.read())
+        self.offset += consumed
+        return records
+
+    def read(self, generation):
+        """Чтение записей журнала указанного поколения (под блокировкой)"""
+        self.generation = generation
+        if not os.path.exists(self.path) or self._open_reader() != generation:
+            self.reset(generation)
+            return []
+
+        records = self._read_new()
+        if self.offset != os.fstat(self._reader.fileno()).st_size:
+            # Недописанный хвост после падения: отрезаем, иначе новая запись склеится с ним
+            logger.warning(f"Truncating corrupted journal tail in {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.offset)
+        self.records = len(records)
+        return records
+
+    def peek(self, generation):
+        """Записи журнала поколения generation без сброса и обрезки файла (для сторонних читателей, под lock())
+
+        Журнал другого поколения уже свернут в снимок — записей нет.
+        Недописанная последняя строка пропускается.
+        """
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return []
+        with f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return []
+            if header.get("generation") != generation:
+                return []
+            return _parse_lines(f.read())[0]
+
+    def poll(self, apply):
+        """Применение записей, дописанных другими процессами.
+
+        Возвращает False, если журнал успел смениться больше одного раза
+        и нужна полная перезагрузка снимка.
+        """
+        with self._thread_lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return True
+
+            if stat.st_ino != self._inode:
+                # Журнал свернут другим процессом: дочитываем старый файл
+                for record in self._read_new():
+                    apply(record)
+                generation = self._open_reader()
+                if generation != self.generation + 1:
+                    return False
+                self.generation = generation
+                self.records = 0
+            elif stat.st_size <= self.offset:
+                return True
+
+            records = self._read_new()
+            for record in records:
+                apply(record)
+            self.records += len(records)
+            return True
+
+    def add(self, record, undo=None):
+        self.applied.append((record, undo))
+        path = tuple(record["path"])
+        if record["op"] == "incr":
+            # Приращения одного счетчика до flush() пишутся одной записью
+            position, by = self._increments.get(path, (None, 0))
+            by += record.get("by", 1)
+            if position is not None:
+                self.pending[position] = json.dumps({"op": "incr", "path": record["path"], "by": by},
+                                                    ensure_ascii=False) + "\n"
+                self._increments[path] = (position, by)
+                return
+            self._increments[path] = (len(self.pending), by)
+        elif self._increments:
+            # Запись по пути счетчика (или его родителя) должна остаться после его приращений
+            for counter in [c for c in self._increments if c[:len(path)] == path or path[:len(c)] == c]:
+                del self._increments[counter]
+        # Сериализуем сразу: значение в памяти может измениться до flush()
+        self.pending.append(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def changed(self):
+        """Дописан или свернут ли журнал другим процессом после последнего чтения"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino != self._inode or stat.st_size > self.offset
+
+    def write_pending(self):
+        """Дозапись накопленных записей одним блоком (под блокировкой, после poll())"""
+        with self.lock():
+            if not self.pending:
+                return
+            chunk = "".join(self.pending).encode('utf-8')
+            with open(self.path, 'ab') as f:
+                f.write(chunk)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self.offset += len(chunk)
+            self.records += len(self.pending)
+            self.pending = []
+            self.applied = []
+            self._increments = {}
+
+    def reset(self, generation):
+        """Замена журнала пустым журналом нового поколения (под блокировкой)"""
+        tmp_name = self.path + ".tmp"
+        with open(tmp_name, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"generation": generation}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, self.path)
+        self._open_reader()
+        self.generation = generation
+        self.records = 0
+
+
+class JournaledStore:
+    """Общие операции изменения данных для хранилищ с журналом.
+
+    Наследник задает self.filename, self.journal (None — режим полной
+    перезаписи файла при каждом save()), self.lock (threading.RLock)
+    и метод load(), читающий снимок.
+    Индексы из self.indexes перестраиваются при reload() и обновляются
+    по каждой применённой записи. Секции из record_types после загрузки
+    заменяются компактными типами (records.py).
+
+    С flush_interval > 0 save() только считает изменения: на диск их пишет
+    flush(), который владелец вызывает из фоновой задачи раз в
+    flush_interval секунд, при выключении и сам save(), когда изменений
+    накопилось flush_pending. Несколько save() подряд дают одну запись.
+
+    Изменения, запись и подтягивание чужих записей идут под self.lock:
+    веб-админка обслуживает запросы в нескольких потоках.
+    """
+
+    compact_threshold = COMPACT_THRESHOLD
+    indexes = ()
+    record_types = {}
+    flush_interval = 0
+    flush_pending = FLUSH_PENDING
+    # Изменения, еще не записанные на диск
+    unsaved = 0
+    # Идет compact_in_background(): журнал заблокирован, свои записи копятся в pending
+    compacting = False
+    _compaction = None
+
+    def _load_with_journal(self):
+        """Снимок + журнал, прочитанные согласованно под блокировкой"""
+        if not self.journal:
+            return self.load()
+
+        with self.journal.lock():
+            data = self.load()
+            records = self.journal.read(data.get(GENERATION_KEY, 0))
+        for record in records:
+            # Записи для непрочитанных секций применятся, когда секция понадобится
+            if isinstance(data, SnapshotData) and data.defer(record):
+                continue
+            try:
+                apply_record(data, record)
+            except Exception as e:
+                logger.error(f"Error replaying journal record {record}: {e}")
+        if records:
+            logger.info(f"Replayed {len(records)} journal records from {self.journal.path}")
+        return data
+
+    def _apply(self, record):
+        apply_record(self.data, record)
+        for index in self.indexes:
+            index.apply(record, self.data)
+
+    def _apply_external(self, record):
+        try:
+            self._apply(record)
+        except Exception as e:
+            logger.error(f"Error applying journal record {record}: {e}")
+
+    def _apply_types(self, data):
+        lazy = data.lazy_keys() if isinstance(data, SnapshotData) else []
+        for key, record_type in self.record_types.items():
+            if key in lazy:
+                data.types[key] = record_type
+            elif key in data and not isinstance(data[key], record_type):
+                data[key] = record_type(data[key])
+
+    def reload(self):
+        started = time.monotonic()
+        with self.lock:
+            self.data = self._load_with_journal()
+            self._apply_types(self.data)
+            for index in self.indexes:
+                index.rebuild(self.data)
+        lazy = self.data.lazy_keys() if isinstance(self.data, SnapshotData) else []
+        logger.info(f"Loaded {self.filename} in {(time.monotonic() - started) * 1000:.0f} ms"
+                    + (f" (not parsed yet: {', '.join(lazy)})" if lazy else ""))
+
+    def refresh(self):
+        """Подтянуть изменения, записанные другим процессом"""
+        if not self.journal:
+            return
+        with self.lock:
+            if self.compacting:
+                return
+            if self.journal.pending:
+                # Чужие записи поверх несброшенных своих легли бы в памяти не в том порядке, что в файле
+                if self.journal.changed():
+                    self.flush()
+                return
+            if not self.journal.poll(self._apply_external):
+                logger.info(f"Journal {self.journal.path} rotated more than once, reloading")
+                self.reload()
+
+    def _sync(self):
+        """Чужие записи журнала, затем свои несброшенные (под блокировкой журнала)"""
+        if not self.journal.pending:
+            if not self.journal.poll(self._apply_external):
+                logger.info(f"Journal {self.journal.path} rotated more than once, reloading")
+                self.reload()
+            return
+
+        external = []
+        if not self.journal.poll(external.append):
+            logger.info(f"Journal {self.journal.path} rotated more than once, reloading")
+            self._reload_keeping_pending()
+        elif external:
+            self._merge_external(external)
+        self.journal.write_pending()
+
+    def _merge_external(self, external):
+        """Чужие записи, дописанные в файл раньше своих несброшенных: в памяти тот же порядок, что в файле.
+
+        Свои записи уже применены к данным. Чужие записи, не задевающие их
+        путей, от порядка не зависят и применяются как есть. В секции, где
+        пути пересеклись, свои записи откатываются, применяются чужие, затем
+        свои заново, а индексы этой секции перестраиваются один раз.
+        """
+        own = self.journal.applied
+        sections = {record["path"][0] for record in external
+                    if any(_conflict(record, mine) for mine, _ in own)}
+        for record in external:
+            if record["path"][0] not in sections:
+                self._apply_external(record)
+        if not sections:
+            return
+
+        logger.info(f"Journal {self.journal.path}: reordering unsaved records in {', '.join(sorted(sections))}")
+        try:
+            for record, undo in reversed(own):
+                if record["path"][0] in sections:
+                    revert_record(self.data, record, undo)
+        except Exception as e:
+            logger.warning(f"Cannot revert unsaved records in {self.filename} ({e}), reloading")
+            return self._reload_keeping_pending()
+
+        for record in external:
+            if record["path"][0] in sections:
+                try:
+                    apply_record(self.data, record)
+                except Exception as e:
+                    logger.error(f"Error applying journal record {record}: {e}")
+        applied = []
+        for record, undo in own:
+            if record["path"][0] in sections:
+                try:
+                    undo = undo_record(self.data, record)
+                    apply_record(self.data, record)
+                except Exception as e:
+                    logger.error(f"Error reapplying journal record {record}: {e}")
+                    undo = _NOT_APPLIED
+            applied.append((record, undo))
+        self.journal.applied = applied
+        for section in sections:
+            # Запись о замене всей секции: каждый индекс перестраивает свою часть по данным
+            for index in self.indexes:
+                index.apply({"op": "set", "path": [section], "value": self.data.get(section)}, self.data)
+
+    def _reload_keeping_pending(self):
+        """Перечитывание снимка и журнала с повторным применением своих несброшенных записей"""
+        pending = [json.loads(line) for line in self.journal.pending]
+        self.reload()
+        applied = []
+        for record in pending:
+            try:
+                undo = undo_record(self.data, record)
+                self._apply(record)
+            except Exception as e:
+                logger.error(f"Error applying journal record {record}: {e}")
+                continue
+            applied.append((record, undo))
+        self.journal.applied = applied
+
+    def record(self, op, path, value=None, **extra):
+        """Применение изменения к данным и постановка его в журнал"""
+        record = {"op": op, "path": path}
+        if op in ("set", "append", "remove"):
+            record["value"] = value
+        record.update(extra)
+        with self.lock:
+            # Данные для отмены нужны, только пока запись не дописана в журнал
+            undo = undo_record(self.data, record) if self.journal else None
+            self._apply(record)
+            self.unsaved += 1
+            if self.journal:
+                self.journal.add(record, undo)
+
+    def set_value(self, path, value):
+        self.record("set", path, value)
+
+    def delete_value(self, path):
+        self.record("del", path)
+
+    def append_value(self, path, value):
+        self.record("append", path, value)
+
+    def remove_value(self, path, value):
+        self.record("remove", path, value)
+
+    def increment(self, path, by=1):
+        self.record("incr", path, by=by)
+
+    def trim_value(self, path, count):
+        self.record("trim", path, count=count)
+
+    @property
+    def dirty(self):
+        return self.unsaved > 0
+
+    def save(self):
+        if self.flush_interval and self.unsaved < self.flush_pending:
+            return
+        self.flush()
+
+    def flush(self):
+        """Запись всех накопленных изменений (дозапись журнала или атомарная замена снимка)"""
+        with self.lock:
+            if self.compacting:
+                # Изменения запишет compact_in_background() после смены поколения
+                return
+            with SAVE_SECONDS.time(store=os.path.basename(self.filename)):
+                self.unsaved = 0
+                if not self.journal:
+                    write_sections(self.filename, self.data)
+                    return
+
+                with self.journal.lock():
+                    self._sync()
+            if self.journal.records >= self.compact_threshold:
+                self._compact_soon()
+
+    def _compact_soon(self):
+        """Свертка по порогу: в фоне, если вызвана из цикла событий, иначе сразу"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.compact()
+        if self._compaction is None or self._compaction.done():
+            self._compaction = loop.create_task(self.compact_in_background())
+
+    def compact(self):
+        """Свертка журнала в новый снимок"""
+        if not self.journal:
+            return self.flush()
+
+        with self.lock:
+            if self.compacting:
+                return
+            with self.journal.lock(), COMPACT_SECONDS.time(store=os.path.basename(self.filename)):
+                self.unsaved = 0
+                self._sync()
+                generation = self.journal.generation + 1
+                self.data[GENERATION_KEY] = generation
+                write_sections(self.filename, self.data)
+                self.journal.reset(generation)
+        logger.info(f"Database compacted into {self.filename} (generation {generation})")
+
+    async def compact_in_background(self):
+        """Свертка для задач цикла событий: снимок собирается в памяти, файл пишется и fsync-ится в потоке.
+
+        Другие процессы ждут на блокировке журнала, как при compact(), а
+        изменения этого процесса за время записи копятся в pending и
+        попадают уже в журнал нового поколения.
+        """
+        with self.lock:
+            # Под self.lock: flush() из другого потока либо уже закончил, либо увидит compacting
+            if self.compacting:
+                return
+            self.compacting = True
+        try:
+            with self.journal.lock() if self.journal else nullcontext(), \
+                    COMPACT_SECONDS.time(store=os.path.basename(self.filename)):
+                with self.lock:
+                    self.unsaved = 0
+                    if self.journal:
+                        self._sync()
+                        generation = self.journal.generation + 1
+                        self.data[GENERATION_KEY] = generation
+                    sections = snapshot_sections(self.data)
+                await asyncio.to_thread(write_section_list, self.filename, sections)
+                if self.journal:
+                    self.journal.reset(generation)
+        finally:
+            self.compacting = False
+        logger.info(f"Database compacted into {self.filename} in background"
+                    + (f" (generation {generation})" if self.journal else ""))
+        if self.dirty:
+            self.flush()
+
+
+def flush_job(*stores):
+    """Задача job_queue бота: накопленные с прошлого запуска изменения stores записываются одним блоком"""
+    @timed_handler("flush_task")
+    async def flush_task(context):
+        for store in stores:
+            if store.dirty:
+                store.flush()
+    return flush_task
+
+
+def flush_on_shutdown(*stores):
+    """Хук post_shutdown Application: запись того, что не успела записать flush_job"""
+    async def flush_all(application):
+        for store in stores:
+            store.flush()
+    return flush_all
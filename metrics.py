@@ -0,0 +1,254 @@
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# METRICS_ENABLED=0 превращает inc/observe/time в пустые вызовы
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+# Порт /metrics ботов слушает только локальный интерфейс
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_NOOP = nullcontext()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток"""
+
+    kind = "untyped"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def samples(self):
+        """Строки (имя, метки, значение) для экспорта"""
+        with self._lock:
+            return [(self.name, _format_labels(self.labels, key), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Текущее значение; с fn значение без меток вычисляется при каждом экспорте (глубина очередей)"""
+
+    kind = "gauge"
+
+    def __init__(self, name, description, labels=(), fn=None):
+        super().__init__(name, description, labels)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.fn is None:
+            return super().samples()
+        try:
+            return [(self.name, "", self.fn())]
+        except Exception as e:
+            logger.error(f"Ошибка вычисления метрики {self.name}: {e}")
+            return []
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам buckets (в формате Prometheus: накопительные счетчики le)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Счетчики по корзинам (последняя — +Inf), сумма и число наблюдений
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Контекстный менеджер, который замеряет время блока"""
+        return _Timer(self, labels) if METRICS_ENABLED else _NOOP
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket
+                samples.append((f"{self.name}_bucket", _format_labels(self.labels, key, [("le", bound)]),
+                                cumulative))
+            labels = _format_labels(self.labels, key)
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class Registry:
+    """Метрики процесса; повторная регистрация имени возвращает существующую метрику"""
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, description, labels=()):
+    return REGISTRY.register(Counter(name, description, labels))
+
+
+def gauge(name, description, labels=(), fn=None):
+    return REGISTRY.register(Gauge(name, description, labels, fn))
+
+
+def histogram(name, description, labels=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, description, labels, buckets))
+
+
+def render():
+    return REGISTRY.render()
+
+
+# Общие метрики ботов и админки
+HANDLER_SECONDS = histogram("handler_seconds", "Время обработки апдейта Telegram", ("handler", "callback"))
+HANDLER_ERRORS = counter("handler_errors_total", "Исключения в обработчиках Telegram", ("handler", "callback"))
+TELEGRAM_SECONDS = histogram("telegram_api_seconds", "Время вызова Telegram Bot API", ("method",))
+TELEGRAM_ERRORS = counter("telegram_api_errors_total", "Ошибки вызовов Telegram Bot API", ("method", "error"))
+
+
+def callback_label(data):
+    """callback_data без id в конце (reveal_123 -> reveal_), чтобы число меток было ограничено"""
+    return re.sub(r"-?\d+$", "", data or "")[:32]
+
+
+def timed_handler(name):
+    """Декоратор async-обработчика: время и исключения по имени обработчика и callback_data"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return await func(*args, **kwargs)
+            query = getattr(args[0], "callback_query", None) if args else None
+            callback = callback_label(query.data) if query is not None else ""
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(handler=name, callback=callback)
+                raise
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name, callback=callback)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host=METRICS_HOST):
+    """HTTP-сервер /metrics в фоновом потоке; port 0 — не запускать"""
+    if not port or not METRICS_ENABLED:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"Не удалось открыть порт метрик {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
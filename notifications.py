@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from telegram.error import RetryAfter, Forbidden, BadRequest
+from journal import Journal, JournaledStore
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", 5))
+# Задержка повтора: RETRY_BASE * 2^(попытка - 1), но не больше RETRY_MAX секунд
+RETRY_BASE = 5
+RETRY_MAX = 600
+# Сколько уведомлений отправляется одновременно
+DRAIN_BATCH = 10
+DEAD_LETTER_LIMIT = 1000
+
+
+class NotificationQueue(JournaledStore):
+    """Персистентная очередь исходящих уведомлений.
+
+    enqueue() сохраняет уведомление в журнал и сразу возвращает управление,
+    отправкой занимается run() в событийном цикле процесса. Неудачные
+    отправки повторяются с экспоненциальной задержкой; после MAX_ATTEMPTS
+    или при постоянной ошибке (бот заблокирован, чат не найден)
+    уведомление переносится в dead-letter список "dead".
+    """
+
+    def __init__(self, filename, journal=True):
+        self.filename = filename
+        self.journal = Journal(filename) if journal else None
+        self.lock = threading.RLock()
+        self._loop = None
+        self._wakeup = None
+        self._worker = None
+        self.reload()
+
+    def load(self):
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    data.setdefault("pending", {})
+                    data.setdefault("dead", [])
+                    return data
+            except Exception as e:
+                logger.error(f"Error loading notification queue: {e}")
+        return {"pending": {}, "dead": []}
+
+    def enqueue(self, chat_id, text, parse_mode=None):
+        now = datetime.now().isoformat()
+        item = {
+            "id": uuid.uuid4().hex,
+            "chat_id": int(chat_id),
+            "text": text,
+            "parse_mode": parse_mode,
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt": now
+        }
+        with self.lock:
+            self.set_value(["pending", item["id"]], item)
+            self.save()
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return item["id"]
+
+    def pending_count(self):
+        return len(self.data["pending"])
+
+    def dead_count(self):
+        return len(self.data["dead"])
+
+    def _due(self, now):
+        with self.lock:
+            items = [item for item in self.data["pending"].values()
+                     if datetime.fromisoformat(item["next_attempt"]) <= now]
+        items.sort(key=lambda item: item["created_at"])
+        return items
+
+    def _next_delay(self, now):
+        with self.lock:
+            if not self.data["pending"]:
+                return None
+            next_attempt = min(datetime.fromisoformat(item["next_attempt"])
+                               for item in self.data["pending"].values())
+        return max((next_attempt - now).total_seconds(), 0)
+
+    def _done(self, item):
+        with self.lock:
+            self.delete_value(["pending", item["id"]])
+
+    def _retry(self, item, error, delay=None):
+        attempts = item["attempts"] + 1
+        if attempts >= MAX_ATTEMPTS:
+            return self._dead(item, error)
+        if delay is None:
+            delay = min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+        next_attempt = (datetime.now() + timedelta(seconds=delay)).isoformat()
+        logger.warning(f"Уведомление {item['id']} для {item['chat_id']} не отправлено ({error}), "
+                       f"повтор через {delay} с")
+        with self.lock:
+            self.set_value(["pending", item["id"]], dict(item, attempts=attempts, next_attempt=next_attempt,
+                                                         last_error=str(error)))
+
+    def _dead(self, item, error):
+        logger.error(f"Уведомление {item['id']} для {item['chat_id']} перенесено в dead-letter: {error}")
+        with self.lock:
+            self.delete_value(["pending", item["id"]])
+            self.append_value(["dead"], dict(item, attempts=item["attempts"] + 1, last_error=str(error),
+                                             failed_at=datetime.now().isoformat()))
+            if len(self.data["dead"]) > DEAD_LETTER_LIMIT:
+                self.set_value(["dead"], self.data["dead"][-DEAD_LETTER_LIMIT:])
+
+    async def _deliver(self, send, item):
+        try:
+            await send(item["chat_id"], item["text"], item.get("parse_mode"))
+            self._done(item)
+        except RetryAfter as e:
+            delay = e.retry_after
+            if isinstance(delay, timedelta):
+                delay = delay.total_seconds()
+            self._retry(item, e, delay)
+        except (Forbidden, BadRequest) as e:
+            self._dead(item, e)
+        except Exception as e:
+            self._retry(item, e)
+
+    async def drain(self, send):
+        """Отправка всех уведомлений, срок которых наступил"""
+        items = self._due(datetime.now())
+        for start in range(0, len(items), DRAIN_BATCH):
+            await asyncio.gather(*(self._deliver(send, item) for item in items[start:start + DRAIN_BATCH]))
+        if items:
+            with self.lock:
+                self.save()
+
+    def start(self, runner, send):
+        """Однократный запуск run() через runner (TelegramSender.run, Application.create_task)"""
+        with self.lock:
+            if self._worker is None:
+                self._worker = runner(self.run(send))
+        return self._worker
+
+    async def run(self, send):
+        """Рабочий цикл: send(chat_id, text, parse_mode) — корутина отправки"""
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if self.data["pending"]:
+            logger.info(f"В очереди уведомлений {len(self.data['pending'])} неотправленных")
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.drain(send)
+            except Exception as e:
+                logger.error(f"Ошибка обработки очереди уведомлений: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_delay(datetime.now()))
+            except asyncio.TimeoutError:
+                pass
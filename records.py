@@ -0,0 +1,294 @@
+import sys
+from array import array
+from datetime import datetime, timedelta
+
+# Время сообщений хранится как микросекунды от этой даты (naive, локальное время)
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+# Короткие тексты ("[Медиа]", типовые ответы) хранятся в одном экземпляре
+INTERN_LIMIT = 32
+
+MESSAGE_KEYS = ("from", "to", "date", "content")
+
+
+def _to_micros(date):
+    # Только формат datetime.isoformat() без часового пояса, чтобы "date" читалась обратно той же строкой
+    if len(date) not in (19, 26) or date[10] != "T" or date.endswith(".000000"):
+        raise ValueError(date)
+    return (datetime.fromisoformat(date) - EPOCH) // MICROSECOND
+
+
+class Message:
+    """Сообщение из MessageColumns с интерфейсом словаря {"from", "to", "date", "content"}"""
+
+    __slots__ = ("sender", "recipient", "micros", "content")
+
+    def __init__(self, sender, recipient, micros, content):
+        self.sender = sender
+        self.recipient = recipient
+        self.micros = micros
+        self.content = content
+
+    @property
+    def moment(self):
+        return EPOCH + timedelta(0, 0, self.micros)
+
+    def __getitem__(self, key):
+        if key == "from":
+            return self.sender
+        if key == "to":
+            return self.recipient
+        if key == "date":
+            return self.moment.isoformat()
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in MESSAGE_KEYS else default
+
+    def __contains__(self, key):
+        return key in MESSAGE_KEYS
+
+    def keys(self):
+        return MESSAGE_KEYS
+
+    def __iter__(self):
+        return iter(MESSAGE_KEYS)
+
+    def __len__(self):
+        return len(MESSAGE_KEYS)
+
+    def items(self):
+        return [(key, self[key]) for key in MESSAGE_KEYS]
+
+    def __eq__(self, other):
+        return dict(self.items()) == other
+
+    def to_json(self):
+        return dict(self.items())
+
+
+class MessageColumns:
+    """Список сообщений, хранящийся по столбцам.
+
+    Отправитель, получатель и время лежат в array('q') (по 8 байт), текст —
+    в списке строк, короткие тексты интернируются. messages[i] собирает
+    Message на лету. Сообщение, которое не укладывается в схему (лишние
+    ключи, id не числом, время с часовым поясом), хранится как есть в extras.
+    """
+
+    def __init__(self, messages=()):
+        self.senders = array('q')
+        self.recipients = array('q')
+        self.times = array('q')
+        self.contents = []
+        self.extras = {}
+        self.strings = {}
+        for message in messages:
+            self.append(message)
+
+    def append(self, message):
+        try:
+            if len(message) != len(MESSAGE_KEYS) or type(message["from"]) is not int \
+                    or type(message["to"]) is not int:
+                raise ValueError(message)
+            micros = message.micros if isinstance(message, Message) else _to_micros(message["date"])
+            content = message["content"]
+            if content is not None and not isinstance(content, str):
+                raise ValueError(message)
+            row = (message["from"], message["to"], micros)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            self.extras[len(self.contents)] = message
+            row = (0, 0, 0)
+            content = None
+        self.senders.append(row[0])
+        self.recipients.append(row[1])
+        self.times.append(row[2])
+        if content is not None and len(content) <= INTERN_LIMIT:
+            content = self.strings.setdefault(content, content)
+        self.contents.append(content)
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def __len__(self):
+        return len(self.contents)
+
+    def _get(self, position):
+        extra = self.extras.get(position)
+        if extra is not None:
+            return extra
+        return Message(self.senders[position], self.recipients[position], self.times[position],
+                       self.contents[position])
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._get(i) for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("message index out of range")
+        return self._get(position)
+
+    def __iter__(self):
+        if not self.extras:
+            return map(Message, self.senders, self.recipients, self.times, self.contents)
+        return map(self._get, range(len(self)))
+
+    def __delitem__(self, position):
+        # Поддерживается только отрезание начала (перенос в архив, op "trim")
+        if not isinstance(position, slice) or position.start not in (None, 0) or position.step not in (None, 1):
+            raise TypeError("only prefix deletion is supported")
+        count = len(range(*position.indices(len(self))))
+        del self.senders[:count]
+        del self.recipients[:count]
+        del self.times[:count]
+        del self.contents[:count]
+        self.extras = {p - count: m for p, m in self.extras.items() if p >= count}
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def to_json(self):
+        return [message if isinstance(message, dict) else message.to_json() for message in self]
+
+
+class Record:
+    """Запись истории с полями в __slots__ и интерфейсом словаря.
+
+    Набор ключей сохраняется: отсутствующее поле остается незаданным
+    слотом, ключи вне fields попадают в _extra. Вложенные словари из
+    nested тоже становятся записями.
+    """
+
+    __slots__ = ("_extra",)
+    fields = ()
+    # Поля с повторяющимися значениями (тип действия, причина), строки которых интернируются
+    interned = ()
+    nested = {}
+
+    def __init__(self, values):
+        self._extra = None
+        for key, value in values.items():
+            self[key] = value
+
+    def __setitem__(self, key, value):
+        if key in self.fields:
+            if key in self.interned and isinstance(value, str) and len(value) <= INTERN_LIMIT:
+                value = sys.intern(value)
+            elif key in self.nested and isinstance(value, dict):
+                value = self.nested[key](value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def keys(self):
+        keys = [key for key in self.fields if hasattr(self, key)]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __eq__(self, other):
+        return dict(self.items()) == other
+
+    def to_json(self):
+        return dict(self.items())
+
+
+class BanRecord(Record):
+    __slots__ = ("user_id", "reason", "admin_id", "banned_at", "until", "active", "unbanned_at", "unbanned_by")
+    fields = __slots__
+    interned = ("reason",)
+
+
+class ActionDetails(Record):
+    __slots__ = ("reason", "until", "admin_id", "days")
+    fields = __slots__
+    interned = ("reason",)
+
+
+class ActionRecord(Record):
+    __slots__ = ("user_id", "action_type", "details", "timestamp", "admin_id")
+    fields = __slots__
+    interned = ("action_type",)
+    nested = {"details": ActionDetails}
+
+
+class RecordList(list):
+    """Список записей истории: словари превращаются в record_type при добавлении и замене"""
+
+    record_type = Record
+
+    def __init__(self, items=()):
+        super().__init__(self._convert(item) for item in items)
+
+    def _convert(self, item):
+        return item if isinstance(item, self.record_type) or not isinstance(item, dict) else self.record_type(item)
+
+    def append(self, item):
+        super().append(self._convert(item))
+
+    def extend(self, items):
+        super().extend(self._convert(item) for item in items)
+
+    def __setitem__(self, position, item):
+        if isinstance(position, slice):
+            super().__setitem__(position, [self._convert(i) for i in item])
+        else:
+            super().__setitem__(position, self._convert(item))
+
+    def to_json(self):
+        return [item.to_json() if isinstance(item, Record) else item for item in self]
+
+
+class BanHistory(RecordList):
+    record_type = BanRecord
+
+
+class ActionHistory(RecordList):
+    record_type = ActionRecord
+
+
+# Секции базы, которые хранятся компактными типами; преобразование — при загрузке
+RECORD_TYPES = {
+    "messages": MessageColumns,
+    "ban_history": BanHistory,
+    "action_history": ActionHistory
+}
+
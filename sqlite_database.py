@@ -0,0 +1,718 @@
+import argparse
+import json
+import os
+import re
+import secrets
+import sqlite3
+import string
+import threading
+import logging
+from datetime import datetime, timedelta
+from journal import Journal, GENERATION_KEY, apply_record
+from indexes import normalize_text, tokenize, MIN_PREFIX
+from archive import MessageArchive
+
+logger = logging.getLogger(__name__)
+
+SQLITE_FILE = os.environ.get("SQLITE_FILE", "anonadmin.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    full_name TEXT,
+    first_seen TEXT,
+    messages_sent INTEGER NOT NULL DEFAULT 0,
+    messages_received INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_users_first_seen ON users (first_seen);
+CREATE TABLE IF NOT EXISTS user_states (
+    user_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    "from" INTEGER NOT NULL,
+    "to" INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    content TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_from ON messages ("from");
+CREATE INDEX IF NOT EXISTS idx_messages_to ON messages ("to");
+CREATE INDEX IF NOT EXISTS idx_messages_date ON messages (date);
+CREATE TABLE IF NOT EXISTS banned (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS ban_reasons (
+    user_id INTEGER PRIMARY KEY,
+    reason TEXT
+);
+CREATE TABLE IF NOT EXISTS protected_users (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS admins (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS admin_passwords (
+    user_id INTEGER PRIMARY KEY,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_id INTEGER PRIMARY KEY,
+    until TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_until ON subscriptions (until);
+CREATE TABLE IF NOT EXISTS ban_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    reason TEXT,
+    admin_id INTEGER,
+    banned_at TEXT,
+    until TEXT,
+    active INTEGER NOT NULL DEFAULT 1,
+    unbanned_at TEXT,
+    unbanned_by INTEGER,
+    unban_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ban_history_user ON ban_history (user_id);
+CREATE INDEX IF NOT EXISTS idx_ban_history_until ON ban_history (until) WHERE active = 1 AND until IS NOT NULL;
+CREATE TABLE IF NOT EXISTS action_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    action_type TEXT NOT NULL,
+    details TEXT,
+    admin_id INTEGER,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_action_history_user ON action_history (user_id);
+CREATE TABLE IF NOT EXISTS statistics (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+-- Полнотекстовый индекс сообщений: rowid = messages.id, текст нормализован normalize_text()
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='');
+"""
+
+
+def fts_query(query):
+    """Запрос FTS5: все слова обязательны, слова от MIN_PREFIX символов ищутся по префиксу"""
+    terms = [f'"{token}"*' if len(token) >= MIN_PREFIX else f'"{token}"' for token in tokenize(query)]
+    return " AND ".join(terms)
+
+
+class SQLiteDatabase:
+    """SQLite-хранилище с тем же API, что Database / AdminDatabase / SharedDatabase.
+
+    Каждый поток получает свое соединение, база открывается в режиме WAL,
+    поэтому бот и веб-админка могут работать с одним файлом одновременно,
+    а каждое изменение — это запись одной строки, а не перезапись всей базы.
+    """
+
+    journal = None
+
+    def __init__(self, filename=SQLITE_FILE, owner_id=None):
+        self.filename = filename
+        self.owner_id = owner_id if owner_id is not None else int(os.environ.get('OWNER_ID', 0))
+        self._local = threading.local()
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            self._index_messages()
+
+    def _index_messages(self):
+        """Досоздание полнотекстового индекса для сообщений, перенесенных миграцией"""
+        last_id = self._one("SELECT MAX(rowid) AS id FROM messages_fts")["id"] or 0
+        rows = self._all("SELECT id, content FROM messages WHERE id > ? ORDER BY id", (last_id,))
+        self.conn.executemany("INSERT INTO messages_fts (rowid, content) VALUES (?, ?)",
+                              ((row["id"], normalize_text(row["content"] or '')) for row in rows))
+        if rows:
+            logger.info(f"Indexed {len(rows)} messages for full-text search")
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.filename, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            # Встроенный lower() в SQLite не понимает кириллицу
+            conn.create_function("py_lower", 1, lambda s: normalize_text(s) if isinstance(s, str) else s,
+                                 deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def _one(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchone()
+
+    def _all(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchall()
+
+    def _write(self, sql, params=()):
+        with self.conn:
+            return self.conn.execute(sql, params)
+
+    # Отложенных изменений не бывает
+    dirty = False
+
+    def save(self):
+        """Изменения фиксируются построчно, отдельное сохранение не требуется"""
+
+    def flush(self):
+        """Совместимость с JSON-хранилищем"""
+
+    def compact(self):
+        """Совместимость с JSON-хранилищем"""
+
+    def refresh(self):
+        """Чтения всегда видят последние изменения других процессов"""
+
+    # --- Пользователи ---
+
+    @staticmethod
+    def _user_dict(row):
+        return {
+            "user_id": row["user_id"],
+            "username": row["username"],
+            "full_name": row["full_name"],
+            "first_seen": row["first_seen"],
+            "messages_sent": row["messages_sent"],
+            "messages_received": row["messages_received"]
+        }
+
+    def register_user(self, user_id, username, full_name):
+        self._write(
+            "INSERT INTO users (user_id, username, full_name, first_seen) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, full_name = excluded.full_name",
+            (int(user_id), username, full_name, datetime.now().isoformat()))
+
+    def get_user_info(self, user_id):
+        row = self._one("SELECT * FROM users WHERE user_id = ?", (int(user_id),))
+        return self._user_dict(row) if row else {}
+
+    def get_info(self, user_id):
+        un = self.get_user_info(user_id).get("username")
+        return f"(@{un})" if un else "(без юзера)"
+
+    def get_all_users(self):
+        rows = self._all("SELECT * FROM users ORDER BY first_seen")
+        return {str(row["user_id"]): self._user_dict(row) for row in rows}
+
+    def get_recent_users(self, limit=5):
+        rows = self._all("SELECT * FROM users ORDER BY first_seen DESC LIMIT ?", (limit,))
+        return [(str(row["user_id"]), self._user_dict(row)) for row in reversed(rows)]
+
+    def search_users(self, query, offset=0, limit=None):
+        pattern = f"%{normalize_text(query)}%"
+        where = ("FROM users WHERE CAST(user_id AS TEXT) LIKE ? "
+                 "OR py_lower(username) LIKE ? OR py_lower(full_name) LIKE ?")
+        params = (f"%{query}%", pattern, pattern)
+        total = self._one(f"SELECT COUNT(*) AS n {where}", params)["n"]
+        rows = self._all(f"SELECT * {where} ORDER BY first_seen LIMIT ? OFFSET ?",
+                         params + (-1 if limit is None else limit, offset))
+        return [(str(row["user_id"]), self._user_dict(row)) for row in rows], total
+
+    def get_broadcast_recipients(self):
+        rows = self._all("SELECT user_id FROM users WHERE user_id NOT IN (SELECT user_id FROM banned)")
+        return [row["user_id"] for row in rows]
+
+    # --- Состояния диалогов ---
+
+    def get_user_state(self, user_id):
+        row = self._one("SELECT state FROM user_states WHERE user_id = ?", (int(user_id),))
+        return json.loads(row["state"]) if row else None
+
+    def set_user_state(self, user_id, state):
+        self._write("INSERT OR REPLACE INTO user_states (user_id, state) VALUES (?, ?)",
+                    (int(user_id), json.dumps(state, ensure_ascii=False)))
+
+    def clear_user_state(self, user_id):
+        self._write("DELETE FROM user_states WHERE user_id = ?", (int(user_id),))
+
+    # --- Сообщения ---
+
+    def add_message(self, from_id, to_id, content):
+        with self.conn:
+            cur = self.conn.execute('INSERT INTO messages ("from", "to", date, content) VALUES (?, ?, ?, ?)',
+                                    (int(from_id), int(to_id), datetime.now().isoformat(), content))
+            self.conn.execute("INSERT INTO messages_fts (rowid, content) VALUES (?, ?)",
+                              (cur.lastrowid, normalize_text(content or '')))
+            self.conn.execute("UPDATE users SET messages_sent = messages_sent + 1 WHERE user_id = ?",
+                              (int(from_id),))
+            self.conn.execute("UPDATE users SET messages_received = messages_received + 1 WHERE user_id = ?",
+                              (int(to_id),))
+
+    def get_all_messages(self):
+        return [dict(row) for row in self._all('SELECT "from", "to", date, content FROM messages ORDER BY id')]
+
+    def get_recent_messages(self, limit=5):
+        rows = self._all('SELECT "from", "to", date, content FROM messages ORDER BY id DESC LIMIT ?', (limit,))
+        return [dict(row) for row in rows]
+
+    def get_received_messages(self, user_id, limit=8):
+        rows = self._all('SELECT "from", "to", date, content FROM messages WHERE "to" = ? ORDER BY id DESC LIMIT ?',
+                         (int(user_id), limit))
+        return [dict(row) for row in reversed(rows)]
+
+    def get_user_messages(self, user_id, limit=50, before=None):
+        uid = int(user_id)
+        rows = self._all('SELECT id, "from", "to", date, content FROM messages '
+                         'WHERE ("from" = ? OR "to" = ?) AND id < ? ORDER BY id DESC LIMIT ?',
+                         (uid, uid, before if before is not None else 2 ** 63 - 1, limit + 1))
+        items = [dict(row) for row in rows[:limit]]
+        return items, (items[-1]["id"] if len(rows) > limit else None)
+
+    @staticmethod
+    def _date_range(since, until):
+        where, params = [], []
+        if since is not None:
+            where.append("date >= ?")
+            params.append(since.isoformat())
+        if until is not None:
+            where.append("date < ?")
+            params.append(until.isoformat())
+        return where, params
+
+    def count_messages(self, since=None, until=None):
+        where, params = self._date_range(since, until)
+        sql = "SELECT COUNT(*) AS n FROM messages"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return self._one(sql, params)["n"]
+
+    def get_messages_page(self, before=None, after=None, limit=50, since=None, until=None):
+        """Страница сообщений от новых к старым; возвращает (сообщения, курсор before, курсор after)"""
+        where, params = self._date_range(since, until)
+        if after is not None:
+            where.append("id > ?")
+            params.append(after)
+            order = "ASC"
+        else:
+            if before is not None:
+                where.append("id < ?")
+                params.append(before)
+            order = "DESC"
+        sql = 'SELECT id, "from", "to", date, content FROM messages'
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        rows = self._all(f"{sql} ORDER BY id {order} LIMIT ?", params + [limit + 1])
+        more = len(rows) > limit
+        items = [dict(row) for row in rows[:limit]]
+
+        # Курсор в сторону, где за краем страницы нет сообщений, не возвращается (как в JSON-базе)
+        where, params = self._date_range(since, until)
+        if after is not None:
+            items.reverse()
+            more_newer = more
+            more_older = self._exists_message(where + ["id <= ?"], params + [after])
+        else:
+            more_older = more
+            more_newer = before is not None and self._exists_message(where + ["id >= ?"], params + [before])
+        before_cursor = items[-1]["id"] if items and more_older else None
+        after_cursor = items[0]["id"] if items and more_newer else None
+        return items, before_cursor, after_cursor
+
+    def _exists_message(self, where, params):
+        return self._one(f"SELECT EXISTS (SELECT 1 FROM messages WHERE {' AND '.join(where)}) AS found",
+                         params)["found"] == 1
+
+    def get_users_page(self, before=None, after=None, limit=50):
+        """Пользователи в порядке регистрации; возвращает (пары uid/пользователь, курсор before, курсор after)"""
+        cursor = "(SELECT first_seen, user_id FROM users WHERE user_id = ?)"
+        if before is not None:
+            rows = self._all(f"SELECT * FROM users WHERE (first_seen, user_id) < {cursor} "
+                             "ORDER BY first_seen DESC, user_id DESC LIMIT ?", (int(before), limit + 1))
+            more = len(rows) > limit
+            rows = list(reversed(rows[:limit]))
+            before_cursor = rows[0]["user_id"] if rows and more else None
+            after_cursor = rows[-1]["user_id"] if rows else None
+        else:
+            if after is not None:
+                rows = self._all(f"SELECT * FROM users WHERE (first_seen, user_id) > {cursor} "
+                                 "ORDER BY first_seen, user_id LIMIT ?", (int(after), limit + 1))
+            else:
+                rows = self._all("SELECT * FROM users ORDER BY first_seen, user_id LIMIT ?", (limit + 1,))
+            more = len(rows) > limit
+            rows = rows[:limit]
+            before_cursor = rows[0]["user_id"] if rows and after is not None else None
+            after_cursor = rows[-1]["user_id"] if rows and more else None
+        items = [(str(row["user_id"]), self._user_dict(row)) for row in rows]
+        return items, before_cursor, after_cursor
+
+    def search_messages(self, query, offset=0, limit=None, archived=False):
+        # Архива у SQLite нет: все сообщения лежат в таблице и в messages_fts
+        match = fts_query(query)
+        if not match:
+            return [], 0
+        total = self._one("SELECT COUNT(*) AS n FROM messages_fts WHERE messages_fts MATCH ?", (match,))["n"]
+        rows = self._all('SELECT m."from", m."to", m.date, m.content FROM messages_fts '
+                         'JOIN messages m ON m.id = messages_fts.rowid WHERE messages_fts MATCH ? '
+                         'ORDER BY bm25(messages_fts), m.id DESC LIMIT ? OFFSET ?',
+                         (match, -1 if limit is None else limit, offset))
+        return [dict(row) for row in rows], total
+
+    # --- Подписки ---
+
+    def has_subscription(self, user_id):
+        until = self.get_subscription_until(user_id)
+        if not until:
+            return False
+        try:
+            return datetime.now() < datetime.fromisoformat(until)
+        except ValueError:
+            return False
+
+    def is_vip(self, user_id):
+        return self.get_subscription_until(user_id) is not None
+
+    def get_subscription_until(self, user_id):
+        row = self._one("SELECT until FROM subscriptions WHERE user_id = ?", (int(user_id),))
+        return row["until"] if row else None
+
+    def get_expired_subscriptions(self, now=None):
+        now = now or datetime.now()
+        rows = self._all("SELECT user_id FROM subscriptions WHERE until <= ?", (now.isoformat(),))
+        return [str(row["user_id"]) for row in rows]
+
+    def add_subscription(self, user_id, time_str, admin_id=None, reason=None):
+        """Добавление подписки: '7', '7d', '12h', '30m', '45s'"""
+        match = re.match(r"(\d+)([smhd]?)", str(time_str).strip().lower())
+        if not match:
+            return None
+
+        value = int(match.group(1))
+        unit = match.group(2)
+
+        if value <= 0:
+            self.remove_subscription(user_id, admin_id, reason)
+            return None
+
+        if unit == 's':
+            delta = timedelta(seconds=value)
+        elif unit == 'm':
+            delta = timedelta(minutes=value)
+        elif unit == 'h':
+            delta = timedelta(hours=value)
+        else:
+            delta = timedelta(days=value)
+
+        current = self.get_subscription_until(user_id)
+        if current:
+            new_until = datetime.fromisoformat(current) + delta
+        else:
+            new_until = datetime.now() + delta
+
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO subscriptions (user_id, until) VALUES (?, ?)",
+                              (int(user_id), new_until.isoformat()))
+            if admin_id is not None:
+                self._add_action(user_id, "vip_add", {
+                    "until": new_until.isoformat(),
+                    "days": value if unit in ['', 'd'] else None,
+                    "admin_id": admin_id,
+                    "reason": reason
+                }, admin_id)
+        return new_until
+
+    def remove_subscription(self, user_id, admin_id=None, reason=None):
+        with self.conn:
+            cur = self.conn.execute("DELETE FROM subscriptions WHERE user_id = ?", (int(user_id),))
+            if cur.rowcount and admin_id is not None:
+                self._add_action(user_id, "vip_remove", {"admin_id": admin_id, "reason": reason}, admin_id)
+        return cur.rowcount > 0
+
+    # --- Защита от раскрытия ---
+
+    def is_protected(self, user_id):
+        return self._one("SELECT 1 FROM protected_users WHERE user_id = ?", (int(user_id),)) is not None
+
+    def get_protected_users(self):
+        return [row["user_id"] for row in self._all("SELECT user_id FROM protected_users")]
+
+    def add_protected_user(self, user_id, admin_id=None, reason=None):
+        with self.conn:
+            cur = self.conn.execute("INSERT OR IGNORE INTO protected_users (user_id) VALUES (?)", (int(user_id),))
+            if cur.rowcount:
+                self._add_action(user_id, "protect_add", {"admin_id": admin_id, "reason": reason}, admin_id)
+        return cur.rowcount > 0
+
+    def remove_protected_user(self, user_id, admin_id=None, reason=None):
+        with self.conn:
+            cur = self.conn.execute("DELETE FROM protected_users WHERE user_id = ?", (int(user_id),))
+            if cur.rowcount:
+                self._add_action(user_id, "protect_remove", {"admin_id": admin_id, "reason": reason}, admin_id)
+        return cur.rowcount > 0
+
+    # --- Администраторы ---
+
+    def is_admin(self, user_id):
+        try:
+            uid = int(user_id)
+        except (TypeError, ValueError):
+            return False
+        return uid == self.owner_id or self._one("SELECT 1 FROM admins WHERE user_id = ?", (uid,)) is not None
+
+    def get_admins(self):
+        return [row["user_id"] for row in self._all("SELECT user_id FROM admins ORDER BY id")]
+
+    def get_admin_number(self, admin_id):
+        """Получить номер администратора (начиная с 1 для владельца)"""
+        if admin_id == self.owner_id:
+            return "#1 (Владелец)"
+        admins = self.get_admins()
+        if admin_id in admins:
+            return f"#{admins.index(admin_id) + 2}"
+        return "Неизвестно"
+
+    def _generate_password(self, length=12):
+        alphabet = string.ascii_letters + string.digits
+        return ''.join(secrets.choice(alphabet) for _ in range(length))
+
+    def add_admin(self, user_id, password=None):
+        uid = int(user_id)
+        password = password or self._generate_password()
+        with self.conn:
+            cur = self.conn.execute("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", (uid,))
+            if not cur.rowcount:
+                return None
+            self.conn.execute("INSERT OR REPLACE INTO admin_passwords (user_id, password) VALUES (?, ?)",
+                              (uid, password))
+        return password
+
+    def remove_admin(self, user_id):
+        uid = int(user_id)
+        with self.conn:
+            cur = self.conn.execute("DELETE FROM admins WHERE user_id = ?", (uid,))
+            self.conn.execute("DELETE FROM admin_passwords WHERE user_id = ?", (uid,))
+        return cur.rowcount > 0
+
+    def get_admin_password(self, user_id):
+        row = self._one("SELECT password FROM admin_passwords WHERE user_id = ?", (int(user_id),))
+        return row["password"] if row else None
+
+    def set_admin_password(self, user_id, password):
+        if self.is_admin(int(user_id)):
+            self._write("INSERT OR REPLACE INTO admin_passwords (user_id, password) VALUES (?, ?)",
+                        (int(user_id), password))
+            return True
+        return False
+
+    def verify_admin(self, user_id, password):
+        try:
+            if not self.is_admin(user_id):
+                return False
+            stored_password = self.get_admin_password(user_id)
+            return bool(stored_password) and stored_password == password
+        except Exception as e:
+            logger.error(f"Error verifying admin {user_id}: {e}")
+            return False
+
+    # --- Баны ---
+
+    def is_banned(self, user_id):
+        return self._one("SELECT 1 FROM banned WHERE user_id = ?", (int(user_id),)) is not None
+
+    def ban_user(self, user_id, reason="не указана", until=None, admin_id=None):
+        uid = int(user_id)
+        now = datetime.now().isoformat()
+        with self.conn:
+            cur = self.conn.execute("INSERT OR IGNORE INTO banned (user_id) VALUES (?)", (uid,))
+            if not cur.rowcount:
+                return False
+            self.conn.execute("INSERT OR REPLACE INTO ban_reasons (user_id, reason) VALUES (?, ?)", (uid, reason))
+            self.conn.execute("INSERT INTO ban_history (user_id, reason, admin_id, banned_at, until, active) "
+                              "VALUES (?, ?, ?, ?, ?, 1)", (uid, reason, admin_id, now, until))
+            self._add_action(uid, "ban", {"reason": reason, "until": until, "admin_id": admin_id}, admin_id)
+        return True
+
+    def unban_user(self, user_id, admin_id=None, reason=None):
+        uid = int(user_id)
+        with self.conn:
+            cur = self.conn.execute("DELETE FROM banned WHERE user_id = ?", (uid,))
+            if not cur.rowcount:
+                return False
+            self.conn.execute("DELETE FROM ban_reasons WHERE user_id = ?", (uid,))
+            self.conn.execute(
+                "UPDATE ban_history SET active = 0, unbanned_at = ?, unbanned_by = ?, unban_reason = ? "
+                "WHERE id = (SELECT id FROM ban_history WHERE user_id = ? AND active = 1 ORDER BY id LIMIT 1)",
+                (datetime.now().isoformat(), admin_id, reason, uid))
+            self._add_action(uid, "unban", {"admin_id": admin_id, "reason": reason}, admin_id)
+        return True
+
+    def get_expired_bans(self, now=None):
+        now = now or datetime.now()
+        rows = self._all("SELECT DISTINCT user_id FROM ban_history "
+                         "WHERE active = 1 AND until IS NOT NULL AND until <= ? "
+                         "AND user_id IN (SELECT user_id FROM banned)", (now.isoformat(),))
+        return [row["user_id"] for row in rows]
+
+    def next_expiry(self):
+        """Ближайший срок окончания подписки или временного бана"""
+        row = self._one("SELECT MIN(until) AS until FROM ("
+                        "SELECT MIN(until) AS until FROM subscriptions UNION ALL "
+                        "SELECT MIN(until) FROM ban_history WHERE active = 1 AND until IS NOT NULL "
+                        "AND user_id IN (SELECT user_id FROM banned))")
+        try:
+            return datetime.fromisoformat(row["until"])
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _ban_dict(row):
+        ban = {
+            "user_id": row["user_id"],
+            "reason": row["reason"],
+            "admin_id": row["admin_id"],
+            "banned_at": row["banned_at"],
+            "until": row["until"],
+            "active": bool(row["active"])
+        }
+        if row["unbanned_at"]:
+            ban["unbanned_at"] = row["unbanned_at"]
+            ban["unbanned_by"] = row["unbanned_by"]
+            ban["unban_reason"] = row["unban_reason"]
+        return ban
+
+    def get_ban_history(self, user_id):
+        rows = self._all("SELECT * FROM ban_history WHERE user_id = ? ORDER BY id", (int(user_id),))
+        return [self._ban_dict(row) for row in rows]
+
+    # --- История действий ---
+
+    def _add_action(self, user_id, action_type, details, admin_id=None):
+        self.conn.execute("INSERT INTO action_history (user_id, action_type, details, admin_id, timestamp) "
+                          "VALUES (?, ?, ?, ?, ?)",
+                          (int(user_id), action_type, json.dumps(details, ensure_ascii=False), admin_id,
+                           datetime.now().isoformat()))
+
+    def add_action_to_history(self, user_id, action_type, details, admin_id=None):
+        """Добавление действия в историю"""
+        with self.conn:
+            self._add_action(user_id, action_type, details, admin_id)
+
+    def get_user_history(self, user_id):
+        """Получить историю действий пользователя"""
+        rows = self._all("SELECT * FROM action_history WHERE user_id = ? ORDER BY id", (int(user_id),))
+        return [{
+            "user_id": row["user_id"],
+            "action_type": row["action_type"],
+            "details": json.loads(row["details"]) if row["details"] else {},
+            "admin_id": row["admin_id"],
+            "timestamp": row["timestamp"]
+        } for row in rows]
+
+    # --- Статистика ---
+
+    def get_stats(self):
+        row = self._one(
+            "SELECT (SELECT COUNT(*) FROM users) AS total_users, "
+            "(SELECT COUNT(*) FROM messages) AS total_messages, "
+            "(SELECT COUNT(*) FROM banned) AS total_banned, "
+            "(SELECT COUNT(*) FROM subscriptions) AS total_subscriptions, "
+            "(SELECT COUNT(*) FROM protected_users) AS total_protected, "
+            "(SELECT COUNT(*) FROM admins) AS total_admins, "
+            "(SELECT COUNT(*) FROM messages WHERE date >= :today) AS messages_today, "
+            "(SELECT COUNT(*) FROM users WHERE first_seen >= :today) AS users_today",
+            {"today": datetime.now().date().isoformat()})
+        return dict(row)
+
+    def get_stats_etag(self):
+        # Счетчики и так считаются запросом; ETag строится по телу ответа
+        return None
+
+    def get_storage_size(self):
+        return sum(os.path.getsize(name) for name in (self.filename, self.filename + "-wal")
+                   if os.path.exists(name))
+
+
+def _migrate_bot_data(conn, data):
+    for uid, user in data.get("users", {}).items():
+        conn.execute("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?)",
+                     (int(uid), user.get("username"), user.get("full_name"), user.get("first_seen"),
+                      user.get("messages_sent", 0), user.get("messages_received", 0)))
+    for uid, state in data.get("user_states", {}).items():
+        conn.execute("INSERT OR REPLACE INTO user_states VALUES (?, ?)",
+                     (int(uid), json.dumps(state, ensure_ascii=False)))
+    # Старые записи хранились как sender_id / recipient_id / timestamp
+    conn.executemany('INSERT INTO messages ("from", "to", date, content) VALUES (?, ?, ?, ?)',
+                     ((int(m.get("from", m.get("sender_id"))), int(m.get("to", m.get("recipient_id"))),
+                       m.get("date") or m.get("timestamp", ""), m.get("content"))
+                      for m in data.get("messages", [])))
+    conn.executemany("INSERT OR IGNORE INTO banned VALUES (?)", ((int(u),) for u in data.get("banned", [])))
+    conn.executemany("INSERT OR REPLACE INTO ban_reasons VALUES (?, ?)",
+                     ((int(u), r) for u, r in data.get("ban_reasons", {}).items()))
+    conn.executemany("INSERT OR IGNORE INTO protected_users VALUES (?)",
+                     ((int(u),) for u in data.get("protected_users", [])))
+    conn.executemany("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", ((int(u),) for u in data.get("admins", [])))
+    conn.executemany("INSERT OR REPLACE INTO admin_passwords VALUES (?, ?)",
+                     ((int(u), p) for u, p in data.get("admin_passwords", {}).items()))
+    conn.executemany("INSERT OR REPLACE INTO subscriptions VALUES (?, ?)",
+                     ((int(u), until) for u, until in data.get("subscriptions", {}).items()))
+    conn.executemany(
+        "INSERT INTO ban_history (user_id, reason, admin_id, banned_at, until, active, unbanned_at, unbanned_by, "
+        "unban_reason) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((b["user_id"], b.get("reason"), b.get("admin_id"), b.get("banned_at"), b.get("until"),
+          int(bool(b.get("active"))), b.get("unbanned_at"), b.get("unbanned_by"), b.get("unban_reason"))
+         for b in data.get("ban_history", [])))
+    conn.executemany(
+        "INSERT INTO action_history (user_id, action_type, details, admin_id, timestamp) VALUES (?, ?, ?, ?, ?)",
+        ((a["user_id"], a["action_type"], json.dumps(a.get("details", {}), ensure_ascii=False),
+          a.get("admin_id", (a.get("details") or {}).get("admin_id")), a.get("timestamp"))
+         for a in data.get("action_history", [])))
+    conn.executemany("INSERT OR REPLACE INTO statistics VALUES (?, ?)",
+                     data.get("statistics", {}).items())
+
+
+def _load_json_with_journal(filename):
+    """Снимок JSON-базы вместе с еще не свернутым журналом.
+
+    Снимок и журнал читаются под блокировкой журнала, чтобы работающий бот не свернул
+    его между двумя чтениями; сам журнал не сбрасывается и не обрезается.
+    """
+    journal = Journal(filename)
+    with journal.lock():
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        records = journal.peek(data.get(GENERATION_KEY, 0))
+    data.setdefault("messages", [])
+    for record in records:
+        try:
+            apply_record(data, record)
+        except Exception as e:
+            logger.error(f"Error replaying journal record {record}: {e}")
+    if data.get("archived_messages"):
+        # Сообщения, перенесенные в архив, идут перед оставшимися в базе
+        archived = MessageArchive().iter_messages(data["archived_messages"], newest_first=False)
+        data["messages"] = list(archived) + data["messages"]
+    return data
+
+
+def migrate_from_json(sqlite_file=SQLITE_FILE, bot_file="bot_database.json"):
+    """Однократный перенос bot_database.json в SQLite (support_db.json остается в JSON)"""
+    db = SQLiteDatabase(sqlite_file)
+    conn = db.conn
+    if conn.execute("SELECT value FROM meta WHERE key = 'migrated_at'").fetchone():
+        logger.warning(f"{sqlite_file} уже содержит перенесенные данные")
+        return False
+
+    with conn:
+        if os.path.exists(bot_file):
+            _migrate_bot_data(conn, _load_json_with_journal(bot_file))
+            logger.info(f"Перенесены данные из {bot_file}")
+        db._index_messages()
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('migrated_at', ?)", (datetime.now().isoformat(),))
+    return True
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Перенос JSON-базы бота в SQLite")
+    parser.add_argument("--sqlite", default=SQLITE_FILE)
+    parser.add_argument("--bot-db", default="bot_database.json")
+    args = parser.parse_args()
+    migrate_from_json(args.sqlite, args.bot_db)
@@ -0,0 +1,125 @@
+import uuid
+from collections import Counter, deque
+from datetime import date
+from itertools import islice
+from indexes import StoreIndex, parse_message_time
+
+# Сколько последних пользователей и сообщений держать для дашборда
+RECENT_LIMIT = 20
+
+# Ключ базы -> имя счетчика в get_stats()
+TOTALS = {
+    "users": "total_users",
+    "messages": "total_messages",
+    "banned": "total_banned",
+    "subscriptions": "total_subscriptions",
+    "protected_users": "total_protected",
+    "admins": "total_admins"
+}
+
+
+def _day(moment):
+    return moment.date().isoformat() if moment else None
+
+
+def _user_day(user):
+    try:
+        return user["first_seen"][:10]
+    except (KeyError, TypeError):
+        return None
+
+
+class StatsIndex(StoreIndex):
+    """Статистика дашборда, обновляемая по каждой записи журнала.
+
+    Хранит итоговые счетчики, последние RECENT_LIMIT пользователей и позиций
+    сообщений и счетчики по дням, поэтому /api/stats и дашборд не проходят
+    по коллекциям. version растет при каждом изменении и служит ETag.
+    """
+
+    def __init__(self, recent_limit=RECENT_LIMIT):
+        self.recent_limit = recent_limit
+        self.totals = dict.fromkeys(TOTALS.values(), 0)
+        self.recent_users = deque(maxlen=recent_limit)
+        self.recent_messages = deque(maxlen=recent_limit)
+        self.messages_by_day = Counter()
+        self.users_by_day = Counter()
+        # Сообщения, перенесенные в архив, входят в total_messages
+        self.archived = 0
+        # Версия уникальна и между перезапусками процесса
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+
+    @property
+    def etag(self):
+        # messages_today и users_today меняются в полночь и без новых записей
+        return f"{self.epoch}-{self.version}-{date.today().isoformat()}"
+
+    def rebuild(self, data):
+        for key, name in TOTALS.items():
+            self.totals[name] = len(data.get(key, ()))
+        self.archived = data.get("archived_messages", 0)
+        self._rebuild_users(data)
+        self._rebuild_messages(data)
+        self.version += 1
+
+    def _rebuild_users(self, data):
+        users = data["users"]
+        self.recent_users = deque(reversed(list(islice(reversed(users), self.recent_limit))),
+                                  maxlen=self.recent_limit)
+        self.users_by_day = Counter(_user_day(user) for user in users.values())
+
+    def _rebuild_messages(self, data):
+        messages = data["messages"]
+        self.recent_messages = deque(range(max(len(messages) - self.recent_limit, 0), len(messages)),
+                                     maxlen=self.recent_limit)
+        self.messages_by_day = Counter(_day(parse_message_time(message)) for message in messages)
+
+    def apply(self, record, data):
+        path = record["path"]
+        key = path[0]
+        if key == "archived_messages":
+            self.archived = data[key]
+            self.version += 1
+            return
+        if key not in TOTALS:
+            return
+        name = TOTALS[key]
+        total = len(data[key])
+
+        if key == "messages":
+            if record["op"] == "append" and len(path) == 1:
+                self.recent_messages.append(total - 1)
+                self.messages_by_day[_day(parse_message_time(record["value"]))] += 1
+            else:
+                self._rebuild_messages(data)
+        elif key == "users":
+            if len(path) == 2 and record["op"] == "set" and total > self.totals[name]:
+                self.recent_users.append(path[1])
+                self.users_by_day[_user_day(record["value"])] += 1
+            elif len(path) <= 2:
+                self._rebuild_users(data)
+            else:
+                # Изменение полей пользователя (имя, счетчики) на статистику не влияет
+                return
+        elif total == self.totals[name]:
+            return
+
+        self.totals[name] = total
+        self.version += 1
+
+    def snapshot(self, today=None):
+        day = (today or date.today()).isoformat()
+        return dict(self.totals,
+                    total_messages=self.totals["total_messages"] + self.archived,
+                    messages_today=self.messages_by_day.get(day, 0),
+                    users_today=self.users_by_day.get(day, 0))
+
+    def recent(self, data, limit=5):
+        """Последние limit пользователей (по порядку регистрации) и сообщений (от новых к старым)"""
+        users = data["users"]
+        messages = data["messages"]
+        recent_users = [(uid, users[uid]) for uid in list(self.recent_users)[-limit:] if uid in users]
+        recent_messages = [messages[p] for p in reversed(list(self.recent_messages)[-limit:])
+                           if p < len(messages)]
+        return recent_users, recent_messages
@@ -1,270 +1,497 @@
-import logging
-import json
-import os
-from datetime import datetime
-from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
-from telegram.constants import ChatType
-
-# Загрузка конфигурации
-load_dotenv()
-TOKEN = os.getenv("SUPPORT_BOT_TOKEN")
-SUPPORT_CHAT_ID = int(os.getenv("SUPPORT_CHAT_ID"))
-OWNER_ID = int(os.getenv("OWNER_ID"))
-DB_FILE = "support_db.json"
-
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-
-class SupportDB:
-    def __init__(self, filename):
-        self.filename = filename
-        self.data = self.load()
-
-    def load(self):
-        if os.path.exists(self.filename):
-            try:
-                with open(self.filename, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # Инициализация ключей
-                    for key in ["tickets", "active_chats", "banned", "agents", "ban_reasons", "user_metadata"]:
-                        if key not in data:
-                            data[key] = {} if key != "banned" else []
-                    return data
-            except:
-                pass
-        return {"tickets": {}, "active_chats": {}, "banned": [], "agents": {}, "ban_reasons": {}, "user_metadata": {}}
-
-    def save(self):
-        with open(self.filename, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
-
-    def register_user(self, user):
-        uid = str(user.id)
-        if uid not in self.data["user_metadata"]:
-            self.data["user_metadata"][uid] = {
-                "username": user.username,
-                "ticket_count": 0
-            }
-        else:
-            self.data["user_metadata"][uid]["username"] = user.username
-        self.save()
-
-    def increment_ticket(self, user_id):
-        uid = str(user_id)
-        if uid in self.data["user_metadata"]:
-            self.data["user_metadata"][uid]["ticket_count"] += 1
-            self.save()
-
-
-db = SupportDB(DB_FILE)
-
-
-# --- КЛАВИАТУРЫ ---
-def get_admin_kb(uid, is_closed=False):
-    uid_str = str(uid)
-    buttons = []
-    if not is_closed:
-        is_active = uid_str in db.data.get("active_chats", {})
-        if not is_active:
-            buttons.append([InlineKeyboardButton("👨‍💻 Рассмотреть", callback_data=f"take_{uid}")])
-        buttons.append([InlineKeyboardButton("✅ Закрыть", callback_data=f"close_{uid}")])
-
-    is_banned = int(uid) in db.data.get("banned", [])
-    ban_btn_text = "🔑 Разблокировать" if is_banned else "🔑 Заблокировать"
-    ban_callback = f"unban_{uid}" if is_banned else f"ban_{uid}"
-    buttons.append([InlineKeyboardButton(ban_btn_text, callback_data=ban_callback)])
-    return InlineKeyboardMarkup(buttons)
-
-
-def get_owner_kb():
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("👥 Все пользователи", callback_data="adm_users_list")],
-        [InlineKeyboardButton("🛠 Добавить агента", callback_data="adm_request")],
-        [InlineKeyboardButton("🎧 Список агентов", callback_data="adm_list")],
-        [InlineKeyboardButton("📊 Статистика", callback_data="adm_stats")]
-    ])
-
-
-def get_user_close_kb():
-    return InlineKeyboardMarkup([[InlineKeyboardButton("✅ Закрыть обращение", callback_data="user_close_self")]])
-
-
-# --- ХЕНДЛЕРЫ ---
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_chat.type != ChatType.PRIVATE: return
-    user = update.effective_user
-    db.register_user(user)
-    await update.message.reply_text("👋 Здравствуйте! Опишите вашу проблему.")
-
-
-async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID: return
-    await update.message.reply_text("🛠 <b>Панель управления</b>", parse_mode="HTML", reply_markup=get_owner_kb())
-
-
-async def handle_msg(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    chat = update.effective_chat
-    uid_str = str(user.id)
-
-    # Проверка бана
-    if chat.type == ChatType.PRIVATE and user.id in db.data.get("banned", []):
-        await update.message.reply_text("🔑 Вы заблокированы в поддержке.")
-        return
-
-    # Добавление агента владельцем
-    if chat.id == SUPPORT_CHAT_ID and user.id == OWNER_ID and context.user_data.get('waiting_agent'):
-        agent_id = update.message.text.strip()
-        if agent_id.isdigit():
-            num = len(db.data["agents"]) + 1
-            db.data["agents"][agent_id] = {"num": num, "replies": 0, "bans": 0}
-            db.save()
-            await update.message.reply_text(f"✅ Агент #{num} добавлен.")
-        context.user_data['waiting_agent'] = False
-        return
-
-    # Причина бана
-    if chat.id == SUPPORT_CHAT_ID and context.user_data.get('waiting_ban_reason'):
-        target_uid = context.user_data.get('ban_target')
-        reason = update.message.text
-        agent = db.data["agents"].get(uid_str)
-        if agent:
-            db.data["banned"].append(int(target_uid))
-            db.data["ban_reasons"][str(target_uid)] = {"reason": reason, "agent_num": agent["num"]}
-            agent["bans"] += 1
-            db.save()
-            try:
-                await context.bot.send_message(int(target_uid), f"🔑 Вы заблокированы. Причина: {reason}")
-            except:
-                pass
-            await update.message.reply_text(f"🔑 Пользователь заблокирован агентом #{agent['num']}")
-        context.user_data['waiting_ban_reason'] = False
-        return
-
-    # Пересылка сообщения пользователю
-    if chat.id == SUPPORT_CHAT_ID:
-        if not update.message.message_thread_id or update.message.message_thread_id == 1: return
-        target_uid = next(
-            (u for u, info in db.data["tickets"].items() if info.get("thread_id") == update.message.message_thread_id),
-            None)
-        if target_uid and uid_str in db.data["agents"]:
-            try:
-                await context.bot.copy_message(chat_id=int(target_uid), from_chat_id=SUPPORT_CHAT_ID,
-                                               message_id=update.message.id)
-                db.data["agents"][uid_str]["replies"] += 1
-                db.save()
-            except:
-                pass
-
-    # Создание обращения (Скрин №1)
-    elif chat.type == ChatType.PRIVATE:
-        if uid_str not in db.data["tickets"] or db.data["tickets"][uid_str].get("status") == "closed":
-            db.increment_ticket(user.id)
-            topic = await context.bot.create_forum_topic(chat_id=SUPPORT_CHAT_ID, name=f"{user.id} | {user.first_name}")
-
-            # Сообщение с кнопками в топик (как на скрине №1)
-            sent_msg = await context.bot.send_message(
-                SUPPORT_CHAT_ID,
-                message_thread_id=topic.message_thread_id,
-                text=f"🆕 <b>Новое обращение</b>\nID: <code>{user.id}</code>\nЮзер: @{user.username}",
-                parse_mode="HTML",
-                reply_markup=get_admin_kb(uid_str)
-            )
-
-            db.data["tickets"][uid_str] = {"thread_id": topic.message_thread_id, "status": "open",
-                                           "admin_msg_id": sent_msg.message_id}
-            db.save()
-            await update.message.reply_text("✅ Ваше обращение создано.", reply_markup=get_user_close_kb())
-
-        await context.bot.copy_message(chat_id=SUPPORT_CHAT_ID,
-                                       message_thread_id=db.data["tickets"][uid_str]["thread_id"], from_chat_id=user.id,
-                                       message_id=update.message.id)
-
-
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    user_id = query.from_user.id
-    uid_str = str(user_id)
-    data = query.data
-    await query.answer()
-
-    # Закрытие пользователем
-    if data == "user_close_self":
-        ticket = db.data["tickets"].get(uid_str)
-        if ticket and ticket["status"] == "open":
-            db.data["tickets"][uid_str]["status"] = "closed"
-            db.data["active_chats"].pop(uid_str, None)
-            db.save()
-            await query.edit_message_text("🔴 Вы закрыли обращение.")
-            await context.bot.send_message(SUPPORT_CHAT_ID, message_thread_id=ticket["thread_id"],
-                                           text="⚪️ Пользователь закрыл обращение.")
-            await context.bot.close_forum_topic(SUPPORT_CHAT_ID, ticket["thread_id"])
-            if ticket.get("admin_msg_id"):
-                try:
-                    await context.bot.edit_message_reply_markup(SUPPORT_CHAT_ID, ticket["admin_msg_id"],
-                                                                reply_markup=get_admin_kb(uid_str, True))
-                except:
-                    pass
-        return
-
-    # Админские функции (Скрин №2)
-    if data.startswith("adm_"):
-        if user_id != OWNER_ID: return
-        if data == "adm_users_list":
-            users = db.data.get("user_metadata", {})
-            res = "👥 <b>Список пользователей:</b>\n\n"
-            for uid, info in users.items():
-                status = "🔴 (BANNED)" if int(uid) in db.data["banned"] else ""
-                res += f"• <code>{uid}</code> | @{info.get('username')} | Обращений: {info.get('ticket_count')} {status}\n"
-            await query.message.reply_text(res, parse_mode="HTML")
-        elif data == "adm_request":
-            context.user_data['waiting_agent'] = True
-            await query.message.reply_text("Введите ID агента:")
-        return
-
-    # Действия агентов
-    if uid_str not in db.data["agents"]: return
-    action, target_uid = data.split("_")
-    agent = db.data["agents"][uid_str]
-
-    if action == "take":
-        db.data["active_chats"][target_uid] = {"agent_num": agent["num"]}
-        db.save()
-        await query.message.edit_reply_markup(reply_markup=get_admin_kb(target_uid))
-        await context.bot.send_message(SUPPORT_CHAT_ID, message_thread_id=query.message.message_thread_id,
-                                       text=f"👨‍💻 Агент #{agent['num']} взял обращение.")
-
-    elif action == "close":
-        ticket = db.data["tickets"][target_uid]
-        db.data["tickets"][target_uid]["status"] = "closed"
-        db.data["active_chats"].pop(target_uid, None)
-        db.save()
-        await query.message.edit_reply_markup(reply_markup=get_admin_kb(target_uid, True))
-        await context.bot.close_forum_topic(SUPPORT_CHAT_ID, ticket["thread_id"])
-
-    elif action == "ban":
-        context.user_data.update(
-            {'waiting_ban_reason': True, 'ban_target': target_uid, 'ban_msg_id': query.message.message_id})
-        await context.bot.send_message(SUPPORT_CHAT_ID, message_thread_id=query.message.message_thread_id,
-                                       text="📝 Введите причину бана:")
-
-    elif action == "unban":
-        if int(target_uid) in db.data["banned"]:
-            db.data["banned"].remove(int(target_uid))
-            db.save()
-            await query.message.edit_reply_markup(reply_markup=get_admin_kb(target_uid))
-
-
-def main():
-    app = Application.builder().token(TOKEN).build()
-    app.add_handler(CommandHandler("admin", admin_command))
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CallbackQueryHandler(button_handler))
-    app.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, handle_msg))
-    app.run_polling()
-
-
-if __name__ == '__main__': main()
\ No newline at end of file
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram.constants import ChatType
+from timeseries import TimeSeriesStore
+from journal import JournaledStore, Journal, load_snapshot, flush_job, flush_on_shutdown
+from indexes import MembershipIndex, UserOrderIndex, PageCache
+from tickets import TicketIndex, AgentLoadIndex, TicketArchive, TICKET_RETENTION_DAYS, new_ticket, migrate_tickets, \
+    OPEN, TAKEN, CLOSED
+from bot_integration import TimedRequest
+import metrics
+from metrics import timed_handler
+
+# Загрузка конфигурации
+load_dotenv()
+TOKEN = os.getenv("SUPPORT_BOT_TOKEN")
+SUPPORT_CHAT_ID = int(os.getenv("SUPPORT_CHAT_ID"))
+OWNER_ID = int(os.getenv("OWNER_ID"))
+DB_FILE = "support_db.json"
+# Изменения копятся в памяти и пишутся в support_db.journal одним блоком не чаще раза в
+# SUPPORT_FLUSH_INTERVAL_MS; 0 — писать при каждом save()
+FLUSH_INTERVAL = int(os.getenv("SUPPORT_FLUSH_INTERVAL_MS", 250)) / 1000
+# Редкая запись может позволить себе fsync
+FSYNC = os.getenv("SUPPORT_FSYNC", "1" if FLUSH_INTERVAL else "0") == "1"
+# Локальный порт /metrics бота поддержки; 0 — не открывать
+METRICS_PORT = int(os.getenv("SUPPORT_METRICS_PORT", 9102))
+# Новые обращения сразу назначаются наименее загруженному агенту из тех, кто на связи
+AUTO_ASSIGN = os.getenv("SUPPORT_AUTO_ASSIGN", "1") == "1"
+# Агент на связи, если писал в чат поддержки или нажимал кнопки за последние AGENT_ONLINE_MINUTES
+AGENT_ONLINE_MINUTES = int(os.getenv("AGENT_ONLINE_MINUTES", 30))
+# Пользователей на странице списка: 20 строк по ~100 символов укладываются в лимит сообщения Telegram (4096)
+USERS_PAGE_SIZE = 20
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FIRST_RESPONSE_SECONDS = metrics.histogram("support_first_response_seconds",
+                                           "Время от создания обращения до первого ответа агента",
+                                           buckets=(10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400))
+AUTO_ASSIGNED = metrics.counter("support_auto_assigned_total", "Обращения, назначенные агенту автоматически")
+
+
+class SupportDB(JournaledStore):
+    """support_db.json с журналом: ответ агента или новое обращение дописывают пару строк в support_db.journal"""
+
+    def __init__(self, filename, flush_interval=0):
+        self.filename = filename
+        self.journal = Journal(filename, fsync=FSYNC)
+        self.lock = threading.RLock()
+        self.flush_interval = flush_interval
+        self.members = MembershipIndex()
+        self.tickets = TicketIndex()
+        self.loads = AgentLoadIndex()
+        self.user_order = UserOrderIndex("user_metadata")
+        self.users_pages = PageCache(["user_metadata", "banned"])
+        self.indexes = [self.members, self.tickets, self.loads, self.user_order, self.users_pages]
+        self.migrated = False
+        self.reload()
+        if self.migrated:
+            self.compact()
+
+    def load(self):
+        if os.path.exists(self.filename):
+            try:
+                data = load_snapshot(self.filename)
+                # Инициализация ключей
+                for key in ["tickets", "active_chats", "banned", "agents", "ban_reasons", "user_metadata"]:
+                    if key not in data:
+                        data[key] = {} if key != "banned" else []
+                if "ticket_seq" not in data:
+                    migrate_tickets(data)
+                    self.migrated = True
+                return data
+            except Exception as e:
+                logger.error(f"Ошибка загрузки {self.filename}: {e}")
+        return {"tickets": {}, "ticket_seq": 0, "active_chats": {}, "banned": [], "agents": {}, "ban_reasons": {},
+                "user_metadata": {}}
+
+    def is_banned(self, user_id):
+        return self.members.contains("banned", user_id)
+
+    def ban(self, user_id, reason, agent_id):
+        uid = int(user_id)
+        agent = self.data["agents"][str(agent_id)]
+        if not self.is_banned(uid):
+            self.append_value(["banned"], uid)
+        self.set_value(["ban_reasons", str(uid)], {"reason": reason, "agent_num": agent["num"]})
+        self.increment(["agents", str(agent_id), "bans"])
+        self.save()
+        return agent["num"]
+
+    def unban(self, user_id):
+        uid = int(user_id)
+        if self.is_banned(uid):
+            self.remove_value(["banned"], uid)
+            self.save()
+            return True
+        return False
+
+    def add_agent(self, agent_id):
+        num = len(self.data["agents"]) + 1
+        self.set_value(["agents", str(agent_id)], {"num": num, "replies": 0, "bans": 0})
+        self.save()
+        return num
+
+    def count_reply(self, agent_id, user_id):
+        """Ответ агента пользователю; первый ответ по обращению попадает в метрику времени реакции"""
+        self.increment(["agents", str(agent_id), "replies"])
+        ticket = self.current_ticket(user_id)
+        if ticket and not ticket.get("first_response_at"):
+            now = datetime.now()
+            self.set_value(["tickets", str(ticket["id"]), "first_response_at"], now.isoformat())
+            if ticket["opened_at"]:
+                FIRST_RESPONSE_SECONDS.observe((now - datetime.fromisoformat(ticket["opened_at"])).total_seconds())
+        self.save()
+
+    def register_user(self, user):
+        uid = str(user.id)
+        info = self.data["user_metadata"].get(uid)
+        if info is None:
+            self.set_value(["user_metadata", uid], {"username": user.username, "ticket_count": 0})
+        elif info.get("username") != user.username:
+            self.set_value(["user_metadata", uid, "username"], user.username)
+        else:
+            return
+        self.save()
+
+    def increment_ticket(self, user_id):
+        uid = str(user_id)
+        if uid in self.data["user_metadata"]:
+            self.increment(["user_metadata", uid, "ticket_count"])
+            self.save()
+
+    def current_ticket(self, user_id):
+        """Последнее обращение пользователя (в том числе закрытое) или None"""
+        ticket_id = self.tickets.current.get(str(user_id))
+        return None if ticket_id is None else self.data["tickets"][ticket_id]
+
+    def open_ticket(self, user_id, thread_id, admin_msg_id, agent_num=None):
+        """Новое обращение; с agent_num оно сразу в работе у этого агента"""
+        ticket_id = self.data["ticket_seq"] + 1
+        self.increment(["ticket_seq"])
+        self.set_value(["tickets", str(ticket_id)], new_ticket(ticket_id, user_id, thread_id, admin_msg_id, agent_num))
+        if agent_num is not None:
+            self.set_value(["active_chats", str(user_id)], {"agent_num": agent_num})
+        self.save()
+        return self.data["tickets"][str(ticket_id)]
+
+    def set_admin_message(self, ticket, admin_msg_id):
+        self.set_value(["tickets", str(ticket["id"]), "admin_msg_id"], admin_msg_id)
+        self.save()
+
+    def ticket_user(self, thread_id):
+        """Пользователь, чье текущее обращение ведется в топике thread_id, или None"""
+        ticket_id = self.tickets.threads.get(thread_id)
+        if ticket_id is None:
+            return None
+        uid = self.data["tickets"][ticket_id]["user_id"]
+        # Топик прошлого обращения пользователя больше не пересылается
+        return uid if self.tickets.current.get(uid) == ticket_id else None
+
+    def _set_status(self, ticket, status, by=None):
+        path = ["tickets", str(ticket["id"])]
+        now = datetime.now().isoformat()
+        self.set_value(path + ["status"], status)
+        if status == CLOSED:
+            self.set_value(path + ["closed_at"], now)
+        self.append_value(path + ["history"], {"status": status, "at": now, "by": by})
+
+    def take_ticket(self, user_id, agent_num):
+        """Взять открытое обращение; возвращает номер агента, у которого оно в работе, или None, если закрыто"""
+        uid = str(user_id)
+        ticket = self.current_ticket(uid)
+        if ticket is None or ticket["status"] == CLOSED:
+            return None
+        chat = self.data["active_chats"].get(uid)
+        if chat is not None:
+            return chat["agent_num"]
+        self.set_value(["active_chats", uid], {"agent_num": agent_num})
+        self._set_status(ticket, TAKEN, agent_num)
+        self.save()
+        return agent_num
+
+    def close_ticket(self, user_id, by=None):
+        """Закрытие текущего обращения; by — номер агента, None — сам пользователь"""
+        uid = str(user_id)
+        ticket = self.current_ticket(uid)
+        if ticket is None or ticket["status"] == CLOSED:
+            return None
+        self._set_status(ticket, CLOSED, by)
+        if uid in self.data["active_chats"]:
+            self.delete_value(["active_chats", uid])
+        self.save()
+        return ticket
+
+    def open_tickets(self):
+        """Незакрытые обращения без перебора истории"""
+        return [self.data["tickets"][ticket_id] for ticket_id in self.tickets.open]
+
+    def queue_depth(self):
+        """Обращения, которые еще не взял ни один агент"""
+        return sum(1 for ticket in self.open_tickets() if ticket["status"] == OPEN)
+
+    async def archive_closed(self, archive, before):
+        """Перенос обращений, закрытых раньше before, в сегмент архива (запись файлов — в потоке)"""
+        cutoff = before.isoformat()
+        closed = [ticket for ticket_id, ticket in self.data["tickets"].items()
+                  if ticket_id not in self.tickets.open and (ticket["closed_at"] or "") < cutoff]
+        if not closed:
+            return 0
+        closed.sort(key=lambda ticket: ticket["id"])
+        await asyncio.to_thread(archive.write, closed)
+        for ticket in closed:
+            self.delete_value(["tickets", str(ticket["id"])])
+        await self.compact_in_background()
+        return len(closed)
+
+
+db = SupportDB(DB_FILE, flush_interval=FLUSH_INTERVAL)
+timeseries = TimeSeriesStore(flush_interval=FLUSH_INTERVAL)
+# Время последнего действия агента (id → time.monotonic()); присутствие не сохраняется между перезапусками
+agents_seen = {}
+
+
+def mark_agent_seen(agent_id):
+    agents_seen[str(agent_id)] = time.monotonic()
+
+
+def online_agents():
+    """Номера агентов на связи"""
+    since = time.monotonic() - AGENT_ONLINE_MINUTES * 60
+    return [agent["num"] for agent_id, agent in db.data["agents"].items() if agents_seen.get(agent_id, since) > since]
+
+
+def pick_agent():
+    """Наименее загруженный агент на связи или None (обращение ждет в очереди)"""
+    return db.loads.least_loaded(online_agents()) if AUTO_ASSIGN else None
+
+
+metrics.gauge("support_queue_depth", "Обращения без агента", fn=db.queue_depth)
+metrics.gauge("support_open_tickets", "Незакрытые обращения", fn=lambda: len(db.tickets.open))
+metrics.gauge("support_agents_online", "Агенты на связи", fn=lambda: len(online_agents()))
+
+
+# --- КЛАВИАТУРЫ ---
+def get_admin_kb(uid, is_closed=False):
+    uid_str = str(uid)
+    buttons = []
+    if not is_closed:
+        is_active = uid_str in db.data.get("active_chats", {})
+        if not is_active:
+            buttons.append([InlineKeyboardButton("👨‍💻 Рассмотреть", callback_data=f"take_{uid}")])
+        buttons.append([InlineKeyboardButton("✅ Закрыть", callback_data=f"close_{uid}")])
+
+    is_banned = db.is_banned(uid)
+    ban_btn_text = "🔑 Разблокировать" if is_banned else "🔑 Заблокировать"
+    ban_callback = f"unban_{uid}" if is_banned else f"ban_{uid}"
+    buttons.append([InlineKeyboardButton(ban_btn_text, callback_data=ban_callback)])
+    return InlineKeyboardMarkup(buttons)
+
+
+def get_owner_kb():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("👥 Все пользователи", callback_data="adm_users_list")],
+        [InlineKeyboardButton("🛠 Добавить агента", callback_data="adm_request")],
+        [InlineKeyboardButton("🎧 Список агентов", callback_data="adm_list")],
+        [InlineKeyboardButton("📊 Статистика", callback_data="adm_stats")]
+    ])
+
+
+def get_user_close_kb():
+    return InlineKeyboardMarkup([[InlineKeyboardButton("✅ Закрыть обращение", callback_data="user_close_self")]])
+
+
+def get_users_page_kb(page, pages):
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"adm_users_page_{page - 1}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton("Вперед ▶️", callback_data=f"adm_users_page_{page + 1}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def users_page_count():
+    return max((len(db.user_order.order) + USERS_PAGE_SIZE - 1) // USERS_PAGE_SIZE, 1)
+
+
+def render_users_page(page):
+    """Текст страницы списка пользователей: только USERS_PAGE_SIZE записей из индекса порядка регистрации"""
+    order = db.user_order.order
+    pages = users_page_count()
+    res = f"👥 <b>Список пользователей</b> ({len(order)}, стр. {page + 1}/{pages}):\n\n"
+    for uid in order[page * USERS_PAGE_SIZE:(page + 1) * USERS_PAGE_SIZE]:
+        info = db.data["user_metadata"][uid]
+        status = "🔴 (BANNED)" if db.is_banned(uid) else ""
+        res += f"• <code>{uid}</code> | @{info.get('username')} | Обращений: {info.get('ticket_count')} {status}\n"
+    return res, pages
+
+
+# --- ХЕНДЛЕРЫ ---
+@timed_handler("start")
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.type != ChatType.PRIVATE: return
+    user = update.effective_user
+    db.register_user(user)
+    await update.message.reply_text("👋 Здравствуйте! Опишите вашу проблему.")
+
+
+@timed_handler("admin_command")
+async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != OWNER_ID: return
+    await update.message.reply_text("🛠 <b>Панель управления</b>", parse_mode="HTML", reply_markup=get_owner_kb())
+
+
+@timed_handler("handle_msg")
+async def handle_msg(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    chat = update.effective_chat
+    uid_str = str(user.id)
+
+    # Проверка бана
+    if chat.type == ChatType.PRIVATE and db.is_banned(user.id):
+        await update.message.reply_text("🔑 Вы заблокированы в поддержке.")
+        return
+
+    # Добавление агента владельцем
+    if chat.id == SUPPORT_CHAT_ID and user.id == OWNER_ID and context.user_data.get('waiting_agent'):
+        agent_id = update.message.text.strip()
+        if agent_id.isdigit():
+            num = db.add_agent(agent_id)
+            await update.message.reply_text(f"✅ Агент #{num} добавлен.")
+        context.user_data['waiting_agent'] = False
+        return
+
+    # Причина бана
+    if chat.id == SUPPORT_CHAT_ID and context.user_data.get('waiting_ban_reason'):
+        target_uid = context.user_data.get('ban_target')
+        reason = update.message.text
+        if uid_str in db.data["agents"]:
+            agent_num = db.ban(target_uid, reason, uid_str)
+            try:
+                await context.bot.send_message(int(target_uid), f"🔑 Вы заблокированы. Причина: {reason}")
+            except:
+                pass
+            await update.message.reply_text(f"🔑 Пользователь заблокирован агентом #{agent_num}")
+        context.user_data['waiting_ban_reason'] = False
+        return
+
+    # Пересылка сообщения пользователю
+    if chat.id == SUPPORT_CHAT_ID:
+        if uid_str in db.data["agents"]:
+            mark_agent_seen(uid_str)
+        if not update.message.message_thread_id or update.message.message_thread_id == 1: return
+        target_uid = db.ticket_user(update.message.message_thread_id)
+        if target_uid and uid_str in db.data["agents"]:
+            try:
+                await context.bot.copy_message(chat_id=int(target_uid), from_chat_id=SUPPORT_CHAT_ID,
+                                               message_id=update.message.id)
+                db.count_reply(uid_str, target_uid)
+            except:
+                pass
+
+    # Создание обращения (Скрин №1)
+    elif chat.type == ChatType.PRIVATE:
+        ticket = db.current_ticket(uid_str)
+        if ticket is None or ticket["status"] == CLOSED:
+            db.increment_ticket(user.id)
+            timeseries.track("tickets")
+            topic = await context.bot.create_forum_topic(chat_id=SUPPORT_CHAT_ID, name=f"{user.id} | {user.first_name}")
+            agent_num = pick_agent()
+            ticket = db.open_ticket(uid_str, topic.message_thread_id, None, agent_num)
+            text = f"🆕 <b>Новое обращение</b>\nID: <code>{user.id}</code>\nЮзер: @{user.username}"
+            if agent_num is not None:
+                AUTO_ASSIGNED.inc()
+                text += f"\n👨‍💻 Назначено агенту #{agent_num}"
+
+            # Сообщение с кнопками в топик (как на скрине №1)
+            sent_msg = await context.bot.send_message(
+                SUPPORT_CHAT_ID,
+                message_thread_id=topic.message_thread_id,
+                text=text,
+                parse_mode="HTML",
+                reply_markup=get_admin_kb(uid_str)
+            )
+
+            db.set_admin_message(ticket, sent_msg.message_id)
+            await update.message.reply_text("✅ Ваше обращение создано.", reply_markup=get_user_close_kb())
+
+        await context.bot.copy_message(chat_id=SUPPORT_CHAT_ID, message_thread_id=ticket["thread_id"],
+                                       from_chat_id=user.id, message_id=update.message.id)
+
+
+@timed_handler("button_handler")
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    user_id = query.from_user.id
+    uid_str = str(user_id)
+    data = query.data
+    await query.answer()
+
+    # Закрытие пользователем
+    if data == "user_close_self":
+        ticket = db.close_ticket(uid_str)
+        if ticket:
+            await query.edit_message_text("🔴 Вы закрыли обращение.")
+            await context.bot.send_message(SUPPORT_CHAT_ID, message_thread_id=ticket["thread_id"],
+                                           text="⚪️ Пользователь закрыл обращение.")
+            await context.bot.close_forum_topic(SUPPORT_CHAT_ID, ticket["thread_id"])
+            if ticket.get("admin_msg_id"):
+                try:
+                    await context.bot.edit_message_reply_markup(SUPPORT_CHAT_ID, ticket["admin_msg_id"],
+                                                                reply_markup=get_admin_kb(uid_str, True))
+                except:
+                    pass
+        return
+
+    # Админские функции (Скрин №2)
+    if data.startswith("adm_"):
+        if user_id != OWNER_ID: return
+        if data == "adm_users_list":
+            res, pages = db.users_pages.get(0, render_users_page)
+            await query.message.reply_text(res, parse_mode="HTML", reply_markup=get_users_page_kb(0, pages))
+        elif data.startswith("adm_users_page_"):
+            page = min(max(int(data.rsplit("_", 1)[1]), 0), users_page_count() - 1)
+            res, pages = db.users_pages.get(page, render_users_page)
+            await query.edit_message_text(res, parse_mode="HTML", reply_markup=get_users_page_kb(page, pages))
+        elif data == "adm_request":
+            context.user_data['waiting_agent'] = True
+            await query.message.reply_text("Введите ID агента:")
+        return
+
+    # Действия агентов
+    if uid_str not in db.data["agents"]: return
+    mark_agent_seen(uid_str)
+    action, target_uid = data.split("_")
+    agent = db.data["agents"][uid_str]
+
+    if action == "take":
+        owner = db.take_ticket(target_uid, agent["num"])
+        if owner is None:
+            text = "⚪️ Обращение уже закрыто."
+        elif owner != agent["num"]:
+            text = f"👨‍💻 Обращение уже в работе у агента #{owner}."
+        else:
+            text = f"👨‍💻 Агент #{agent['num']} взял обращение."
+        await query.message.edit_reply_markup(reply_markup=get_admin_kb(target_uid, owner is None))
+        await context.bot.send_message(SUPPORT_CHAT_ID, message_thread_id=query.message.message_thread_id, text=text)
+
+    elif action == "close":
+        ticket = db.close_ticket(target_uid, agent["num"])
+        if ticket is None: return
+        await query.message.edit_reply_markup(reply_markup=get_admin_kb(target_uid, True))
+        await context.bot.close_forum_topic(SUPPORT_CHAT_ID, ticket["thread_id"])
+
+    elif action == "ban":
+        context.user_data.update(
+            {'waiting_ban_reason': True, 'ban_target': target_uid, 'ban_msg_id': query.message.message_id})
+        await context.bot.send_message(SUPPORT_CHAT_ID, message_thread_id=query.message.message_thread_id,
+                                       text="📝 Введите причину бана:")
+
+    elif action == "unban":
+        if db.unban(target_uid):
+            await query.message.edit_reply_markup(reply_markup=get_admin_kb(target_uid))
+
+
+@timed_handler("archive_task")
+async def archive_task(context: ContextTypes.DEFAULT_TYPE):
+    """Перенос давно закрытых обращений из support_db.json в архив"""
+    try:
+        await db.archive_closed(TicketArchive(), datetime.now() - timedelta(days=TICKET_RETENTION_DAYS))
+    except Exception as e:
+        logger.error(f"Ошибка архивирования обращений: {e}")
+
+
+def main():
+    # Пул соединений как у ApplicationBuilder по умолчанию
+    app = Application.builder().token(TOKEN).request(TimedRequest(connection_pool_size=256)) \
+        .post_shutdown(flush_on_shutdown(db, timeseries)).build()
+    metrics.serve(METRICS_PORT)
+    if FLUSH_INTERVAL:
+        app.job_queue.run_repeating(flush_job(db, timeseries), interval=FLUSH_INTERVAL, first=FLUSH_INTERVAL)
+    app.add_handler(CommandHandler("admin", admin_command))
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CallbackQueryHandler(button_handler))
+    app.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, handle_msg))
+    if TICKET_RETENTION_DAYS:
+        app.job_queue.run_repeating(archive_task, interval=3600, first=60)
+    app.run_polling()
+
+
+if __name__ == '__main__': main()
@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("SUPPORT_CHAT_ID", "-100")
+os.environ.setdefault("METRICS_ENABLED", "0")
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Пустой рабочий каталог: базы, журналы и архивы создаются в нем"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,57 @@
+import asyncio
+from datetime import datetime
+from archive import MessageArchive
+from journal import write_sections
+
+
+def _messages():
+    # Два дня по три сообщения; у второго сообщения нет даты — оно попадает в день предыдущего
+    messages = []
+    for day in (1, 2):
+        for minute in range(3):
+            messages.append({"from": day * 10 + minute, "to": 1, "date": f"2026-01-0{day}T00:0{minute}:00",
+                             "content": f"день {day} сообщение {minute}"})
+    del messages[1]["date"]
+    return messages
+
+
+def test_archive_segments_by_day_and_queries(workdir):
+    archive = MessageArchive("archive")
+    archive.write(_messages(), first_id=100)
+    assert [(s["day"], s["first_id"], s["last_id"]) for s in archive.segments] == \
+           [("2026-01-01", 100, 102), ("2026-01-02", 103, 105)]
+
+    assert [m["id"] for m in archive.iter_messages(106)] == [105, 104, 103, 102, 101, 100]
+    # Сообщения, которые база еще не отрезала (id >= end), не возвращаются
+    assert [m["id"] for m in archive.iter_messages(104, newest_first=False)] == [100, 101, 102, 103]
+    assert [m["id"] for m in archive.iter_messages(106, before=104, after=100)] == [103, 102, 101]
+    since = datetime(2026, 1, 2, 0, 1)
+    assert [m["id"] for m in archive.iter_messages(106, since=since)] == [105, 104]
+    assert archive.count(106) == 6 and archive.count(106, since=since) == 2
+    # Сегмент целиком в диапазоне считается по манифесту, вместе с сообщением без даты
+    assert archive.count(106, until=datetime(2026, 1, 2)) == 3 and archive.count(102) == 2
+
+    assert [m["id"] for m in archive.user_messages(106, 21)] == [104]
+    assert [m["id"] for m in archive.user_messages(106, 1, before=102)] == [101, 100]
+    # Короткое слово ищется только целиком: "2" находит и "сообщение 2" первого дня
+    assert [m["id"] for m in archive.search(106, "ДЕНЬ 2 сооб")] == [105, 104, 103, 102]
+    assert archive.search(106, "сообщение неттакого") == []
+
+    # Повторный перенос после сбоя перезаписывает сегменты, а не дублирует их
+    archive.write(_messages()[:3], first_id=100)
+    assert len(MessageArchive("archive").segments) == 2 and archive.count(106) == 6
+
+
+def test_bot_database_moves_old_messages_to_archive(workdir):
+    import bot
+    write_sections("bot_database.json", {"messages": _messages()})
+    db = bot.Database("bot_database.json")
+    archive = MessageArchive("archive")
+
+    assert asyncio.run(db.archive_messages(archive, datetime(2026, 1, 2))) == 3
+    assert [m["content"] for m in db.data["messages"]] == [f"день 2 сообщение {i}" for i in range(3)]
+    assert db.data["archived_messages"] == 3 and archive.count(3) == 3
+    assert asyncio.run(db.archive_messages(archive, datetime(2026, 1, 2))) == 0
+
+    restored = bot.Database("bot_database.json")
+    assert restored.data["archived_messages"] == 3 and len(restored.data["messages"]) == 3
@@ -0,0 +1,28 @@
+from bench_handlers import generate, percentile, synthetic_support, AGENTS, FIRST_USER_ID
+
+
+def test_synthetic_data_loads_into_the_stores(workdir):
+    import admin_panel
+    import support
+    generate(str(workdir), 200)
+
+    bot_db = admin_panel.AdminDatabase("bot_database.json")
+    assert bot_db.count_messages() == 200 and len(bot_db.data["users"]) == 200
+    items, _, after = bot_db.get_users_page(limit=10)
+    assert len(items) == 10 and after is not None
+
+    support_db = support.SupportDB("support_db.json")
+    assert len(support_db.data["tickets"]) == 20 and len(support_db.data["agents"]) == AGENTS
+    taken = support_db.data["active_chats"]
+    assert sum(support_db.loads.loads.values()) == len(taken)
+    assert {ticket["status"] for ticket in support_db.open_tickets()} <= {"open", "taken"}
+    assert support_db.ticket_user(support_db.data["tickets"]["1"]["thread_id"]) == str(FIRST_USER_ID)
+
+
+def test_synthetic_support_is_reproducible_and_percentiles():
+    first, second = synthetic_support(50, seed=3), synthetic_support(50, seed=3)
+    # Время открытия обращений — текущее, остальное определяется seed
+    assert first["active_chats"] == second["active_chats"] and first["banned"] == second["banned"]
+    assert [t["status"] for t in first["tickets"].values()] == [t["status"] for t in second["tickets"].values()]
+    latencies = list(range(1, 101))
+    assert [percentile(latencies, p) for p in (50, 95, 99, 100)] == [51, 96, 100, 100]
@@ -0,0 +1,42 @@
+import threading
+from telegram.error import Forbidden
+from bot_integration import TelegramSender
+
+
+class FakeBot:
+    def __init__(self):
+        self.initialized = 0
+        self.sent = []
+        self.loops = set()
+
+    async def initialize(self):
+        self.initialized += 1
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        import asyncio
+        self.loops.add(asyncio.get_running_loop())
+        if chat_id < 0:
+            raise Forbidden("bot was blocked by the user")
+        self.sent.append((chat_id, text))
+
+
+def test_sender_reuses_one_loop_and_bot(monkeypatch):
+    # Импорт bot загружает .env с настоящим токеном
+    monkeypatch.delenv("BOT_TOKEN", raising=False)
+    sender = TelegramSender(token="")
+    assert sender.bot is None and sender.send_message_sync(1, "нет токена") is False
+    sender.bot = FakeBot()
+
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(sender.send_message_sync(i, "привет")))
+               for i in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [True] * 8
+    assert sorted(chat for chat, _ in sender.bot.sent) == list(range(1, 9))
+    # Один фоновый цикл и одна инициализация пула соединений на все вызовы
+    assert sender.bot.loops == {sender.loop} and sender.bot.initialized == 1
+    assert sender.submit(-1, "заблокирован").result(5) is False
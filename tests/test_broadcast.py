@@ -0,0 +1,81 @@
+import asyncio
+import json
+import time
+from telegram.error import Forbidden, NetworkError, RetryAfter
+import broadcast
+from broadcast import BroadcastEngine, TokenBucket
+
+
+class FakeBot:
+    def __init__(self, errors=None):
+        self.chats = []
+        # chat_id → исключения, которые бросят очередные отправки этому чату
+        self.errors = errors or {}
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        if self.errors.get(chat_id):
+            raise self.errors[chat_id].pop(0)
+        self.chats.append(chat_id)
+
+
+class FakeSender:
+    """TelegramSender без сети: корутину рассылки запускает сам тест"""
+
+    def __init__(self):
+        self.bot = FakeBot()
+        self.coroutine = None
+
+    def run(self, coroutine):
+        self.coroutine = coroutine
+
+    async def get_bot(self):
+        return self.bot
+
+
+def test_checkpoints_write_progress_only_and_resume(workdir, monkeypatch):
+    monkeypatch.setattr(broadcast, "CHECKPOINT_INTERVAL", 0)
+    sender = FakeSender()
+    engine = BroadcastEngine(sender, state_file="state.json", rate=10000, concurrency=4)
+    assert engine.start("привет", range(100, 150))
+    asyncio.run(sender.coroutine)
+
+    with open("state.json", encoding='utf-8') as f:
+        state = json.load(f)
+    with open("state.progress.json", encoding='utf-8') as f:
+        progress = json.load(f)
+    # Файл со списком получателей не переписывался во время рассылки
+    assert state["watermark"] == 0 and state["finished_at"] is None
+    assert progress["watermark"] == 50 and progress["done"] == [] and progress["sent"] == 50
+    assert sorted(sender.bot.chats) == list(range(100, 150))
+
+    restored = BroadcastEngine(sender, state_file="state.json").status()
+    assert restored["processed"] == 50 and restored["finished_at"]
+
+
+def test_failures_are_counted_and_flood_control_pauses(workdir, monkeypatch):
+    monkeypatch.setattr(broadcast, "BROADCAST_RETRIES", 1)
+    sender = FakeSender()
+    sender.bot = FakeBot({1: [Forbidden("blocked")], 2: [RetryAfter(0)], 3: [NetworkError("a"), NetworkError("b")],
+                          4: [NetworkError("a")]})
+    engine = BroadcastEngine(sender, state_file="state.json", rate=10000, concurrency=2)
+    assert engine.start("привет", [1, 2, 3, 4, 5])
+    asyncio.run(sender.coroutine)
+
+    status = engine.status()
+    assert (status["processed"], status["sent"], status["failed"]) == (5, 3, 2)
+    assert sorted(sender.bot.chats) == [2, 4, 5]
+
+
+def test_token_bucket_limits_rate():
+    async def acquire(bucket, count):
+        started = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    bucket = TokenBucket(rate=100, capacity=5)
+    # Запас capacity выдается сразу, остальные токены — по 1/rate секунды
+    assert asyncio.run(acquire(bucket, 5)) < 0.05
+    assert asyncio.run(acquire(bucket, 5)) >= 0.04
+    bucket.pause(0.05)
+    assert asyncio.run(acquire(bucket, 1)) >= 0.04
@@ -0,0 +1,214 @@
+from datetime import datetime, timedelta
+from journal import apply_record
+from indexes import MessageIndex, MessageTimeIndex, UserOrderIndex, PageCache, MembershipIndex, ExpiryQueue, ExpiryIndex, TextIndex, \
+    MessageSearchIndex, UserSearchIndex
+
+
+def _message(sender, recipient, content, minute=0):
+    return {"from": sender, "to": recipient, "date": f"2026-01-01T00:{minute:02d}:00", "content": content}
+
+
+def _apply(index, data, record):
+    apply_record(data, record)
+    index.apply(record, data)
+
+
+def _contents(messages):
+    return [message["content"] for message in messages]
+
+
+def test_message_index_follows_appends_and_trims():
+    data = {"messages": [_message(1, 2, "a"), _message(2, 1, "b"), _message(3, 2, "c")]}
+    index = MessageIndex()
+    index.rebuild(data)
+    assert _contents(index.received(data["messages"], 2)) == ["a", "c"]
+
+    _apply(index, data, {"op": "append", "path": ["messages"], "value": _message(1, 2, "d")})
+    _apply(index, data, {"op": "append", "path": ["messages"], "value": _message(1, 1, "self")})
+    assert _contents(index.received(data["messages"], 2, limit=2)) == ["c", "d"]
+    # Сообщение самому себе — одно, а не два
+    messages, before = index.user_messages(data["messages"], 1)
+    assert (_contents(messages), before) == (["self", "d", "b", "a"], None)
+    messages, before = index.user_messages(data["messages"], 1, limit=2)
+    assert (_contents(messages), before) == (["self", "d"], 3)
+    assert _contents(index.user_messages(data["messages"], 1, before=before)[0]) == ["b", "a"]
+
+    # Перенос в архив сдвигает позиции: индекс строится заново
+    _apply(index, data, {"op": "trim", "path": ["messages"], "count": 2})
+    assert _contents(index.received(data["messages"], 2)) == ["c", "d"]
+    assert [m["id"] for m in index.user_messages(data["messages"], 1)[0]] == [2, 1]
+
+
+def test_message_index_is_built_on_first_query():
+    data = {"messages": [_message(1, 2, "a")]}
+    index = MessageIndex()
+    index.rebuild(data)
+    _apply(index, data, {"op": "append", "path": ["messages"], "value": _message(3, 2, "b")})
+    assert not index.inbox
+    assert _contents(index.received(data["messages"], 2)) == ["a", "b"]
+
+
+def test_time_index_bounds_follow_appends():
+    data = {"messages": [_message(1, 2, "a", 0), _message(1, 2, "b", 10), {"from": 1, "to": 2, "content": "no date"},
+                         _message(1, 2, "c", 20)]}
+    index = MessageTimeIndex()
+    index.rebuild(data)
+    moment = lambda minute: datetime(2026, 1, 1, 0, minute)
+    assert index.bounds() == (0, 4)
+    # Сообщение без даты получает метку предыдущего и попадает в его диапазон
+    assert index.bounds(since=moment(10)) == (1, 4)
+    assert index.bounds(since=moment(11)) == (3, 4)
+    assert index.bounds(until=moment(10)) == (0, 1)
+    assert index.bounds(since=moment(30), until=moment(5)) == (4, 4)
+
+    # Дата раньше предыдущей не нарушает сортировку
+    _apply(index, data, {"op": "append", "path": ["messages"], "value": _message(1, 2, "late", 5)})
+    _apply(index, data, {"op": "append", "path": ["messages"], "value": _message(1, 2, "d", 30)})
+    assert index.times == sorted(index.times)
+    assert index.bounds(since=moment(20), until=moment(30)) == (3, 5)
+    _apply(index, data, {"op": "trim", "path": ["messages"], "count": 3})
+    assert index.bounds(since=moment(25)) == (2, 3)
+
+
+def test_user_pages_walk_both_ways():
+    data = {"users": {str(uid): {"username": f"u{uid}"} for uid in (5, 3, 9, 1, 7)}}
+    index = UserOrderIndex()
+    index.rebuild(data)
+    _apply(index, data, {"op": "set", "path": ["users", "2"], "value": {"username": "u2"}})
+    _apply(index, data, {"op": "set", "path": ["users", "3", "username"], "value": "renamed"})
+
+    # Порядок регистрации, а не порядок id
+    items, before, after = index.page(data["users"], limit=4)
+    assert [uid for uid, _ in items] == ["5", "3", "9", "1"] and (before, after) == (None, "1")
+    assert items[1][1]["username"] == "renamed"
+    items, before, after = index.page(data["users"], after=after, limit=4)
+    assert [uid for uid, _ in items] == ["7", "2"] and (before, after) == ("7", None)
+    items, before, after = index.page(data["users"], before=before, limit=4)
+    assert [uid for uid, _ in items] == ["5", "3", "9", "1"] and (before, after) == (None, "1")
+    items, before, after = index.page(data["users"], before="9", limit=1)
+    assert [uid for uid, _ in items] == ["3"] and (before, after) == ("3", "3")
+    # Курсор удаленного пользователя: страница с начала списка
+    assert index.page(data["users"], after=42, limit=2)[0][0][0] == "5"
+
+    _apply(index, data, {"op": "del", "path": ["users", "9"]})
+    assert index.order == ["5", "3", "1", "7", "2"] and index.positions["2"] == 4
+
+
+def test_page_cache_resets_on_watched_sections():
+    cache = PageCache(["users"])
+    renders = []
+
+    def render(page):
+        renders.append(page)
+        return f"page {page}"
+
+    assert cache.get(1, render) == cache.get(1, render) == "page 1" and renders == [1]
+    cache.apply({"op": "append", "path": ["messages"], "value": {}}, {})
+    cache.get(1, render)
+    assert renders == [1]
+    cache.apply({"op": "set", "path": ["users", "1", "username"], "value": "x"}, {})
+    cache.get(1, render)
+    assert renders == [1, 1]
+
+
+def test_membership_sets_mirror_lists():
+    data = {"banned": [5], "protected_users": [], "admins": [1]}
+    index = MembershipIndex()
+    index.rebuild(data)
+    assert index.contains("banned", "5") and index.contains("admins", 1)
+    assert not index.contains("banned", "not a number")
+
+    _apply(index, data, {"op": "append", "path": ["protected_users"], "value": 7})
+    # Два процесса забанили одного пользователя: после одного remove он остается в списке
+    _apply(index, data, {"op": "append", "path": ["banned"], "value": 5})
+    _apply(index, data, {"op": "remove", "path": ["banned"], "value": 5})
+    assert data["banned"] == [5] and index.contains("banned", 5)
+    _apply(index, data, {"op": "remove", "path": ["banned"], "value": 5})
+    assert not index.contains("banned", 5)
+
+    _apply(index, data, {"op": "set", "path": ["admins"], "value": [2, 3]})
+    assert index.sets == {"banned": set(), "protected_users": {7}, "admins": {2, 3}}
+
+
+def test_expiry_queue_skips_replaced_and_removed_deadlines():
+    start = datetime(2026, 1, 1)
+    queue = ExpiryQueue()
+    queue.push("a", start + timedelta(days=3))
+    queue.push("b", start + timedelta(days=1))
+    queue.push("b", start + timedelta(days=5))
+    queue.push("c", start + timedelta(days=2))
+    queue.discard("c")
+
+    assert queue.peek() == start + timedelta(days=3)
+    assert queue.pop_due(start + timedelta(days=4)) == ["a"]
+    assert queue.pop_due(start + timedelta(days=4)) == []
+    assert queue.pop_due(start + timedelta(days=5)) == ["b"]
+    assert queue.peek() is None
+
+    # Устаревшие элементы кучи не копятся при частом продлении
+    for day in range(500):
+        queue.push("a", start + timedelta(days=day))
+    assert len(queue.heap) <= 2 * len(queue.deadlines) + 64
+
+
+def test_expiry_index_tracks_subscriptions_and_temporary_bans():
+    start = datetime(2026, 1, 1)
+    data = {"subscriptions": {"1": (start + timedelta(days=10)).isoformat()}, "ban_history": []}
+    index = ExpiryIndex()
+    index.rebuild(data)
+    assert index.next_deadline() == start + timedelta(days=10)
+
+    ban = {"user_id": 2, "active": True, "until": (start + timedelta(days=2)).isoformat()}
+    _apply(index, data, {"op": "append", "path": ["ban_history"], "value": ban})
+    _apply(index, data, {"op": "append", "path": ["ban_history"], "value": {"user_id": 3, "active": True}})
+    assert index.next_deadline() == start + timedelta(days=2)
+
+    # Снятый вручную бан больше не истекает
+    _apply(index, data, {"op": "set", "path": ["ban_history", 0], "value": dict(ban, active=False)})
+    _apply(index, data, {"op": "set", "path": ["subscriptions", "4"], "value": (start + timedelta(days=1)).isoformat()})
+    assert index.next_deadline() == start + timedelta(days=1)
+    _apply(index, data, {"op": "del", "path": ["subscriptions", "4"]})
+    assert index.subscriptions.pop_due(start + timedelta(days=30)) == ["1"]
+    assert index.bans.pop_due(start + timedelta(days=30)) == []
+
+
+def test_text_index_matches_prefixes_and_ranks_whole_words():
+    index = TextIndex(removable=True)
+    index.build([(1, "Привет, мир"), (2, "приветствую всех"), (3, "Ёлка и мир"), (4, "я")])
+
+    assert index.search("привет") == [1, 2]
+    assert index.search("привет", newest_first=True) == [1, 2]
+    assert index.search("при мир") == [1]
+    # ё и е не различаются, регистр не важен
+    assert index.search("ЕЛКА") == [3]
+    # Слово короче MIN_PREFIX ищется только целиком
+    assert index.search("я") == [4] and index.search("п") == []
+    assert index.search("мир", newest_first=True) == [3, 1]
+    assert index.search("нет такого") == [] and index.search("...") == []
+
+    index.remove(1)
+    index.add(5, "мирный")
+    assert index.search("мир") == [3, 5]
+    assert "привет" not in index.terms
+
+
+def test_search_indexes_follow_records():
+    data = {"users": {"1": {"username": "alice", "full_name": "Smith"}},
+            "messages": [_message(1, 2, "первое сообщение")]}
+    messages = MessageSearchIndex()
+    users = UserSearchIndex()
+    for index in (messages, users):
+        index.rebuild(data)
+
+    for record in ({"op": "append", "path": ["messages"], "value": _message(2, 1, "второе сообщение")},
+                   {"op": "set", "path": ["users", "2"], "value": {"username": "bob", "full_name": None}},
+                   {"op": "set", "path": ["users", "1", "username"], "value": "alicia"}):
+        apply_record(data, record)
+        messages.apply(record, data)
+        users.apply(record, data)
+
+    assert messages.search(data["messages"], "сообщ") == ([data["messages"][1], data["messages"][0]], 2)
+    assert messages.search(data["messages"], "сообщ", offset=1, limit=1) == ([data["messages"][0]], 2)
+    assert users.search(data["users"], "alic")[1] == 1
+    assert users.search(data["users"], "alice") == ([], 0)
+    assert users.search(data["users"], "2") == ([("2", data["users"]["2"])], 1)
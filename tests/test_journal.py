@@ -0,0 +1,286 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import journal
+from journal import Journal, JournaledStore, load_snapshot, GENERATION_KEY
+
+
+class ListStore(JournaledStore):
+    """Хранилище с одним списком items, как секции messages/ban_history бота"""
+
+    def __init__(self, filename, flush_interval=0, lazy=()):
+        self.filename = filename
+        self.journal = Journal(filename)
+        self.lock = threading.RLock()
+        self.flush_interval = flush_interval
+        self.lazy = lazy
+        self.reload()
+
+    def load(self):
+        if os.path.exists(self.filename):
+            return load_snapshot(self.filename, self.lazy)
+        return {"items": ["a", "b"], "count": 0}
+
+
+def _snapshot(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _no_reload(store, monkeypatch):
+    def reload():
+        raise AssertionError("snapshot reloaded")
+    monkeypatch.setattr(store, "reload", reload)
+
+
+def test_journal_replays_after_restart_and_compacts(workdir):
+    store = ListStore("db.json")
+    store.append_value(["items"], "c")
+    store.increment(["count"], by=2)
+    store.flush()
+    assert not os.path.exists("db.json")
+
+    restarted = ListStore("db.json")
+    assert restarted.data == {"items": ["a", "b", "c"], "count": 2}
+    assert restarted.journal.records == 2
+
+    restarted.compact()
+    assert _snapshot("db.json") == {"items": ["a", "b", "c"], "count": 2, GENERATION_KEY: 1}
+    assert restarted.journal.records == 0
+    assert ListStore("db.json").data["items"] == ["a", "b", "c"]
+
+
+def test_journal_tail_from_crash_is_cut(workdir):
+    store = ListStore("db.json")
+    store.append_value(["items"], "c")
+    store.flush()
+    with open(store.journal.path, 'ab') as f:
+        f.write(b'{"op": "append", "path": ["items"], "val')
+
+    restarted = ListStore("db.json")
+    restarted.append_value(["items"], "d")
+    restarted.flush()
+    assert ListStore("db.json").data["items"] == ["a", "b", "c", "d"]
+
+
+def test_threshold_compaction_keeps_other_process_in_sync(workdir):
+    bot = ListStore("db.json")
+    admin = ListStore("db.json")
+    bot.compact_threshold = 3
+    for item in "cde":
+        bot.append_value(["items"], item)
+        bot.flush()
+    assert bot.journal.generation == 1 and bot.journal.records == 0
+
+    admin.append_value(["items"], "f")
+    admin.flush()
+    bot.refresh()
+    assert bot.data["items"] == admin.data["items"] == ["a", "b", "c", "d", "e", "f"]
+
+
+def test_background_compaction_defers_own_writes(workdir, monkeypatch):
+    ListStore("db.json").compact()
+    store = ListStore("db.json", flush_interval=1, lazy=("items",))
+    store.increment(["count"])
+    writing = threading.Event()
+    release = threading.Event()
+    write_section_list = journal.write_section_list
+
+    def slow_write(filename, sections):
+        writing.set()
+        release.wait(5)
+        write_section_list(filename, sections)
+
+    monkeypatch.setattr(journal, "write_section_list", slow_write)
+
+    async def scenario():
+        task = asyncio.create_task(store.compact_in_background())
+        await asyncio.to_thread(writing.wait, 5)
+        # Пока файл пишется в потоке, цикл событий продолжает работать
+        store.append_value(["items"], "c")
+        store.flush()
+        assert store.compacting and store.journal.pending
+        release.set()
+        await task
+
+    asyncio.run(scenario())
+
+    assert not store.compacting and not store.journal.pending
+    # Непрочитанная секция переписана как есть, запись после сборки снимка — в журнале нового поколения
+    assert _snapshot("db.json") == {"items": ["a", "b"], "count": 1, GENERATION_KEY: 2}
+    assert ListStore("db.json").data == {"items": ["a", "b", "c"], "count": 1, GENERATION_KEY: 2}
+
+
+def test_buffered_append_and_trim_match_other_process(workdir, monkeypatch):
+    bot = ListStore("db.json", flush_interval=1)
+    admin = ListStore("db.json")
+    _no_reload(bot, monkeypatch)
+
+    bot.append_value(["items"], "x")
+    admin.append_value(["items"], "y")
+    admin.flush()
+    bot.trim_value(["items"], 1)
+    bot.flush()
+    admin.refresh()
+
+    assert bot.data["items"] == admin.data["items"] == ListStore("db.json").data["items"] == ["b", "y", "x"]
+
+
+def test_refresh_flushes_pending_before_foreign_records(workdir, monkeypatch):
+    bot = ListStore("db.json", flush_interval=1)
+    admin = ListStore("db.json")
+    _no_reload(bot, monkeypatch)
+
+    bot.append_value(["items"], "x")
+    bot.refresh()
+    assert bot.journal.pending
+    admin.append_value(["items"], "y")
+    admin.trim_value(["items"], 1)
+    admin.flush()
+    bot.refresh()
+    assert not bot.journal.pending
+    admin.refresh()
+
+    assert bot.data["items"] == admin.data["items"] == ListStore("db.json").data["items"] == ["b", "y", "x"]
+
+
+def test_unflushed_records_survive_double_rotation(workdir):
+    bot = ListStore("db.json", flush_interval=1)
+    admin = ListStore("db.json")
+
+    bot.append_value(["items"], "x")
+    admin.append_value(["items"], "y")
+    admin.compact()
+    admin.trim_value(["items"], 1)
+    admin.compact()
+    bot.refresh()
+    admin.refresh()
+
+    assert bot.data["items"] == admin.data["items"] == ListStore("db.json").data["items"] == ["b", "y", "x"]
+
+
+def test_foreign_records_merge_without_reload(workdir, monkeypatch):
+    bot = ListStore("db.json", flush_interval=1)
+    admin = ListStore("db.json")
+    _no_reload(bot, monkeypatch)
+
+    # Разные ветки и счетчики: чужие записи просто применяются
+    bot.increment(["count"])
+    bot.append_value(["items"], "x")
+    admin.increment(["count"], by=10)
+    admin.set_value(["owner"], "admin")
+    admin.flush()
+    bot.flush()
+    assert bot.data == {"items": ["a", "b", "x"], "count": 11, "owner": "admin"}
+
+    # Один путь: в файле сначала чужая запись, затем своя — в памяти так же
+    bot.set_value(["owner"], "bot")
+    bot.remove_value(["items"], "a")
+    admin.set_value(["owner"], "second admin")
+    admin.append_value(["items"], "y")
+    admin.flush()
+    bot.flush()
+    admin.refresh()
+    assert bot.data == admin.data == ListStore("db.json").data == \
+        {"items": ["b", "x", "y"], "count": 11, "owner": "bot"}
+
+
+def test_records_from_threads_are_written_once(workdir):
+    store = ListStore("db.json", flush_interval=1)
+    admin = ListStore("db.json")
+
+    def worker(name):
+        for i in range(200):
+            store.append_value(["items"], f"{name}{i}")
+            store.increment(["count"])
+            if i % 7 == 0:
+                store.flush()
+            if i % 50 == 0:
+                admin.append_value(["items"], f"admin-{name}{i}")
+                admin.flush()
+
+    threads = [threading.Thread(target=worker, args=(name,)) for name in "pqrs"]
+    # Частое переключение потоков, чтобы record() попадал внутрь flush()
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    store.flush()
+
+    restarted = ListStore("db.json")
+    assert restarted.data == store.data
+    assert restarted.data["count"] == 800 and len(restarted.data["items"]) == 2 + 800 + 16
+
+
+def test_lazy_sections_are_parsed_on_first_access(workdir):
+    journal.write_sections("data.json", {"items": ["a", {"b": "строка, с запятой\n"}], "count": 2, "ключ": None})
+    data = load_snapshot("data.json", lazy=("items",))
+    assert data.lazy_keys() == ["items"] and data["count"] == 2 and data["ключ"] is None
+
+    # Записи журнала для непрочитанной секции откладываются до разбора
+    assert data.defer({"op": "append", "path": ["items"], "value": "c"})
+    assert not data.defer({"op": "set", "path": ["count"], "value": 3})
+    assert data.raw("items") is None
+    assert data["items"] == ["a", {"b": "строка, с запятой\n"}, "c"] and data.lazy_keys() == []
+
+    # Непрочитанная секция переписывается в новый снимок как есть
+    data = load_snapshot("data.json", lazy=("items", "count"))
+    assert data.raw("items") is not None
+    journal.write_sections("copy.json", data)
+    assert open("copy.json", 'rb').read() == open("data.json", 'rb').read()
+
+    # Снимок в старом формате читается целиком
+    journal.write_snapshot("old.json", {"items": [1], "count": 1})
+    assert load_snapshot("old.json", lazy=("items",)) == {"items": [1], "count": 1}
+
+
+def test_store_replays_journal_into_lazy_section(workdir):
+    store = ListStore("store.json", lazy=("items",))
+    store.compact()
+    other = ListStore("store.json", lazy=("items",))
+    store.append_value(["items"], "c")
+    store.increment(["count"])
+    store.save()
+
+    restored = ListStore("store.json", lazy=("items",))
+    assert restored.data.lazy_keys() == ["items"] and restored.data["count"] == 1
+    assert restored.data["items"] == ["a", "b", "c"]
+    other.refresh()
+    assert other.data["items"] == ["a", "b", "c"]
+
+
+def _journal_lines(store):
+    with open(store.journal.path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f][1:]
+
+
+def test_buffered_increments_are_coalesced_until_flush(workdir):
+    store = ListStore("store.json", flush_interval=1)
+    store.compact()
+    other = ListStore("store.json")
+    for _ in range(5):
+        store.increment(["count"])
+        store.save()
+    store.append_value(["items"], "c")
+    store.increment(["count"], by=2)
+    # Запись по пути счетчика завершает слияние: порядок записей сохраняется
+    store.set_value(["count"], 100)
+    store.increment(["count"])
+    assert _journal_lines(store) == [] and store.dirty
+
+    asyncio.run(journal.flush_job(store, other)(None))
+    assert _journal_lines(store) == [{"op": "incr", "path": ["count"], "by": 7},
+                                     {"op": "append", "path": ["items"], "value": "c"},
+                                     {"op": "set", "path": ["count"], "value": 100},
+                                     {"op": "incr", "path": ["count"], "by": 1}]
+    assert not store.dirty
+    other.refresh()
+    assert other.data["count"] == store.data["count"] == 101
+    assert ListStore("store.json").data["items"] == ["a", "b", "c"]
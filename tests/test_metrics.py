@@ -0,0 +1,59 @@
+import os
+from jinja2 import FileSystemLoader
+import metrics
+from metrics import Counter, Histogram, Registry, callback_label
+
+
+def test_histogram_renders_cumulative_buckets(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    histogram = Histogram("job_seconds", "Время задачи", ("job",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, job="flush")
+
+    lines = histogram.render().splitlines()
+    assert lines[:2] == ["# HELP job_seconds Время задачи", "# TYPE job_seconds histogram"]
+    assert lines[2:] == ['job_seconds_bucket{job="flush",le="0.1"} 1',
+                         'job_seconds_bucket{job="flush",le="1"} 3',
+                         'job_seconds_bucket{job="flush",le="+Inf"} 4',
+                         'job_seconds_sum{job="flush"} 4.05',
+                         'job_seconds_count{job="flush"} 4']
+
+
+def test_registry_keeps_first_metric_and_disabled_metrics_stay_empty(monkeypatch):
+    registry = Registry()
+    first = registry.register(Counter("sent_total", "Отправлено", ("result",)))
+    assert registry.register(Counter("sent_total", "Другое описание")) is first
+
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    first.inc(result="ok")
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    first.inc(2, result='a"b')
+    assert registry.render() == '# HELP sent_total Отправлено\n# TYPE sent_total counter\n' \
+                                'sent_total{result="a\\"b"} 2\n'
+
+
+def test_callback_label_drops_ids():
+    assert callback_label("reveal_123") == "reveal_"
+    assert callback_label("adm_users_page_-5") == "adm_users_page_"
+    assert callback_label(None) == ""
+
+
+def test_admin_metrics_need_session_or_token(workdir, monkeypatch):
+    import admin_panel
+    # Шаблоны лежат в корне репозитория, а не в templates/
+    monkeypatch.setattr(admin_panel.app, "jinja_loader", FileSystemLoader(os.path.dirname(admin_panel.__file__)))
+    client = admin_panel.app.test_client()
+
+    monkeypatch.setattr(admin_panel, "METRICS_TOKEN", None)
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setattr(admin_panel, "METRICS_TOKEN", "secret")
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200 and b"# TYPE http_request_seconds histogram" in response.data
+
+    monkeypatch.setattr(admin_panel, "METRICS_TOKEN", None)
+    with client.session_transaction() as session:
+        session['admin_id'] = 1
+    assert client.get('/metrics').status_code == 200
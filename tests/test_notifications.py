@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+from telegram.error import Forbidden, NetworkError, RetryAfter
+import notifications
+from notifications import NotificationQueue
+
+
+class FakeSend:
+    def __init__(self, errors=None):
+        self.sent = []
+        # chat_id → исключения, которые бросят очередные отправки этому чату
+        self.errors = errors or {}
+
+    async def __call__(self, chat_id, text, parse_mode=None):
+        if self.errors.get(chat_id):
+            raise self.errors[chat_id].pop(0)
+        self.sent.append((chat_id, text))
+
+
+def _make_due(queue):
+    past = (datetime.now() - timedelta(seconds=1)).isoformat()
+    for item in list(queue.data["pending"].values()):
+        queue.set_value(["pending", item["id"]], dict(item, next_attempt=past))
+
+
+def test_failed_notifications_are_retried_with_backoff(workdir, monkeypatch):
+    monkeypatch.setattr(notifications, "MAX_ATTEMPTS", 3)
+    queue = NotificationQueue("queue.json")
+    send = FakeSend({1: [NetworkError("a"), NetworkError("b")], 2: [RetryAfter(42)]})
+    first = queue.enqueue(1, "первое")
+    queue.enqueue(2, "второе")
+    queue.enqueue(3, "третье")
+
+    started = datetime.now()
+    asyncio.run(queue.drain(send))
+    assert send.sent == [(3, "третье")] and queue.pending_count() == 2
+    item = queue.data["pending"][first]
+    assert item["attempts"] == 1 and item["last_error"] == "a"
+    # Первая задержка — RETRY_BASE, у RetryAfter — время, указанное Telegram
+    delays = sorted((datetime.fromisoformat(item["next_attempt"]) - started).total_seconds()
+                    for item in queue.data["pending"].values())
+    assert notifications.RETRY_BASE <= delays[0] < notifications.RETRY_BASE + 1 and 42 <= delays[1] < 43
+    assert queue._due(datetime.now()) == []
+
+    _make_due(queue)
+    asyncio.run(queue.drain(send))
+    assert queue.data["pending"][first]["attempts"] == 2
+    assert queue.pending_count() == 1 and (2, "второе") in send.sent
+
+    # Очередь переживает перезапуск процесса
+    restored = NotificationQueue("queue.json")
+    assert restored.data["pending"][first]["attempts"] == 2
+    _make_due(restored)
+    asyncio.run(restored.drain(send))
+    assert restored.pending_count() == 0 and restored.dead_count() == 0
+    assert (1, "первое") in send.sent
+
+
+def test_dead_letter_after_permanent_error_or_max_attempts(workdir, monkeypatch):
+    monkeypatch.setattr(notifications, "MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(notifications, "DEAD_LETTER_LIMIT", 2)
+    queue = NotificationQueue("queue.json")
+    send = FakeSend({1: [Forbidden("blocked")], 2: [NetworkError("a"), NetworkError("b")]})
+    queue.enqueue(1, "заблокирован")
+    queue.enqueue(2, "сеть")
+
+    asyncio.run(queue.drain(send))
+    assert queue.dead_count() == 1 and queue.data["dead"][0]["chat_id"] == 1
+    _make_due(queue)
+    asyncio.run(queue.drain(send))
+    assert queue.pending_count() == 0
+    assert [(item["chat_id"], item["attempts"]) for item in queue.data["dead"]] == [(1, 1), (2, 2)]
+
+    queue._dead(dict(queue.data["dead"][0], attempts=0), "ещё одно")
+    assert queue.dead_count() == notifications.DEAD_LETTER_LIMIT
+    assert NotificationQueue("queue.json").dead_count() == 2
@@ -0,0 +1,68 @@
+import json
+import pytest
+from journal import apply_record, write_sections, load_snapshot
+from records import Message, MessageColumns, BanHistory, ActionHistory, BanRecord, ActionDetails, RECORD_TYPES
+
+
+def _messages():
+    return [{"from": 1, "to": 2, "date": "2026-01-01T10:00:00", "content": "[Медиа]"},
+            {"from": 2, "to": 1, "date": "2026-01-01T10:00:01.500000", "content": None},
+            # Не укладываются в схему и хранятся как есть
+            {"from": "1", "to": 2, "date": "2026-01-01T10:00:02", "content": "id строкой"},
+            {"from": 1, "to": 2, "date": "2026-01-01T10:00:03+03:00", "content": "часовой пояс"},
+            {"from": 1, "to": 2, "date": "2026-01-01T10:00:04", "content": "лишний ключ", "id": 7},
+            {"from": 3, "to": 1, "date": "2026-01-01T10:00:05", "content": "[Медиа]"}]
+
+
+def test_message_columns_round_trip_json():
+    messages = _messages()
+    columns = MessageColumns(messages)
+    assert sorted(columns.extras) == [2, 3, 4]
+    assert columns.to_json() == messages and columns == messages
+    assert json.loads(json.dumps(columns.to_json())) == messages
+    # Короткие тексты хранятся в одном экземпляре
+    assert columns.contents[0] is columns.contents[5]
+
+    message = columns[-1]
+    assert isinstance(message, Message) and message["date"] == "2026-01-01T10:00:05"
+    assert dict(message) == messages[5] and message.get("id") is None and "id" not in message
+    assert columns[1:3] == messages[1:3]
+    with pytest.raises(IndexError):
+        columns[6]
+
+    columns.append(message)
+    del columns[:3]
+    assert columns == messages[3:] + [messages[5]] and sorted(columns.extras) == [0, 1]
+    with pytest.raises(TypeError):
+        del columns[1:]
+
+
+def test_history_records_keep_keys():
+    history = BanHistory([{"user_id": 1, "reason": "спам", "active": True, "note": "вне схемы"}])
+    history.append({"user_id": 2, "reason": "спам", "until": None})
+    assert isinstance(history[1], BanRecord) and history[0]["reason"] is history[1]["reason"]
+    assert history.to_json() == [{"user_id": 1, "reason": "спам", "active": True, "note": "вне схемы"},
+                                 {"user_id": 2, "reason": "спам", "until": None}]
+    assert "banned_at" not in history[0] and history[0].get("banned_at") is None
+
+    # Записи журнала применяются к записям, как к словарям
+    data = {"ban_history": history}
+    apply_record(data, {"op": "set", "path": ["ban_history", 1, "active"], "value": False})
+    apply_record(data, {"op": "set", "path": ["ban_history", 0], "value": {"user_id": 1, "active": False}})
+    assert isinstance(history[0], BanRecord) and history[1]["active"] is False
+
+    actions = ActionHistory([{"user_id": 1, "action_type": "ban", "details": {"reason": "спам", "days": 3}}])
+    assert isinstance(actions[0]["details"], ActionDetails)
+    assert actions.to_json() == [{"user_id": 1, "action_type": "ban", "details": {"reason": "спам", "days": 3}}]
+
+
+def test_compact_sections_survive_snapshot(workdir):
+    data = {key: record_type(value) for key, record_type, value in
+            (("messages", MessageColumns, _messages()),
+             ("ban_history", BanHistory, [{"user_id": 1, "reason": "спам"}]),
+             ("action_history", ActionHistory, [{"user_id": 1, "action_type": "ban", "details": {}}]))}
+    assert set(data) == set(RECORD_TYPES)
+    write_sections("db.json", data)
+    loaded = load_snapshot("db.json")
+    assert loaded["messages"] == _messages() and loaded["ban_history"] == data["ban_history"].to_json()
+    assert loaded["action_history"] == [{"user_id": 1, "action_type": "ban", "details": {}}]
@@ -0,0 +1,5 @@
+def test_search_finds_messages_added_after_start(workdir):
+    from shared_database import SharedDatabase
+    db = SharedDatabase("bot_database.json")
+    db.data["messages"].append({"from": 1, "to": 2, "date": "2026-01-01T00:00:00", "content": "Встретимся завтра"})
+    assert [m["content"] for m in db.search_messages("треТИМ")] == ["Встретимся завтра"]
@@ -0,0 +1,119 @@
+import json
+from journal import Journal, write_sections
+from sqlite_database import SQLiteDatabase, _load_json_with_journal
+
+
+def _pages(db, limit):
+    """Проход по страницам назад и обратно вперед: (содержимое страниц, наличие курсоров before/after)"""
+    pages = []
+    items, before, after = db.get_messages_page(limit=limit)
+    pages.append(([m["content"] for m in items], before is not None, after is not None))
+    while before is not None:
+        items, before, after = db.get_messages_page(before=before, limit=limit)
+        pages.append(([m["content"] for m in items], before is not None, after is not None))
+    while after is not None:
+        items, before, after = db.get_messages_page(after=after, limit=limit)
+        pages.append(([m["content"] for m in items], before is not None, after is not None))
+    return pages
+
+
+def test_messages_page_cursors_match_json_backend(workdir):
+    import admin_panel
+    messages = [{"from": 1, "to": 2, "date": f"2026-01-01T00:00:{i:02d}", "content": f"m{i}"} for i in range(7)]
+    write_sections("bot_database.json", {"users": {}, "messages": messages})
+    json_db = admin_panel.AdminDatabase("bot_database.json")
+    sqlite_db = SQLiteDatabase("bot.db")
+    for m in messages:
+        sqlite_db.conn.execute('INSERT INTO messages ("from", "to", date, content) VALUES (?, ?, ?, ?)',
+                               (m["from"], m["to"], m["date"], m["content"]))
+
+    sqlite_pages = _pages(sqlite_db, 3)
+    assert sqlite_pages == _pages(json_db, 3)
+    # Первая страница после возврата вперед не ведет на пустую более новую
+    assert sqlite_pages[-1] == (["m6", "m5", "m4"], True, False)
+
+    # Курсор перед самым старым сообщением (id в SQLite с 1, в JSON-базе с 0): более старых нет
+    for db, first_id in ((sqlite_db, 1), (json_db, 0)):
+        items, before, after = db.get_messages_page(after=first_id - 1, limit=3)
+        assert ([m["content"] for m in items], before, after is not None) == (["m2", "m1", "m0"], None, True)
+        items, before, after = db.get_messages_page(before=first_id + 7, limit=3)
+        assert ([m["content"] for m in items], before is not None, after) == (["m6", "m5", "m4"], True, None)
+
+
+def test_date_filters_match_json_backend(workdir):
+    import admin_panel
+    from datetime import datetime
+    messages = [{"from": 1, "to": 2, "date": f"2026-01-0{day}T12:00:00", "content": f"m{day}"} for day in range(1, 8)]
+    write_sections("bot_database.json", {"users": {}, "messages": messages})
+    json_db = admin_panel.AdminDatabase("bot_database.json")
+    sqlite_db = SQLiteDatabase("bot.db")
+    for m in messages:
+        sqlite_db.conn.execute('INSERT INTO messages ("from", "to", date, content) VALUES (?, ?, ?, ?)',
+                               (m["from"], m["to"], m["date"], m["content"]))
+
+    since, until = datetime(2026, 1, 3), datetime(2026, 1, 6, 12)
+    for db in (json_db, sqlite_db):
+        assert db.count_messages(since, until) == 3 and db.count_messages(since=since) == 5
+        items, before, after = db.get_messages_page(limit=2, since=since, until=until)
+        assert [m["content"] for m in items] == ["m5", "m4"] and before is not None and after is None
+        items, before, after = db.get_messages_page(before=before, limit=2, since=since, until=until)
+        assert [m["content"] for m in items] == ["m3"] and before is None and after is not None
+
+
+def test_users_page_cursors_match_json_backend(workdir):
+    import admin_panel
+    users = {str(uid): {"username": f"u{uid}", "full_name": None, "first_seen": f"2026-01-0{day}T00:00:00",
+                        "messages_sent": 0, "messages_received": 0}
+             for day, uid in enumerate((5, 3, 9, 1, 7), 1)}
+    write_sections("bot_database.json", {"users": users, "messages": []})
+    json_db = admin_panel.AdminDatabase("bot_database.json")
+    sqlite_db = SQLiteDatabase("bot.db")
+    for uid, user in users.items():
+        sqlite_db.conn.execute("INSERT INTO users (user_id, username, full_name, first_seen) VALUES (?, ?, ?, ?)",
+                               (int(uid), user["username"], user["full_name"], user["first_seen"]))
+
+    for db in (json_db, sqlite_db):
+        items, before, after = db.get_users_page(limit=2)
+        assert ([uid for uid, _ in items], before, str(after)) == (["5", "3"], None, "3")
+        items, before, after = db.get_users_page(after=after, limit=2)
+        assert ([uid for uid, _ in items], str(before), str(after)) == (["9", "1"], "9", "1")
+        items, before, after = db.get_users_page(after=after, limit=2)
+        assert ([uid for uid, _ in items], str(before), after) == (["7"], "7", None)
+        items, before, after = db.get_users_page(before=before, limit=2)
+        assert [uid for uid, _ in items] == ["9", "1"] and items[0][1]["username"] == "u9"
+
+
+def test_migration_reads_journal_without_touching_it(workdir):
+    with open("bot_database.json", 'w', encoding='utf-8') as f:
+        json.dump({"_generation": 1, "statistics": {"total_messages": 0}}, f)
+    journal = Journal("bot_database.json")
+    journal.read(1)
+    journal.add({"op": "set", "path": ["statistics", "total_messages"], "value": 5})
+    journal.write_pending()
+    with open(journal.path, 'ab') as f:
+        f.write(b'{"op": "set", "path": ["statistics", "tot')
+    before = open(journal.path, 'rb').read()
+
+    data = _load_json_with_journal("bot_database.json")
+
+    assert data["statistics"]["total_messages"] == 5
+    assert open(journal.path, 'rb').read() == before
+    # Журнал другого поколения не сбрасывается
+    with open("bot_database.json", 'w', encoding='utf-8') as f:
+        json.dump({"_generation": 2, "statistics": {"total_messages": 0}}, f)
+    assert _load_json_with_journal("bot_database.json")["statistics"]["total_messages"] == 0
+    assert open(journal.path, 'rb').read() == before
+
+
+def test_migration_moves_bot_database_only(workdir):
+    from sqlite_database import migrate_from_json
+    write_sections("bot_database.json", {"users": {}, "statistics": {"total_messages": 3},
+                                         "messages": [{"from": 1, "to": 2, "date": "2026-01-01T00:00:00",
+                                                       "content": "m0"}]})
+    write_sections("support_db.json", {"tickets": {}, "active_chats": {}})
+
+    assert migrate_from_json("bot.db")
+    db = SQLiteDatabase("bot.db")
+    assert [m["content"] for m in db.get_messages_page(limit=5)[0]] == ["m0"]
+    assert not db.conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'support%'").fetchall()
+    assert not migrate_from_json("bot.db")
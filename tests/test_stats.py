@@ -0,0 +1,59 @@
+from datetime import date
+import stats
+from journal import apply_record
+from stats import StatsIndex
+
+
+def _data():
+    return {"users": {"1": {"first_seen": "2026-03-01T10:00:00"}},
+            "messages": [{"from": 1, "to": 2, "date": "2026-03-01T10:05:00", "content": "a"}],
+            "banned": [], "subscriptions": {}, "protected_users": [], "admins": [1]}
+
+
+def _apply(index, data, record):
+    apply_record(data, record)
+    index.apply(record, data)
+
+
+def test_incremental_counters_match_rebuild():
+    data = _data()
+    index = StatsIndex()
+    index.rebuild(data)
+
+    _apply(index, data, {"op": "set", "path": ["users", "2"], "value": {"first_seen": "2026-03-02T09:00:00"}})
+    _apply(index, data, {"op": "append", "path": ["messages"],
+                         "value": {"from": 2, "to": 1, "date": "2026-03-02T09:01:00", "content": "b"}})
+    _apply(index, data, {"op": "append", "path": ["banned"], "value": 2})
+    _apply(index, data, {"op": "incr", "path": ["users", "2", "messages_sent"]})
+    _apply(index, data, {"op": "trim", "path": ["messages"], "count": 1})
+    _apply(index, data, {"op": "incr", "path": ["archived_messages"]})
+
+    rebuilt = StatsIndex()
+    rebuilt.rebuild(data)
+    today = date(2026, 3, 2)
+    assert index.snapshot(today) == rebuilt.snapshot(today)
+    assert index.snapshot(today)["total_messages"] == 2
+    assert index.snapshot(today)["messages_today"] == index.snapshot(today)["users_today"] == 1
+    assert index.recent(data) == rebuilt.recent(data)
+
+
+def test_etag_changes_with_writes_and_day(monkeypatch):
+    data = _data()
+    index = StatsIndex()
+    index.rebuild(data)
+    etag = index.etag
+
+    _apply(index, data, {"op": "set", "path": ["users", "1", "username"], "value": "name"})
+    assert index.etag == etag
+    _apply(index, data, {"op": "append", "path": ["admins"], "value": 2})
+    assert index.etag != etag
+
+    etag = index.etag
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date.fromordinal(date.today().toordinal() + 1)
+
+    monkeypatch.setattr(stats, "date", Tomorrow)
+    assert index.etag != etag
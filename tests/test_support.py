@@ -0,0 +1,146 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from tickets import TicketArchive, TICKET_RETENTION_DAYS, CLOSED
+
+
+def _legacy_support_db():
+    """support_db.json до нумерации обращений: одно обращение на пользователя"""
+    with open("support_db.json", 'w', encoding='utf-8') as f:
+        json.dump({"tickets": {"7": {"thread_id": 5, "status": "open", "admin_msg_id": 9},
+                               "8": {"thread_id": 6, "status": "closed", "admin_msg_id": 3}},
+                   "active_chats": {}, "banned": [], "agents": {}, "ban_reasons": {}, "user_metadata": {}}, f)
+
+
+def test_migrated_closed_tickets_wait_for_retention(workdir):
+    import support
+    _legacy_support_db()
+    db = support.SupportDB("support_db.json")
+    archive = TicketArchive()
+
+    assert db.current_ticket(8)["status"] == CLOSED
+    assert asyncio.run(db.archive_closed(archive, datetime.now() - timedelta(days=TICKET_RETENTION_DAYS))) == 0
+    assert db.current_ticket(8) is not None
+
+    assert asyncio.run(db.archive_closed(archive, datetime.now() + timedelta(seconds=1))) == 1
+    assert db.current_ticket(8) is None and db.current_ticket(7)["status"] == "open"
+    assert [ticket["user_id"] for ticket in archive.iter_tickets(8)] == ["8"]
+
+
+def test_take_keeps_owner_and_ignores_closed_tickets(workdir):
+    import support
+    db = support.SupportDB("support_db.json")
+    db.open_ticket(500, 10, 1)
+    db.open_ticket(600, 11, 2)
+    db.close_ticket(600)
+
+    assert db.take_ticket(500, 1) == 1
+    assert db.take_ticket(500, 2) == 1
+    assert db.take_ticket(600, 2) is None
+    assert db.data["active_chats"] == {"500": {"agent_num": 1}}
+    assert db.loads.loads == {1: 1}
+    assert db.loads.least_loaded([1, 2]) == 2
+
+
+def test_agent_replies_route_to_the_current_ticket_owner(workdir):
+    import support
+    db = support.SupportDB("support_db.json")
+    other = support.SupportDB("support_db.json")
+    db.open_ticket(500, 10, 1)
+    db.open_ticket(600, 11, 2)
+    assert db.ticket_user(10) == "500" and db.ticket_user(11) == "600" and db.ticket_user(99) is None
+
+    # Закрытое обращение по-прежнему принимает ответы агента
+    db.close_ticket(500)
+    assert db.ticket_user(10) == "500"
+    # Новое обращение пользователя — новый топик; старый больше не пересылается
+    db.open_ticket(500, 12, 3)
+    assert db.ticket_user(12) == "500" and db.ticket_user(10) is None
+
+    # Другой процесс видит топики после refresh()
+    other.refresh()
+    assert [other.ticket_user(thread) for thread in (10, 11, 12)] == [None, "600", "500"]
+
+
+def test_ticket_lifecycle_keeps_history_and_archives_by_user(workdir):
+    import support
+    db = support.SupportDB("support_db.json")
+    db.add_agent(42)
+    db.open_ticket(500, 10, 1)
+    db.take_ticket(500, 1)
+    db.count_reply(42, 500)
+    first = db.close_ticket(500, by=1)
+    assert db.close_ticket(500) is None
+    second = db.open_ticket(500, 12, 3)
+    db.open_ticket(600, 11, 2)
+    db.close_ticket(600)
+
+    assert [(item["status"], item["by"]) for item in first["history"]] == \
+           [("open", None), ("taken", 1), ("closed", 1)]
+    assert first["closed_at"] and first["first_response_at"] and db.data["agents"]["42"]["replies"] == 1
+    assert db.current_ticket(500)["id"] == second["id"] == 2
+    assert {ticket["id"] for ticket in db.open_tickets()} == {2} and db.queue_depth() == 1
+
+    archive = TicketArchive()
+    assert asyncio.run(db.archive_closed(archive, datetime.now() + timedelta(seconds=1))) == 2
+    assert sorted(db.data["tickets"]) == ["2"] and db.current_ticket(600) is None
+    assert [ticket["id"] for ticket in archive.iter_tickets()] == [1, 3]
+    assert [ticket["id"] for ticket in archive.iter_tickets(500)] == [1]
+    # Повторный перенос тех же обращений перезаписывает сегмент
+    archive.write(list(archive.iter_tickets()))
+    assert len(archive.segments) == 1 and archive.segments[0]["users"] == ["500", "600"]
+    assert support.SupportDB("support_db.json").data["ticket_seq"] == 3
+
+
+def test_users_list_pages_follow_registrations_and_bans(workdir, monkeypatch):
+    from types import SimpleNamespace
+    import support
+    db = support.SupportDB("support_db.json")
+    monkeypatch.setattr(support, "db", db)
+    for uid in range(1000, 1000 + 2 * support.USERS_PAGE_SIZE + 5):
+        db.register_user(SimpleNamespace(id=uid, username="u" * 32))
+    db.add_agent(42)
+
+    text, pages = db.users_pages.get(0, support.render_users_page)
+    assert pages == 3 and text.count("<code>") == support.USERS_PAGE_SIZE and len(text) <= 4096
+    last, _ = db.users_pages.get(2, support.render_users_page)
+    assert last.count("<code>") == 5 and "<code>1044</code>" in last and "BANNED" not in last
+    assert [button.callback_data for button in support.get_users_page_kb(1, pages).inline_keyboard[0]] == \
+           ["adm_users_page_0", "adm_users_page_2"]
+    assert support.get_users_page_kb(0, 1) is None
+
+    # Страницы из кэша сбрасываются баном и новой регистрацией
+    db.ban(1044, "спам", 42)
+    assert "BANNED" in db.users_pages.get(2, support.render_users_page)[0]
+    db.register_user(SimpleNamespace(id=5, username="new"))
+    assert "<code>5</code>" in db.users_pages.get(2, support.render_users_page)[0]
+
+
+def test_new_tickets_go_to_the_least_loaded_online_agent(workdir, monkeypatch):
+    import time
+    import support
+    db = support.SupportDB("support_db.json")
+    monkeypatch.setattr(support, "db", db)
+    monkeypatch.setattr(support, "agents_seen", {})
+    for agent_id in (41, 42, 43):
+        db.add_agent(agent_id)
+    assert support.pick_agent() is None
+
+    support.mark_agent_seen(41)
+    support.mark_agent_seen(42)
+    # Агент, молчавший дольше AGENT_ONLINE_MINUTES, не на связи
+    support.agents_seen["43"] = time.monotonic() - support.AGENT_ONLINE_MINUTES * 60 - 1
+    assert support.online_agents() == [1, 2] and support.pick_agent() == 1
+
+    ticket = db.open_ticket(500, 10, 1, agent_num=support.pick_agent())
+    history = ticket["history"][-1]
+    assert ticket["status"] == "taken" and (history["status"], history["by"], history["auto"]) == ("taken", 1, True)
+    assert db.data["active_chats"]["500"] == {"agent_num": 1} and support.pick_agent() == 2
+    db.open_ticket(600, 11, 2, agent_num=support.pick_agent())
+    db.take_ticket(600, 2)
+    assert db.loads.loads == {1: 1, 2: 1} and support.pick_agent() == 1
+
+    db.close_ticket(600)
+    assert support.pick_agent() == 2 and db.queue_depth() == 0
+    monkeypatch.setattr(support, "AUTO_ASSIGN", False)
+    assert support.pick_agent() is None
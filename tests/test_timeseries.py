@@ -0,0 +1,39 @@
+from datetime import datetime
+import pytest
+from timeseries import TimeSeriesStore
+
+
+def test_query_is_the_same_before_and_after_downsampling(workdir):
+    store = TimeSeriesStore("timeseries.json")
+    start = datetime(2026, 1, 1, 10, 15)
+    store.track("messages", when=start)
+    store.track("messages", count=2, when=start.replace(minute=40))
+    store.track("messages", when=start.replace(hour=11))
+    store.track("bans", when=start)
+    store.track("unknown", when=start)
+
+    queries = [("hour", datetime(2026, 1, 1, 9), datetime(2026, 1, 1, 12)),
+               ("day", datetime(2026, 1, 1), datetime(2026, 1, 2))]
+    before = [store.query("messages", *query) for query in queries]
+    assert before[0] == (["2026-01-01T09", "2026-01-01T10", "2026-01-01T11", "2026-01-01T12"], [0, 3, 1, 0])
+    assert before[1] == (["2026-01-01", "2026-01-02"], [4, 0])
+
+    # Через 3 дня минутные корзины сворачиваются в часовые
+    assert store.downsample(datetime(2026, 1, 4)) == 4
+    assert store.data["minute"]["messages"] == {} and store.data["hour"]["messages"]["2026-01-01T10"] == 3
+    assert [store.query("messages", *query) for query in queries] == before
+    # Свертка сохранена в журнал и видна другому процессу
+    assert TimeSeriesStore("timeseries.json").query("messages", *queries[1]) == before[1]
+
+    # Через 100 дней — в дневные, через три года корзины удаляются
+    store.downsample(datetime(2026, 4, 11))
+    assert store.data["day"]["messages"] == {"2026-01-01": 4} and store.data["day"]["bans"] == {"2026-01-01": 1}
+    assert store.query("messages", *queries[1]) == before[1]
+    store.downsample(datetime(2029, 1, 1))
+    assert store.query("messages", *queries[1]) == (before[1][0], [0, 0])
+
+
+def test_query_limits_points():
+    store = TimeSeriesStore("timeseries.json", journal=False)
+    with pytest.raises(ValueError):
+        store.query("messages", "minute", datetime(2026, 1, 1), datetime(2026, 1, 3))
@@ -0,0 +1,189 @@
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from indexes import StoreIndex
+from journal import write_snapshot
+
+logger = logging.getLogger(__name__)
+
+TICKET_ARCHIVE_DIR = os.environ.get("TICKET_ARCHIVE_DIR", "support_archive")
+# Сколько дней закрытые обращения хранятся в support_db.json; 0 — архивирование выключено
+TICKET_RETENTION_DAYS = int(os.environ.get("TICKET_RETENTION_DAYS", 30))
+MANIFEST_FILE = "manifest.json"
+
+OPEN = "open"
+TAKEN = "taken"
+CLOSED = "closed"
+
+
+def new_ticket(ticket_id, user_id, thread_id, admin_msg_id, agent_num=None):
+    """Новое обращение; с agent_num оно сразу назначено агенту"""
+    now = datetime.now().isoformat()
+    ticket = {"id": ticket_id, "user_id": str(user_id), "thread_id": thread_id, "admin_msg_id": admin_msg_id,
+              "status": OPEN, "opened_at": now, "closed_at": None, "first_response_at": None,
+              "history": [{"status": OPEN, "at": now, "by": None}]}
+    if agent_num is not None:
+        ticket["status"] = TAKEN
+        ticket["history"].append({"status": TAKEN, "at": now, "by": agent_num, "auto": True})
+    return ticket
+
+
+def migrate_tickets(data):
+    """Старый формат (одно обращение на пользователя, ключ — id пользователя) → обращения с номерами.
+
+    Настоящие даты старых обращений неизвестны: отсчет ведется от момента переноса,
+    поэтому закрытые обращения хранятся полный срок TICKET_RETENTION_DAYS.
+    """
+    now = datetime.now().isoformat()
+    tickets = {}
+    for ticket_id, (uid, ticket) in enumerate(data.get("tickets", {}).items(), start=1):
+        status = ticket.get("status", OPEN)
+        tickets[str(ticket_id)] = {"id": ticket_id, "user_id": uid, "thread_id": ticket.get("thread_id"),
+                                   "admin_msg_id": ticket.get("admin_msg_id"), "status": status,
+                                   "opened_at": now, "closed_at": now if status == CLOSED else None,
+                                   # Время первого ответа неизвестно: в метрику такие обращения не попадают
+                                   "first_response_at": now,
+                                   "history": [{"status": status, "at": now, "by": None, "migrated": True}]}
+    data["tickets"] = tickets
+    data["ticket_seq"] = len(tickets)
+
+
+class TicketIndex(StoreIndex):
+    """Индексы data["tickets"]: последнее обращение пользователя, топик → обращение, незакрытые обращения"""
+
+    def __init__(self):
+        self.current = {}
+        self.threads = {}
+        self.open = set()
+        # Пользователь и топик каждого обращения — для удаления из индексов после архивирования
+        self.owners = {}
+
+    def rebuild(self, data):
+        self.current = {}
+        self.threads = {}
+        self.open = set()
+        self.owners = {}
+        for ticket_id, ticket in data["tickets"].items():
+            self._add(ticket_id, ticket)
+
+    def apply(self, record, data):
+        path = record["path"]
+        if path[0] != "tickets":
+            return
+        if len(path) == 1:
+            return self.rebuild(data)
+        ticket = data["tickets"].get(path[1])
+        if ticket is None:
+            self._remove(path[1])
+        else:
+            self._add(path[1], ticket)
+
+    def _add(self, ticket_id, ticket):
+        uid = ticket["user_id"]
+        current = self.current.get(uid)
+        if current is None or int(current) <= int(ticket_id):
+            self.current[uid] = ticket_id
+        if ticket.get("thread_id"):
+            self.threads[ticket["thread_id"]] = ticket_id
+        self.owners[ticket_id] = (uid, ticket.get("thread_id"))
+        if ticket["status"] == CLOSED:
+            self.open.discard(ticket_id)
+        else:
+            self.open.add(ticket_id)
+
+    def _remove(self, ticket_id):
+        uid, thread_id = self.owners.pop(ticket_id, (None, None))
+        if self.current.get(uid) == ticket_id:
+            del self.current[uid]
+        if self.threads.get(thread_id) == ticket_id:
+            del self.threads[thread_id]
+        self.open.discard(ticket_id)
+
+
+class AgentLoadIndex(StoreIndex):
+    """Число обращений в работе у каждого агента (по номеру) из data["active_chats"]"""
+
+    def __init__(self):
+        self.loads = {}
+        self.chats = {}
+
+    def rebuild(self, data):
+        self.loads = {}
+        self.chats = {}
+        for uid, chat in data["active_chats"].items():
+            self._add(uid, chat.get("agent_num"))
+
+    def apply(self, record, data):
+        path = record["path"]
+        if path[0] != "active_chats":
+            return
+        if len(path) != 2:
+            return self.rebuild(data)
+        self._remove(path[1])
+        chat = data["active_chats"].get(path[1])
+        if chat is not None:
+            self._add(path[1], chat.get("agent_num"))
+
+    def _add(self, uid, agent_num):
+        self.chats[uid] = agent_num
+        self.loads[agent_num] = self.loads.get(agent_num, 0) + 1
+
+    def _remove(self, uid):
+        agent_num = self.chats.pop(uid, None)
+        if agent_num is not None:
+            self.loads[agent_num] -= 1
+
+    def least_loaded(self, agent_nums):
+        """Номер агента с наименьшим числом обращений в работе (при равенстве — меньший номер) или None"""
+        return min(agent_nums, key=lambda num: (self.loads.get(num, 0), num), default=None)
+
+
+class TicketArchive:
+    """Закрытые обращения старше TICKET_RETENTION_DAYS.
+
+    Каждый перенос пишет неизменяемый сегмент tickets-<первый id>-<последний id>.jsonl.gz,
+    manifest.json перечисляет сегменты с диапазоном номеров и пользователями.
+    """
+
+    def __init__(self, directory=TICKET_ARCHIVE_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+
+    @property
+    def segments(self):
+        if not os.path.exists(self.manifest_path):
+            return []
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)["segments"]
+
+    def write(self, tickets):
+        """Запись обращений (по возрастанию номера) одним сегментом"""
+        os.makedirs(self.directory, exist_ok=True)
+        first, last = tickets[0]["id"], tickets[-1]["id"]
+        name = f"tickets-{first}-{last}.jsonl.gz"
+        tmp_name = os.path.join(self.directory, name + ".tmp")
+        with gzip.open(tmp_name, 'wt', encoding='utf-8') as f:
+            for ticket in tickets:
+                f.write(json.dumps(ticket, ensure_ascii=False) + "\n")
+        os.replace(tmp_name, os.path.join(self.directory, name))
+
+        # Повторный перенос после сбоя перезаписывает тот же сегмент
+        segments = [s for s in self.segments if s["file"] != name]
+        segments.append({"file": name, "first_id": first, "last_id": last, "count": len(tickets),
+                         "users": sorted({ticket["user_id"] for ticket in tickets})})
+        write_snapshot(self.manifest_path, {"segments": sorted(segments, key=lambda s: s["first_id"])}, indent=None)
+        logger.info(f"В архив перенесено {len(tickets)} закрытых обращений")
+
+    def iter_tickets(self, user_id=None):
+        """Архивные обращения (все или одного пользователя) по возрастанию номера"""
+        uid = None if user_id is None else str(user_id)
+        for segment in self.segments:
+            if uid is not None and uid not in segment["users"]:
+                continue
+            with gzip.open(os.path.join(self.directory, segment["file"]), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    ticket = json.loads(line)
+                    if uid is None or ticket["user_id"] == uid:
+                        yield ticket
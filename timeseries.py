@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from journal import Journal, JournaledStore
+
+logger = logging.getLogger(__name__)
+
+# Общий файл для бота, бота поддержки и веб-админки
+TIMESERIES_FILE = os.environ.get("TIMESERIES_FILE", "timeseries.json")
+
+METRICS = ("messages", "new_users", "vip_purchases", "bans", "unbans", "tickets")
+
+# Ключ корзины — префикс ISO-времени, поэтому более крупная корзина получается обрезкой ключа
+RESOLUTIONS = {
+    "minute": ("%Y-%m-%dT%H:%M", timedelta(minutes=1)),
+    "hour": ("%Y-%m-%dT%H", timedelta(hours=1)),
+    "day": ("%Y-%m-%d", timedelta(days=1))
+}
+# Сколько хранятся корзины разрешения, прежде чем свернуться в следующее
+RETENTION = {
+    "minute": timedelta(days=2),
+    "hour": timedelta(days=90),
+    "day": timedelta(days=730)
+}
+# Ограничение на число точек в одном ответе
+MAX_POINTS = 2000
+
+
+def bucket_key(moment, resolution):
+    return moment.strftime(RESOLUTIONS[resolution][0])
+
+
+class TimeSeriesStore(JournaledStore):
+    """Счетчики событий по минутам, часам и дням.
+
+    Событие увеличивает только минутную корзину (одна запись журнала).
+    downsample() сворачивает минутные корзины старше RETENTION["minute"]
+    в часовые, часовые — в дневные, а дневные старше срока удаляет.
+    query() складывает корзины нужного и более мелких разрешений, так что
+    результат не зависит от того, успела ли пройти свертка.
+    """
+
+    def __init__(self, filename=TIMESERIES_FILE, journal=True, flush_interval=0):
+        self.filename = filename
+        self.journal = Journal(filename) if journal else None
+        self.lock = threading.RLock()
+        self.flush_interval = flush_interval
+        self.reload()
+
+    def load(self):
+        data = {}
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                logger.error(f"Error loading time series: {e}")
+        for resolution in RESOLUTIONS:
+            buckets = data.setdefault(resolution, {})
+            for metric in METRICS:
+                buckets.setdefault(metric, {})
+        return data
+
+    def track(self, metric, count=1, when=None):
+        """Учет count событий metric в минутной корзине момента when"""
+        try:
+            self.increment(["minute", metric, bucket_key(when or datetime.now(), "minute")], by=count)
+            self.save()
+        except Exception as e:
+            # Аналитика не должна ломать обработку сообщений
+            logger.error(f"Ошибка учета события {metric}: {e}")
+
+    def query(self, metric, resolution, since, until=None):
+        """Метки и значения metric по корзинам resolution от since до until включительно (пустые — нули)"""
+        fmt, step = RESOLUTIONS[resolution]
+        until = until or datetime.now()
+        start = datetime.strptime(since.strftime(fmt), fmt)
+        if (until - start) / step > MAX_POINTS:
+            raise ValueError(f"Слишком много точек для разрешения {resolution}")
+
+        low, high = bucket_key(start, resolution), bucket_key(until, resolution)
+        width = len(low)
+        totals = Counter()
+        for level in RESOLUTIONS:
+            if len(bucket_key(start, level)) < width:
+                continue
+            for key, count in self.data[level][metric].items():
+                key = key[:width]
+                if low <= key <= high:
+                    totals[key] += count
+
+        labels = []
+        moment = start
+        while moment <= until:
+            labels.append(bucket_key(moment, resolution))
+            moment += step
+        return labels, [totals.get(label, 0) for label in labels]
+
+    def downsample(self, now=None):
+        """Свертка устаревших корзин в более крупные; возвращает число свернутых корзин"""
+        self.refresh()
+        now = now or datetime.now()
+        levels = list(RESOLUTIONS)
+        folded = 0
+        for level, coarser in zip(levels, levels[1:] + [None]):
+            cutoff = bucket_key(now - RETENTION[level], level)
+            for metric in METRICS:
+                buckets = self.data[level][metric]
+                for key in [key for key in buckets if key < cutoff]:
+                    if coarser:
+                        width = len(bucket_key(now, coarser))
+                        self.increment([coarser, metric, key[:width]], by=buckets[key])
+                    self.delete_value([level, metric, key])
+                    folded += 1
+        if folded:
+            self.save()
+            logger.info(f"Time series: свернуто {folded} корзин")
+        return folded